@@ -1,10 +1,8 @@
 import os
 import logging
 from logging.handlers import RotatingFileHandler
-from flask import Flask, render_template, request, redirect, url_for, send_from_directory, flash, jsonify, make_response
-from weasyprint import HTML, CSS
+from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, abort
 from werkzeug.datastructures import MultiDict
-from werkzeug.utils import secure_filename
 # from xhtml2pdf import pisa  # Comentado temporariamente - instalar: pip install xhtml2pdf
 from flask_login import LoginManager, login_required, current_user
 from auth import auth_bp, get_user_by_id
@@ -13,7 +11,19 @@ from admin import admin_bp
 from db import init_app as init_db
 from models import db, Relatorio, Referencia, Prova, Foto
 from config import Config
-from utils import save_file
+from utils import LoteUploads
+from status_sync import registrar_eventos_status
+from upload_store import registrar_eventos_arquivos, RequestUploads, enviar_upload
+from image_resize import url_imagem, imagens_cache, enviar_imagem
+from report_tree import carregar_arvore_relatorio, arvore_cache
+from pdf_render import gerar_pdf, nome_download_pdf
+from pdf_cache import pdf_cache, secoes_cache, chave_pdf, enviar_pdf
+from pdf_jobs import pdf_bp, enfileirar_pdf, tarefa_para_dict
+from pdf_batch import pdf_lote_bp
+from upload_sessions import uploads_bp
+from field_updates import edicao_bp
+from report_edit import aplicar_formulario
+from dashboard_stats import listar_relatorios_pagina, normalizar_filtros, estatisticas_cache, TAMANHO_PAGINA
 from error_handlers import register_error_handlers
 from security import init_security, SecurityHeaders
 from sqlalchemy import desc
@@ -22,6 +32,8 @@ from sqlalchemy import desc
 logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
+# Arquivos de formulários gravados direto no armazenamento durante o parsing
+app.request_class = RequestUploads
 
 # Carregar configurações do config.py
 app.config.from_object(Config)
@@ -63,6 +75,24 @@ init_db(app)
 # Inicializar segurança
 init_security(app)
 
+# Status atual denormalizado em relatórios/referências (recalculado a cada flush de provas)
+registrar_eventos_status()
+
+# Contagem de referências dos arquivos enviados (armazenamento por conteúdo)
+registrar_eventos_arquivos()
+
+# Miniaturas/versões reduzidas das fotos nos templates (srcset)
+app.add_template_global(url_imagem)
+
+# Cache de estatísticas do dashboard (invalidado a cada commit relevante)
+estatisticas_cache.init_app(app)
+
+# Cache das árvores serializadas de relatórios (indexado por Relatorio.versao)
+arvore_cache.init_app(app)
+pdf_cache.init_app(app)
+secoes_cache.init_app(app)
+imagens_cache.init_app(app)
+
 # Configuração do Flask-Login
 login_manager = LoginManager()
 login_manager.login_view = 'auth.login'
@@ -77,6 +107,10 @@ def load_user(user_id):
 # Registrar Blueprints
 app.register_blueprint(auth_bp)
 app.register_blueprint(admin_bp)
+app.register_blueprint(pdf_bp)
+app.register_blueprint(pdf_lote_bp)
+app.register_blueprint(uploads_bp)
+app.register_blueprint(edicao_bp)
 # app.register_blueprint(audit_bp)  # Desabilitado - AuditLog não existe no banco
 
 # Registrar error handlers
@@ -85,417 +119,136 @@ register_error_handlers(app)
 
 def gerar_e_salvar_pdf(relatorio_id, evento="CRIADO"):
     """
-    Geração de PDF desabilitada temporariamente.
-    Para habilitar: pip install xhtml2pdf e descomentar import acima
+    Enfileira a geração do PDF do relatório (processada por pdf_worker.py)
+
+    Edições seguidas são agrupadas pelo debounce da fila (PDF_DEBOUNCE_SEGUNDOS).
+    Falhas no enfileiramento não interrompem o fluxo da requisição.
     """
-    print(f"PDF não gerado (xhtml2pdf não instalado) para relatório ID: {relatorio_id} (Evento: {evento})")
-    return True  # Retornar True para não quebrar o fluxo
-
-    # CÓDIGO COMENTADO - Descomente após instalar xhtml2pdf
-    # print(f"Iniciando geração de PDF para o relatório ID: {relatorio_id} (Evento: {evento})")
-    #
-    # relatorio = Relatorio.query.get(relatorio_id)
-    # if not relatorio:
-    #     print(f"!!! ERRO: Relatório com ID {relatorio_id} não encontrado para gerar PDF.")
-    #     return False
-    #
-    # # Preparar dados para o template (mantendo estrutura compatível)
-    # referencias_completas = []
-    # for ref in relatorio.referencias:
-    #     ref_dict = {c.name: getattr(ref, c.name) for c in ref.__table__.columns}
-    #
-    #     provas_completas = []
-    #     for prova in ref.provas:
-    #         prova_dict = {c.name: getattr(prova, c.name) for c in prova.__table__.columns}
-    #
-    #         prova_dict['fotos'] = {}
-    #         for foto in prova.fotos:
-    #             contexto = foto.contexto
-    #             if contexto not in prova_dict['fotos']:
-    #                 prova_dict['fotos'][contexto] = []
-    #             prova_dict['fotos'][contexto].append({c.name: getattr(foto, c.name) for c in foto.__table__.columns})
-    #
-    #         provas_completas.append(prova_dict)
-    #
-    #     ref_dict['provas'] = provas_completas
-    #     referencias_completas.append(ref_dict)
-    #
-    # assunto_email = f"RELATÓRIO DE PROVA PEÇA PILOTO {evento}! {relatorio.descricao_geral} COLEÇÃO {relatorio.colecao}"
-    # nome_ficheiro_pdf = f"{secure_filename(assunto_email)}.pdf"
-    # caminho_ficheiro_pdf = os.path.join(app.config['PDF_FOLDER'], nome_ficheiro_pdf)
-    #
-    # html_renderizado = render_template('relatorio_pdf.html',
-    #                                    relatorio=relatorio,
-    #                                    referencias=referencias_completas)
-    #
-    # def link_callback(uri, rel):
-    #     if uri.startswith(url_for('serve_upload', filename='')):
-    #         path_relativo = uri[len(url_for('serve_upload', filename='')):]
-    #         caminho_final = os.path.join(app.config['UPLOAD_FOLDER'], path_relativo)
-    #         return caminho_final
-    #     return uri
-    #
-    # try:
-    #     with open(caminho_ficheiro_pdf, "w+b") as pdf_file:
-    #         pisa_status = pisa.CreatePDF(
-    #             html_renderizado.encode('utf-8'),
-    #             dest=pdf_file,
-    #             encoding='utf-8',
-    #             link_callback=link_callback
-    #         )
-    #
-    #     if not pisa_status.err:
-    #         print(f"\n--- PDF Gerado: {caminho_ficheiro_pdf} ---\n")
-    #         return True
-    #     else:
-    #         print(f"!!! ERRO AO GERAR PDF: {pisa_status.err}")
-    #         return False
-    # except Exception as e:
-    #     print(f"!!! EXCEÇÃO AO GERAR PDF: {e}")
-    #     return False
+    if not app.config['PDF_ASSINCRONO']:
+        return True
+
+    try:
+        enfileirar_pdf(relatorio_id, evento=evento)
+        return True
+    except Exception as e:
+        db.session.rollback()
+        app.logger.error(f"Erro ao enfileirar PDF do relatório {relatorio_id}: {e}")
+        return False
 
 @app.route('/')
 @login_required
 def dashboard():
-    # Obter relatórios
-    relatorios = Relatorio.query.order_by(desc(Relatorio.created_at)).all()
-    relatorios_com_status = []
-
-    for relatorio in relatorios:
-        relatorio_dict = {c.name: getattr(relatorio, c.name) for c in relatorio.__table__.columns}
-
-        # Obter última prova de qualquer referência deste relatório
-        ultima_prova = Prova.query.join(Referencia).filter(Referencia.relatorio_id == relatorio.id).order_by(desc(Prova.numero_prova)).first()
-
-        relatorio_dict['status_atual'] = ultima_prova.status if ultima_prova else 'Novo'
-        relatorios_com_status.append(relatorio_dict)
-
-    # ESTATÍSTICAS E INSIGHTS
-    total_relatorios = Relatorio.query.count()
-    total_referencias = Referencia.query.count()
-    total_provas = Prova.query.count()
-
-    # Provas por status
-    provas_aprovadas = Prova.query.filter_by(status='Aprovada').count()
-    provas_reprovadas = Prova.query.filter_by(status='Reprovada').count()
-    provas_em_andamento = Prova.query.filter_by(status='Em Andamento').count()
-    provas_comite = Prova.query.filter_by(status='Comitê').count()
-
-    # Taxa de aprovação
-    taxa_aprovacao = round((provas_aprovadas / total_provas * 100) if total_provas > 0 else 0, 1)
-
-    # Referências por categoria
-    refs_por_categoria = db.session.query(
-        Referencia.tipo_categoria,
-        db.func.count(Referencia.id)
-    ).group_by(Referencia.tipo_categoria).all()
-
-    categorias_stats = {cat: count for cat, count in refs_por_categoria}
-
-    # Relatórios recentes (últimos 30 dias)
-    from datetime import datetime, timedelta
-    trinta_dias_atras = datetime.utcnow() - timedelta(days=30)
-    relatorios_recentes = Relatorio.query.filter(Relatorio.created_at >= trinta_dias_atras).count()
-
-    # Provas com retrabalho (número da prova > 1)
-    provas_retrabalho = Prova.query.filter(Prova.numero_prova > 1).count()
-    taxa_retrabalho = round((provas_retrabalho / total_provas * 100) if total_provas > 0 else 0, 1)
-
-    # Insights
-    insights = []
-
-    if taxa_aprovacao >= 80:
-        insights.append({
-            'tipo': 'success',
-            'icone': 'bi-trophy',
-            'titulo': 'Excelente Performance!',
-            'mensagem': f'Taxa de aprovação de {taxa_aprovacao}% - acima da meta de 80%'
-        })
-    elif taxa_aprovacao >= 60:
-        insights.append({
-            'tipo': 'warning',
-            'icone': 'bi-exclamation-triangle',
-            'titulo': 'Performance Moderada',
-            'mensagem': f'Taxa de aprovação de {taxa_aprovacao}% - pode melhorar'
-        })
-    else:
-        insights.append({
-            'tipo': 'danger',
-            'icone': 'bi-exclamation-circle',
-            'titulo': 'Atenção Necessária',
-            'mensagem': f'Taxa de aprovação baixa: {taxa_aprovacao}% - revisar processos'
-        })
-
-    if taxa_retrabalho > 30:
-        insights.append({
-            'tipo': 'warning',
-            'icone': 'bi-arrow-repeat',
-            'titulo': 'Alto Retrabalho',
-            'mensagem': f'{taxa_retrabalho}% das provas precisaram de retrabalho'
-        })
-
-    if relatorios_recentes > 5:
-        insights.append({
-            'tipo': 'info',
-            'icone': 'bi-calendar-check',
-            'titulo': 'Alta Produtividade',
-            'mensagem': f'{relatorios_recentes} relatórios criados nos últimos 30 dias'
-        })
-
-    if provas_em_andamento > 10:
-        insights.append({
-            'tipo': 'info',
-            'icone': 'bi-hourglass-split',
-            'titulo': 'Provas Pendentes',
-            'mensagem': f'{provas_em_andamento} provas aguardando finalização'
-        })
-
-    stats = {
-        'total_relatorios': total_relatorios,
-        'total_referencias': total_referencias,
-        'total_provas': total_provas,
-        'provas_aprovadas': provas_aprovadas,
-        'provas_reprovadas': provas_reprovadas,
-        'provas_em_andamento': provas_em_andamento,
-        'provas_comite': provas_comite,
-        'taxa_aprovacao': taxa_aprovacao,
-        'taxa_retrabalho': taxa_retrabalho,
-        'categorias': categorias_stats,
-        'relatorios_recentes': relatorios_recentes,
-        'insights': insights
-    }
-
-    return render_template('dashboard.html', relatorios=relatorios_com_status, stats=stats)
+    # Primeira página de relatórios (paginação keyset + filtros na query string)
+    filtros = normalizar_filtros(request.args)
+    try:
+        relatorios_com_status, proximo_cursor = listar_relatorios_pagina(filtros, request.args.get('cursor'))
+    except ValueError:
+        abort(400)
+
+    # Estatísticas em cache; recalculadas apenas após escrita em relatórios/referências/provas
+    stats = estatisticas_cache.obter()
+
+    return render_template('dashboard.html', relatorios=relatorios_com_status, stats=stats,
+                           filtros=filtros, proximo_cursor=proximo_cursor)
+
+@app.route('/api/relatorios')
+@login_required
+def api_relatorios():
+    """Página de relatórios em JSON (infinite scroll do dashboard)"""
+    filtros = normalizar_filtros(request.args)
+    try:
+        limite = int(request.args.get('limite', TAMANHO_PAGINA))
+        relatorios, proximo_cursor = listar_relatorios_pagina(filtros, request.args.get('cursor'), limite)
+    except ValueError:
+        return jsonify(error="Parâmetros de paginação inválidos"), 400
+
+    return jsonify(
+        relatorios=[
+            {**relatorio, 'created_at': relatorio['created_at'].isoformat() if relatorio['created_at'] else None,
+             'updated_at': relatorio['updated_at'].isoformat() if relatorio['updated_at'] else None}
+            for relatorio in relatorios
+        ],
+        html=render_template('partials/relatorio_cards.html', relatorios=relatorios),
+        proximo_cursor=proximo_cursor
+    )
 
 @app.route('/uploads/<path:filename>')
 @login_required
 def serve_upload(filename):
-    return send_from_directory(app.config['UPLOAD_FOLDER'], filename)
+    """Arquivo enviado (via Nginx com UPLOAD_X_ACCEL_REDIRECT; ETag e cache imutável)"""
+    return enviar_upload(filename)
+
+@app.route('/uploads/imagem/<int:largura>/<path:filename>')
+@login_required
+def serve_imagem(largura, filename):
+    """Foto redimensionada sob demanda (larguras de image_resize.LARGURAS; WebP ou JPEG pelo Accept)"""
+    return enviar_imagem(filename, largura)
 
 @app.route('/relatorio/<int:id>')
 @login_required
 def detalhes_relatorio(id):
-    relatorio = Relatorio.query.get_or_404(id)
-    
-    # Preparar estrutura para template
-    referencias_completas = []
-    for ref in relatorio.referencias:
-        ref_dict = {c.name: getattr(ref, c.name) for c in ref.__table__.columns}
-        
-        provas_completas = []
-        # Ordenar provas por número
-        provas_ordenadas = sorted(ref.provas, key=lambda x: x.numero_prova)
-        
-        for prova in provas_ordenadas:
-            prova_dict = {c.name: getattr(prova, c.name) for c in prova.__table__.columns}
-            
-            prova_dict['fotos'] = {}
-            for foto in prova.fotos:
-                contexto = foto.contexto
-                if contexto not in prova_dict['fotos']:
-                    prova_dict['fotos'][contexto] = []
-                prova_dict['fotos'][contexto].append({c.name: getattr(foto, c.name) for c in foto.__table__.columns})
-            
-            provas_completas.append(prova_dict)
-        
-        ref_dict['provas'] = provas_completas
-        referencias_completas.append(ref_dict)
+    # Árvore completa (referências -> provas -> fotos) em número constante de queries
+    relatorio, referencias_completas = carregar_arvore_relatorio(id)
 
     return render_template('detalhes_relatorio.html', relatorio=relatorio, referencias=referencias_completas)
 
 @app.route('/relatorio/<int:id>/pdf')
 @login_required
 def relatorio_pdf(id):
-    """Gera e retorna o PDF do relatório"""
-    relatorio = Relatorio.query.get_or_404(id)
-
-    # Preparar dados para o template (mesma estrutura do detalhes_relatorio)
-    referencias_completas = []
-    for ref in relatorio.referencias:
-        ref_dict = {c.name: getattr(ref, c.name) for c in ref.__table__.columns}
-
-        provas_completas = []
-        provas_ordenadas = sorted(ref.provas, key=lambda x: x.numero_prova)
-
-        for prova in provas_ordenadas:
-            prova_dict = {c.name: getattr(prova, c.name) for c in prova.__table__.columns}
-
-            prova_dict['fotos'] = {}
-            for foto in prova.fotos:
-                contexto = foto.contexto
-                if contexto not in prova_dict['fotos']:
-                    prova_dict['fotos'][contexto] = []
-                # Adicionar caminho absoluto para WeasyPrint
-                foto_dict = {c.name: getattr(foto, c.name) for c in foto.__table__.columns}
-                foto_dict['caminho_absoluto'] = os.path.join(app.config['UPLOAD_FOLDER'], foto.file_path)
-                prova_dict['fotos'][contexto].append(foto_dict)
-
-            provas_completas.append(prova_dict)
-
-        ref_dict['provas'] = provas_completas
-        referencias_completas.append(ref_dict)
-
-    # Renderizar o HTML do PDF
-    from datetime import datetime
-    html_string = render_template('relatorio_pdf.html',
-                                   relatorio=relatorio,
-                                   referencias=referencias_completas,
-                                   now=datetime.now)
+    """Retorna o PDF do relatório (cache por conteúdo; ETag/If-None-Match)"""
+    relatorio, referencias = carregar_arvore_relatorio(id)
 
-    # Gerar PDF usando WeasyPrint com base_url do diretório de uploads
-    pdf = HTML(string=html_string, base_url=request.url_root).write_pdf()
+    # PDF com o conteúdo atual já gerado: servir direto do disco
+    arquivo = pdf_cache.obter(chave_pdf(relatorio, referencias))
+    if arquivo:
+        return enviar_pdf(arquivo, nome_download_pdf(relatorio))
 
-    # Criar resposta
-    response = make_response(pdf)
-    response.headers['Content-Type'] = 'application/pdf'
-    response.headers['Content-Disposition'] = f'inline; filename=relatorio_{relatorio.id}_{secure_filename(relatorio.descricao_geral)}.pdf'
+    if not app.config['PDF_ASSINCRONO']:
+        relatorio, arquivo, _ = gerar_pdf(id)
+        return enviar_pdf(arquivo, nome_download_pdf(relatorio))
 
-    return response
+    # Caso contrário, pedir geração imediata e aguardar o worker
+    tarefa = enfileirar_pdf(id, evento='MANUAL', atraso=0)
+    if request.accept_mimetypes.accept_json and not request.accept_mimetypes.accept_html:
+        return jsonify(tarefa_para_dict(tarefa)), 202
+    return render_template('pdf_aguardando.html', relatorio=relatorio, tarefa=tarefa_para_dict(tarefa)), 202
 
 @app.route('/relatorio/<int:id>/editar', methods=['GET', 'POST'])
 @login_required
 def editar_relatorio(id):
-    relatorio = Relatorio.query.get_or_404(id)
-    
     if request.method == 'POST':
-        try:
-            # 1. Atualiza as informações gerais do relatório
-            relatorio.colecao = request.form.get('colecao')
-            relatorio.descricao_geral = request.form.get('descricao_geral')
-
-            # Atualiza PPT se um novo arquivo foi enviado
-            ppt_file = request.files.get('ppt')
-            if ppt_file and ppt_file.filename:
-                # Excluir PPT antigo se existir
-                if relatorio.ppt_path:
-                    from utils import delete_file
-                    delete_file(relatorio.ppt_path)
-                # Salvar novo PPT
-                ppt_filename = save_file(ppt_file)
-                if ppt_filename:
-                    relatorio.ppt_path = ppt_filename
-            
-            # 2. Itera sobre todos os tipos possíveis
-            for tipo in ['baby', 'kids', 'teen', 'adulto']:
-                ref_numero = request.form.get(f'ref_{tipo}')
-                if not ref_numero:
-                    continue
-
-                # Verifica se já existe uma referência deste tipo
-                ref_existente = Referencia.query.filter_by(relatorio_id=id, tipo_categoria=tipo).first()
-
-                if ref_existente:
-                    # --- ATUALIZAÇÃO ---
-                    ref_existente.numero_ref = ref_numero
-                    # Atualiza dados da referência (busca por ID específico ou por tipo)
-                    ref_existente.origem = request.form.get(f'origem_ref_{ref_existente.id}') or request.form.get(f'origem_{tipo}')
-                    ref_existente.fornecedor = request.form.get(f'fornecedor_ref_{ref_existente.id}') or request.form.get(f'fornecedor_{tipo}')
-                    ref_existente.materia_prima = request.form.get(f'materia_prima_ref_{ref_existente.id}') or request.form.get(f'materia_prima_{tipo}')
-                    ref_existente.composicao = request.form.get(f'composicao_ref_{ref_existente.id}') or request.form.get(f'composicao_{tipo}')
-                    ref_existente.gramatura = request.form.get(f'gramatura_ref_{ref_existente.id}') or request.form.get(f'gramatura_{tipo}')
-                    ref_existente.aviamentos = request.form.get(f'aviamentos_ref_{ref_existente.id}') or request.form.get(f'aviamentos_{tipo}')
-                    
-                    # Atualiza provas existentes
-                    provas_existentes_ids = request.form.getlist(f'prova_id_{tipo}')
-                    for prova_id in provas_existentes_ids:
-                        prova = Prova.query.get(prova_id)
-                        if prova:
-                            prova.data_recebimento = request.form.get(f'data_recebimento_{prova_id}')
-                            prova.tamanhos_recebidos = ", ".join(request.form.getlist(f'tamanhos_recebidos_{prova_id}'))
-                            prova.info_medidas = request.form.get(f'info_medidas_{prova_id}')
-                            prova.data_prova = request.form.get(f'data_prova_{prova_id}')
-                            prova.time_qualidade = request.form.get(f'time_qualidade_{prova_id}')
-                            prova.comentarios_qualidade = request.form.get(f'comentarios_qualidade_{prova_id}')
-                            prova.obs_qualidade = request.form.get(f'obs_qualidade_{prova_id}')
-                            prova.time_estilo = request.form.get(f'time_estilo_{prova_id}')
-                            prova.comentarios_estilo = request.form.get(f'comentarios_estilo_{prova_id}')
-                            prova.obs_estilo = request.form.get(f'obs_estilo_{prova_id}')
-                            prova.time_modelagem = request.form.get(f'time_modelagem_{prova_id}')
-                            prova.comentarios_modelagem = request.form.get(f'comentarios_modelagem_{prova_id}')
-                            prova.obs_modelagem = request.form.get(f'obs_modelagem_{prova_id}')
-                            prova.data_lacre = request.form.get(f'data_lacre_{prova_id}')
-                            prova.numero_lacre = request.form.get(f'numero_lacre_{prova_id}')
-                            prova.info_adicionais = request.form.get(f'info_adicionais_{prova_id}')
-                            
-                            # Adicionar fotos
-                            campos_fotos = ['desenho', 'qualidade', 'estilo', 'modelagem']
-                            for contexto in campos_fotos:
-                                for file in request.files.getlist(f'fotos_{contexto}_{prova_id}'):
-                                    filename = save_file(file)
-                                    if filename:
-                                        foto = Foto(prova_id=prova.id, contexto=contexto, file_path=filename)
-                                        db.session.add(foto)
-                            
-                            for tamanho in request.form.getlist(f'tamanhos_recebidos_{prova_id}'):
-                                for contexto in ['amostra', 'prova_modelo']:
-                                    for file in request.files.getlist(f'fotos_{contexto}_{prova_id}_{tamanho.replace(" ", "")}'):
-                                        filename = save_file(file)
-                                        if filename:
-                                            foto = Foto(prova_id=prova.id, contexto=contexto, tamanho=tamanho, file_path=filename)
-                                            db.session.add(foto)
-
-                else:
-                    # --- CRIAÇÃO ---
-                    nova_ref = Referencia(
-                        relatorio_id=id,
-                        tipo_categoria=tipo,
-                        numero_ref=ref_numero,
-                        origem=request.form.get(f'origem_{tipo}'),
-                        fornecedor=request.form.get(f'fornecedor_{tipo}'),
-                        materia_prima=request.form.get(f'materia_prima_{tipo}'),
-                        composicao=request.form.get(f'composicao_{tipo}'),
-                        gramatura=request.form.get(f'gramatura_{tipo}'),
-                        aviamentos=request.form.get(f'aviamentos_{tipo}')
-                    )
-                    db.session.add(nova_ref)
-                    db.session.flush() # Para obter o ID
+        relatorio = Relatorio.query.get_or_404(id)
 
-                    tabela_medidas_filename = save_file(request.files.get(f'tabela_medidas_{tipo}'))
-
-                    nova_prova = Prova(
-                        referencia_id=nova_ref.id,
-                        numero_prova=1,
-                        tabela_medidas_path=tabela_medidas_filename,
-                        data_recebimento=request.form.get(f'data_recebimento_{tipo}'),
-                        tamanhos_recebidos=", ".join(request.form.getlist(f'tamanhos_recebidos_{tipo}')),
-                        info_medidas=request.form.get(f'info_medidas_{tipo}'),
-                        data_prova=request.form.get(f'data_prova_{tipo}'),
-                        time_qualidade=request.form.get(f'time_qualidade_{tipo}'),
-                        comentarios_qualidade=request.form.get(f'comentarios_qualidade_{tipo}'),
-                        obs_qualidade=request.form.get(f'obs_qualidade_{tipo}'),
-                        time_estilo=request.form.get(f'time_estilo_{tipo}'),
-                        comentarios_estilo=request.form.get(f'comentarios_estilo_{tipo}'),
-                        obs_estilo=request.form.get(f'obs_estilo_{tipo}'),
-                        time_modelagem=request.form.get(f'time_modelagem_{tipo}'),
-                        comentarios_modelagem=request.form.get(f'comentarios_modelagem_{tipo}'),
-                        obs_modelagem=request.form.get(f'obs_modelagem_{tipo}'),
-                        data_lacre=request.form.get(f'data_lacre_{tipo}'),
-                        numero_lacre=request.form.get(f'numero_lacre_{tipo}'),
-                        info_adicionais=request.form.get(f'info_adicionais_{tipo}')
-                    )
-                    db.session.add(nova_prova)
-                    db.session.flush()
-                    
-                    campos_fotos = ['desenho', 'qualidade', 'estilo', 'modelagem']
-                    for contexto in campos_fotos:
-                        for file in request.files.getlist(f'fotos_{contexto}_{tipo}'):
-                            filename = save_file(file)
-                            if filename:
-                                foto = Foto(prova_id=nova_prova.id, contexto=contexto, file_path=filename)
-                                db.session.add(foto)
-
-                    for tamanho in request.form.getlist(f'tamanhos_recebidos_{tipo}'):
-                        for contexto in ['amostra', 'prova_modelo']:
-                            for file in request.files.getlist(f'fotos_{contexto}_{tipo}_{tamanho.replace(" ", "")}'):
-                                filename = save_file(file)
-                                if filename:
-                                    foto = Foto(prova_id=nova_prova.id, contexto=contexto, tamanho=tamanho, file_path=filename)
-                                    db.session.add(foto)
+        try:
+            # Arquivos do formulário processados em paralelo (aplicados antes do commit)
+            lote = LoteUploads()
+
+            # PPT substituído é excluído após o commit, se não for mais usado
+            ppt_anterior = relatorio.ppt_path
+            alterado, conflitos = aplicar_formulario(relatorio, request.form, request.files, lote)
+            for conflito in conflitos:
+                flash(f"{conflito} foi alterada por outra pessoa enquanto você editava; "
+                      "suas mudanças nela não foram salvas. Confira os valores atuais.", "warning")
+            # Com conflito, volta à edição para mostrar os valores atuais
+            destino = url_for('editar_relatorio', id=id) if conflitos else url_for('detalhes_relatorio', id=id)
+
+            uploads_enviados = len(lote)
+            if lote.concluir():
+                alterado = True
+            if not alterado:
+                # Formulário reenviado sem mudanças: nenhuma escrita, nem novo PDF.
+                # Uploads que falharam já foram informados por concluir()
+                if not uploads_enviados and not conflitos:
+                    flash("Nenhuma alteração para salvar.", "info")
+                return redirect(destino)
 
             db.session.commit()
+            if ppt_anterior and relatorio.ppt_path != ppt_anterior:
+                from utils import delete_file
+                delete_file(ppt_anterior)
             flash("Relatório atualizado com sucesso!", "success")
             gerar_e_salvar_pdf(id, evento="ATUALIZADO")
-            return redirect(url_for('detalhes_relatorio', id=id))
+            return redirect(destino)
 
         except Exception as e:
             db.session.rollback()
@@ -503,26 +256,8 @@ def editar_relatorio(id):
             return redirect(url_for('editar_relatorio', id=id))
     
     # GET
-    referencias_por_tipo = {}
-    for ref in relatorio.referencias:
-        ref_dict = {c.name: getattr(ref, c.name) for c in ref.__table__.columns}
-        
-        provas_completas = []
-        provas_ordenadas = sorted(ref.provas, key=lambda x: x.numero_prova)
-        for prova in provas_ordenadas:
-            prova_dict = {c.name: getattr(prova, c.name) for c in prova.__table__.columns}
-            prova_dict['tamanhos_lista'] = [t.strip() for t in (prova.tamanhos_recebidos or '').split(',') if t.strip()]
-            
-            prova_dict['fotos'] = {}
-            for foto in prova.fotos:
-                contexto = foto.contexto
-                if contexto not in prova_dict['fotos']:
-                    prova_dict['fotos'][contexto] = []
-                prova_dict['fotos'][contexto].append({c.name: getattr(foto, c.name) for c in foto.__table__.columns})
-            provas_completas.append(prova_dict)
-        
-        ref_dict['provas'] = provas_completas
-        referencias_por_tipo[ref.tipo_categoria] = ref_dict
+    relatorio, referencias_completas = carregar_arvore_relatorio(id)
+    referencias_por_tipo = {ref['tipo_categoria']: ref for ref in referencias_completas}
 
     return render_template('editar_relatorio.html', relatorio=relatorio, referencias_por_tipo=referencias_por_tipo)
 
@@ -560,14 +295,16 @@ def atualizar_status():
 def novo_relatorio():
     if request.method == 'POST':
         try:
-            ppt_filename = save_file(request.files.get('ppt'))
+            # Arquivos do formulário processados em paralelo (aplicados antes do commit)
+            lote = LoteUploads()
             
             novo_relatorio = Relatorio(
                 descricao_geral=request.form.get('descricao_geral'),
-                colecao=request.form.get('colecao'),
-                ppt_path=ppt_filename
+                colecao=request.form.get('colecao')
             )
             db.session.add(novo_relatorio)
+            lote.adicionar(request.files.get('ppt'), novo_relatorio, 'ppt_path')
+            lote.adicionar_sessao(request.form.get('ppt_upload_id'), novo_relatorio, 'ppt_path')
             db.session.flush()
             
             for tipo in ['baby', 'kids', 'teen', 'adulto']:
@@ -586,12 +323,9 @@ def novo_relatorio():
                     db.session.add(nova_ref)
                     db.session.flush()
 
-                    tabela_medidas_filename = save_file(request.files.get(f'tabela_medidas_{tipo}'))
-
                     nova_prova = Prova(
                         referencia_id=nova_ref.id,
                         numero_prova=1,
-                        tabela_medidas_path=tabela_medidas_filename,
                         data_recebimento=request.form.get(f'data_recebimento_{tipo}'),
                         tamanhos_recebidos=", ".join(request.form.getlist(f'tamanhos_recebidos_{tipo}')),
                         info_medidas=request.form.get(f'info_medidas_{tipo}'),
@@ -610,24 +344,21 @@ def novo_relatorio():
                         info_adicionais=request.form.get(f'info_adicionais_{tipo}')
                     )
                     db.session.add(nova_prova)
+                    lote.adicionar(request.files.get(f'tabela_medidas_{tipo}'), nova_prova, 'tabela_medidas_path')
+                    lote.adicionar_sessao(request.form.get(f'tabela_medidas_{tipo}_upload_id'), nova_prova, 'tabela_medidas_path')
                     db.session.flush()
                     
                     campos_fotos = ['desenho', 'qualidade', 'estilo', 'modelagem']
                     for contexto in campos_fotos:
                         for file in request.files.getlist(f'fotos_{contexto}_{tipo}'):
-                            filename = save_file(file)
-                            if filename:
-                                foto = Foto(prova_id=nova_prova.id, contexto=contexto, file_path=filename)
-                                db.session.add(foto)
+                            lote.adicionar(file, Foto(prova_id=nova_prova.id, contexto=contexto), 'file_path')
 
                     for tamanho in request.form.getlist(f'tamanhos_recebidos_{tipo}'):
                         for contexto in ['amostra', 'prova_modelo']:
                             for file in request.files.getlist(f'fotos_{contexto}_{tipo}_{tamanho.replace(" ", "")}'):
-                                filename = save_file(file)
-                                if filename:
-                                    foto = Foto(prova_id=nova_prova.id, contexto=contexto, tamanho=tamanho, file_path=filename)
-                                    db.session.add(foto)
+                                lote.adicionar(file, Foto(prova_id=nova_prova.id, contexto=contexto, tamanho=tamanho), 'file_path')
             
+            lote.concluir()
             db.session.commit()
             flash("Relatório criado com sucesso!", "success")
             
@@ -694,15 +425,14 @@ def adicionar_nova_prova(referencia_id):
 
     if request.method == 'POST':
         try:
+            # Arquivos do formulário processados em paralelo (aplicados antes do commit)
+            lote = LoteUploads()
             novo_numero_prova = request.form.get('numero_prova')
             tipo = referencia.tipo_categoria
 
-            tabela_medidas_filename = save_file(request.files.get(f'tabela_medidas_{tipo}'))
-
             nova_prova = Prova(
                 referencia_id=referencia.id,
                 numero_prova=novo_numero_prova,
-                tabela_medidas_path=tabela_medidas_filename,
                 data_recebimento=request.form.get(f'data_recebimento_{tipo}'),
                 tamanhos_recebidos=", ".join(request.form.getlist(f'tamanhos_recebidos_{tipo}')),
                 info_medidas=request.form.get(f'info_medidas_{tipo}'),
@@ -721,24 +451,21 @@ def adicionar_nova_prova(referencia_id):
                 info_adicionais=request.form.get(f'info_adicionais_{tipo}')
             )
             db.session.add(nova_prova)
+            lote.adicionar(request.files.get(f'tabela_medidas_{tipo}'), nova_prova, 'tabela_medidas_path')
+            lote.adicionar_sessao(request.form.get(f'tabela_medidas_{tipo}_upload_id'), nova_prova, 'tabela_medidas_path')
             db.session.flush()
             
             campos_fotos = ['desenho', 'qualidade', 'estilo', 'modelagem']
             for contexto in campos_fotos:
                 for file in request.files.getlist(f'fotos_{contexto}_{tipo}'):
-                    filename = save_file(file)
-                    if filename:
-                        foto = Foto(prova_id=nova_prova.id, contexto=contexto, file_path=filename)
-                        db.session.add(foto)
+                    lote.adicionar(file, Foto(prova_id=nova_prova.id, contexto=contexto), 'file_path')
 
             for tamanho in request.form.getlist(f'tamanhos_recebidos_{tipo}'):
                 for contexto in ['amostra', 'prova_modelo']:
                     for file in request.files.getlist(f'fotos_{contexto}_{tipo}_{tamanho.replace(" ", "")}'):
-                        filename = save_file(file)
-                        if filename:
-                            foto = Foto(prova_id=nova_prova.id, contexto=contexto, tamanho=tamanho, file_path=filename)
-                            db.session.add(foto)
+                        lote.adicionar(file, Foto(prova_id=nova_prova.id, contexto=contexto, tamanho=tamanho), 'file_path')
             
+            lote.concluir()
             db.session.commit()
             flash(f"{novo_numero_prova}ª prova adicionada com sucesso!", "success")
 
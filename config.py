@@ -32,7 +32,35 @@ class Config:
     # Upload
     UPLOAD_FOLDER = os.path.join(os.getcwd(), 'uploads')
     PDF_FOLDER = os.path.join(os.getcwd(), 'relatorios_pdf')
+    CACHE_FOLDER = os.path.join(os.getcwd(), 'cache')
     MAX_CONTENT_LENGTH = int(os.getenv('MAX_CONTENT_LENGTH', 16 * 1024 * 1024))  # 16MB default
+    UPLOAD_CARENCIA_SEGUNDOS = int(os.getenv('UPLOAD_CARENCIA_SEGUNDOS', 3600))  # Arquivos recentes nunca são removidos
+    UPLOAD_THREADS = int(os.getenv('UPLOAD_THREADS', 8))  # Arquivos de um formulário processados em paralelo
+    UPLOAD_MAX_MB = int(os.getenv('UPLOAD_MAX_MB', 16))  # Limite de cada arquivo, aplicado durante o recebimento
+    UPLOAD_SESSAO_HORAS = int(os.getenv('UPLOAD_SESSAO_HORAS', 24))  # Validade das sessões de upload em partes (/api/uploads)
+    UPLOAD_X_ACCEL_REDIRECT = os.getenv('UPLOAD_X_ACCEL_REDIRECT', 'False').lower() == 'true'  # Nginx envia os uploads (X-Accel-Redirect)
+    UPLOAD_X_ACCEL_PREFIX = os.getenv('UPLOAD_X_ACCEL_PREFIX', '/uploads_protegidos/')  # Location internal do Nginx com alias para UPLOAD_FOLDER
+
+    # Armazenamento dos uploads: 'local' (UPLOAD_FOLDER) ou 's3' (bucket compatível com S3)
+    ARMAZENAMENTO = os.getenv('ARMAZENAMENTO', 'local')
+    S3_BUCKET = os.getenv('S3_BUCKET')
+    S3_PREFIXO = os.getenv('S3_PREFIXO', 'uploads/')
+    S3_ENDPOINT_URL = os.getenv('S3_ENDPOINT_URL')  # MinIO e compatíveis; vazio para AWS
+    S3_REGIAO = os.getenv('S3_REGIAO')
+    S3_ACCESS_KEY = os.getenv('S3_ACCESS_KEY')  # Vazio: credenciais padrão do boto3 (AWS_*, IAM role)
+    S3_SECRET_KEY = os.getenv('S3_SECRET_KEY')
+    S3_TAMANHO_PARTE_MB = int(os.getenv('S3_TAMANHO_PARTE_MB', 8))  # Partes do multipart upload
+    S3_URL_ASSINADA = os.getenv('S3_URL_ASSINADA', 'True').lower() == 'true'  # /uploads redireciona para o bucket
+    S3_URL_ASSINADA_SEGUNDOS = int(os.getenv('S3_URL_ASSINADA_SEGUNDOS', 300))
+    ARMAZENAMENTO_CACHE_MAX_MB = int(os.getenv('ARMAZENAMENTO_CACHE_MAX_MB', 1024))  # Cópias locais (PDF, derivados) em CACHE_FOLDER/armazenamento
+
+    # Ingestão de fotos por pasta monitorada (scripts/management/ingerir_fotos.py)
+    INGESTAO_PASTA = os.getenv('INGESTAO_PASTA', os.path.join(os.getcwd(), 'ingestao'))
+    INGESTAO_INTERVALO_SEGUNDOS = int(os.getenv('INGESTAO_INTERVALO_SEGUNDOS', 10))  # Espera entre ciclos do serviço
+    INGESTAO_ESTABILIDADE_SEGUNDOS = int(os.getenv('INGESTAO_ESTABILIDADE_SEGUNDOS', 5))  # Arquivos alterados há menos tempo ainda estão sendo copiados
+    INGESTAO_LOTE = int(os.getenv('INGESTAO_LOTE', 50))  # Fotos por transação
+    INGESTAO_MAX_TENTATIVAS = int(os.getenv('INGESTAO_MAX_TENTATIVAS', 5))  # Falhas ao gravar antes de mover para rejeitadas/
+    INGESTAO_ESPERA_SEGUNDOS = int(os.getenv('INGESTAO_ESPERA_SEGUNDOS', 60))  # Espera após a 1ª falha (dobra a cada nova falha)
 
     # Extensões permitidas
     ALLOWED_EXTENSIONS = set(os.getenv('ALLOWED_EXTENSIONS', 'png,jpg,jpeg,gif,pdf,xlsx,xls,ppt,pptx').split(','))
@@ -43,6 +71,29 @@ class Config:
     # Extensões de documento
     DOCUMENT_EXTENSIONS = {'pdf', 'xlsx', 'xls', 'ppt', 'pptx'}
 
+    # Cache de estatísticas do dashboard (segundos; a janela de 30 dias desliza com o tempo)
+    STATS_CACHE_TTL = int(os.getenv('STATS_CACHE_TTL', 3600))
+
+    # Cache de árvores de relatórios (quantidade de relatórios por worker)
+    ARVORE_CACHE_MAX_ITENS = int(os.getenv('ARVORE_CACHE_MAX_ITENS', 128))
+
+    # Geração assíncrona de PDFs; só ative com pdf_worker.py em execução (False renderiza na própria requisição)
+    PDF_ASSINCRONO = os.getenv('PDF_ASSINCRONO', 'False').lower() == 'true'
+    PDF_WORKERS = int(os.getenv('PDF_WORKERS', 2))  # Processos de renderização
+    PDF_DEBOUNCE_SEGUNDOS = int(os.getenv('PDF_DEBOUNCE_SEGUNDOS', 30))  # Agrupa edições seguidas
+    PDF_MAX_TENTATIVAS = int(os.getenv('PDF_MAX_TENTATIVAS', 3))
+    PDF_BASE_URL = os.getenv('PDF_BASE_URL', 'http://127.0.0.1:8000/')  # Base das URLs do PDF fora de requisições (lidas do disco)
+
+    # Cache de PDFs por conteúdo em PDF_FOLDER (descarte LRU acima do limite)
+    PDF_CACHE_MAX_MB = int(os.getenv('PDF_CACHE_MAX_MB', 512))
+    PDF_SECOES_CACHE_MAX_MB = int(os.getenv('PDF_SECOES_CACHE_MAX_MB', 256))  # Seções (capa/referências) em PDF_FOLDER/secoes
+    IMAGENS_CACHE_MAX_MB = int(os.getenv('IMAGENS_CACHE_MAX_MB', 256))  # Imagens redimensionadas sob demanda em CACHE_FOLDER/imagens
+    PDF_TEMPLATE_VERSAO = os.getenv('PDF_TEMPLATE_VERSAO', '1')  # Incrementar para invalidar todos os PDFs
+
+    # Exportação em lote (/pdf/lote)
+    PDF_LOTE_PROCESSOS = int(os.getenv('PDF_LOTE_PROCESSOS', os.cpu_count() or 2))
+    PDF_LOTE_MAX_RELATORIOS = int(os.getenv('PDF_LOTE_MAX_RELATORIOS', 100))
+
     # Logging
     LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
     LOG_FILE = os.getenv('LOG_FILE', None)
@@ -52,6 +103,7 @@ class Config:
         """Inicializa configurações no app Flask"""
         os.makedirs(Config.UPLOAD_FOLDER, exist_ok=True)
         os.makedirs(Config.PDF_FOLDER, exist_ok=True)
+        os.makedirs(Config.CACHE_FOLDER, exist_ok=True)
 
         # Criar diretório de logs se necessário
         if Config.LOG_FILE:
@@ -0,0 +1,440 @@
+"""
+Estatísticas e listagem do dashboard
+Consultas agregadas (set-based) que substituem o loop de uma query por relatório
+Compatível com SQLite e PostgreSQL
+"""
+import os
+import json
+import logging
+import time
+import base64
+import threading
+from datetime import datetime, timedelta
+from sqlalchemy import select, func, case, desc, event, and_, or_, exists
+from sqlalchemy.orm import Session
+from models import db, Relatorio, Referencia, Prova
+
+logger = logging.getLogger(__name__)
+
+# Status de prova contabilizados no dashboard
+STATUS_APROVADA = 'Aprovada'
+STATUS_REPROVADA = 'Reprovada'
+STATUS_EM_ANDAMENTO = 'Em Andamento'
+STATUS_COMITE = 'Comitê'
+
+
+# ============================================================================
+# LISTAGEM PAGINADA (KEYSET)
+# ============================================================================
+
+# Tamanho padrão e máximo de página da listagem
+TAMANHO_PAGINA = 24
+TAMANHO_PAGINA_MAXIMO = 100
+
+# Filtros aceitos pela listagem (nome do parâmetro na query string)
+FILTROS_LISTAGEM = ('colecao', 'temporada', 'ano', 'status_geral', 'status_atual', 'categoria', 'busca')
+
+
+def codificar_cursor(relatorio):
+    """
+    Codifica a posição (created_at, id) do último item da página
+
+    Args:
+        relatorio: Dicionário com 'created_at' e 'id'
+
+    Returns:
+        str: Cursor opaco (base64 url-safe)
+    """
+    created_at = relatorio['created_at']
+    posicao = [created_at.isoformat() if created_at else None, relatorio['id']]
+    return base64.urlsafe_b64encode(json.dumps(posicao).encode()).decode().rstrip('=')
+
+
+def decodificar_cursor(cursor):
+    """
+    Decodifica um cursor gerado por codificar_cursor
+
+    Returns:
+        tuple: (created_at, id)
+
+    Raises:
+        ValueError: Se o cursor for inválido
+    """
+    try:
+        preenchimento = '=' * (-len(cursor) % 4)
+        created_at, relatorio_id = json.loads(base64.urlsafe_b64decode(cursor + preenchimento))
+        created_at = datetime.fromisoformat(created_at) if created_at else None
+        return created_at, int(relatorio_id)
+    except Exception:
+        raise ValueError('Cursor de paginação inválido')
+
+
+def normalizar_filtros(args):
+    """
+    Extrai os filtros da listagem de um MultiDict (request.args)
+
+    Returns:
+        dict: Apenas os filtros preenchidos; 'ano' convertido para int
+    """
+    filtros = {}
+    for nome in FILTROS_LISTAGEM:
+        valor = (args.get(nome) or '').strip()
+        if not valor:
+            continue
+        if nome == 'ano':
+            try:
+                valor = int(valor)
+            except ValueError:
+                continue
+        filtros[nome] = valor
+    return filtros
+
+
+def aplicar_filtros(consulta, filtros):
+    """Aplica os filtros da listagem à consulta de relatórios"""
+    if 'colecao' in filtros:
+        consulta = consulta.where(Relatorio.colecao == filtros['colecao'])
+    if 'temporada' in filtros:
+        consulta = consulta.where(Relatorio.temporada == filtros['temporada'])
+    if 'ano' in filtros:
+        consulta = consulta.where(Relatorio.ano == filtros['ano'])
+    if 'status_geral' in filtros:
+        consulta = consulta.where(Relatorio.status_geral == filtros['status_geral'])
+    if 'status_atual' in filtros:
+        consulta = consulta.where(Relatorio.status_atual == filtros['status_atual'])
+    if 'categoria' in filtros:
+        consulta = consulta.where(exists().where(and_(
+            Referencia.relatorio_id == Relatorio.id,
+            Referencia.tipo_categoria == filtros['categoria']
+        )))
+    if 'busca' in filtros:
+        termo = f"%{filtros['busca']}%"
+        consulta = consulta.where(or_(
+            Relatorio.descricao_geral.ilike(termo),
+            Relatorio.colecao.ilike(termo),
+            Relatorio.codigo.ilike(termo)
+        ))
+    return consulta
+
+
+def _aplicar_cursor(consulta, cursor):
+    """
+    Aplica a condição de seek após a posição (created_at, id) do cursor
+
+    Ordem: created_at DESC NULLS LAST, id DESC. Relatórios sem created_at
+    ficam no fim da listagem em ambos os bancos.
+    """
+    created_at, relatorio_id = decodificar_cursor(cursor)
+
+    if created_at is None:
+        return consulta.where(and_(Relatorio.created_at.is_(None), Relatorio.id < relatorio_id))
+
+    return consulta.where(or_(
+        Relatorio.created_at < created_at,
+        and_(Relatorio.created_at == created_at, Relatorio.id < relatorio_id),
+        Relatorio.created_at.is_(None)
+    ))
+
+
+def listar_relatorios_pagina(filtros=None, cursor=None, limite=TAMANHO_PAGINA):
+    """
+    Lista uma página de relatórios com status, usando paginação keyset
+
+    O custo por página independe da quantidade total de relatórios: a consulta
+    busca apenas limite + 1 linhas a partir da posição do cursor, e o status
+    atual é lido da coluna denormalizada.
+
+    Args:
+        filtros: Dicionário retornado por normalizar_filtros
+        cursor: Cursor da página anterior (None para a primeira página)
+        limite: Quantidade de relatórios por página
+
+    Returns:
+        tuple: (lista de dicionários, cursor da próxima página ou None)
+
+    Raises:
+        ValueError: Se o cursor for inválido
+    """
+    limite = max(1, min(int(limite), TAMANHO_PAGINA_MAXIMO))
+
+    consulta = select(*Relatorio.__table__.columns)
+    consulta = aplicar_filtros(consulta, filtros or {})
+    if cursor:
+        consulta = _aplicar_cursor(consulta, cursor)
+
+    consulta = (
+        consulta
+        .order_by(Relatorio.created_at.desc().nulls_last(), desc(Relatorio.id))
+        .limit(limite + 1)
+    )
+
+    relatorios = [dict(row._mapping) for row in db.session.execute(consulta)]
+
+    proximo_cursor = None
+    if len(relatorios) > limite:
+        relatorios = relatorios[:limite]
+        proximo_cursor = codificar_cursor(relatorios[-1])
+
+    return relatorios, proximo_cursor
+
+
+def _contar_status(status):
+    """Expressão de contagem condicional por status de prova"""
+    return func.coalesce(func.sum(case((Prova.status == status, 1), else_=0)), 0)
+
+
+def calcular_estatisticas(dias_recentes=30):
+    """
+    Calcula os contadores do dashboard em duas consultas agregadas
+
+    1. Contadores de provas (por status e retrabalho) via agregação condicional,
+       com os totais de relatórios como subqueries escalares
+    2. Referências agrupadas por categoria (a soma fornece o total de referências)
+
+    Args:
+        dias_recentes: Janela (em dias) para contar relatórios recentes
+
+    Returns:
+        dict: Estatísticas no formato esperado por dashboard.html
+    """
+    limite_recentes = datetime.utcnow() - timedelta(days=dias_recentes)
+
+    total_relatorios = select(func.count(Relatorio.id)).scalar_subquery()
+    relatorios_recentes = (
+        select(func.count(Relatorio.id))
+        .where(Relatorio.created_at >= limite_recentes)
+        .scalar_subquery()
+    )
+
+    contadores = db.session.execute(
+        select(
+            total_relatorios.label('total_relatorios'),
+            relatorios_recentes.label('relatorios_recentes'),
+            func.count(Prova.id).label('total_provas'),
+            _contar_status(STATUS_APROVADA).label('provas_aprovadas'),
+            _contar_status(STATUS_REPROVADA).label('provas_reprovadas'),
+            _contar_status(STATUS_EM_ANDAMENTO).label('provas_em_andamento'),
+            _contar_status(STATUS_COMITE).label('provas_comite'),
+            func.coalesce(
+                func.sum(case((Prova.numero_prova > 1, 1), else_=0)), 0
+            ).label('provas_retrabalho'),
+        ).select_from(Prova)
+    ).one()._mapping
+
+    categorias = {
+        categoria: total
+        for categoria, total in db.session.execute(
+            select(Referencia.tipo_categoria, func.count(Referencia.id))
+            .group_by(Referencia.tipo_categoria)
+        )
+    }
+
+    total_provas = contadores['total_provas']
+    taxa_aprovacao = round((contadores['provas_aprovadas'] / total_provas * 100) if total_provas > 0 else 0, 1)
+    taxa_retrabalho = round((contadores['provas_retrabalho'] / total_provas * 100) if total_provas > 0 else 0, 1)
+
+    stats = {
+        'total_relatorios': contadores['total_relatorios'],
+        'total_referencias': sum(categorias.values()),
+        'total_provas': total_provas,
+        'provas_aprovadas': contadores['provas_aprovadas'],
+        'provas_reprovadas': contadores['provas_reprovadas'],
+        'provas_em_andamento': contadores['provas_em_andamento'],
+        'provas_comite': contadores['provas_comite'],
+        'taxa_aprovacao': taxa_aprovacao,
+        'taxa_retrabalho': taxa_retrabalho,
+        'categorias': categorias,
+        'relatorios_recentes': contadores['relatorios_recentes'],
+    }
+    stats['insights'] = gerar_insights(stats)
+
+    return stats
+
+
+def gerar_insights(stats):
+    """
+    Gera os insights exibidos no dashboard a partir das estatísticas
+
+    Args:
+        stats: Dicionário retornado por calcular_estatisticas
+
+    Returns:
+        list: Dicionários com tipo, icone, titulo e mensagem
+    """
+    taxa_aprovacao = stats['taxa_aprovacao']
+    taxa_retrabalho = stats['taxa_retrabalho']
+    relatorios_recentes = stats['relatorios_recentes']
+    provas_em_andamento = stats['provas_em_andamento']
+
+    insights = []
+
+    if taxa_aprovacao >= 80:
+        insights.append({
+            'tipo': 'success',
+            'icone': 'bi-trophy',
+            'titulo': 'Excelente Performance!',
+            'mensagem': f'Taxa de aprovação de {taxa_aprovacao}% - acima da meta de 80%'
+        })
+    elif taxa_aprovacao >= 60:
+        insights.append({
+            'tipo': 'warning',
+            'icone': 'bi-exclamation-triangle',
+            'titulo': 'Performance Moderada',
+            'mensagem': f'Taxa de aprovação de {taxa_aprovacao}% - pode melhorar'
+        })
+    else:
+        insights.append({
+            'tipo': 'danger',
+            'icone': 'bi-exclamation-circle',
+            'titulo': 'Atenção Necessária',
+            'mensagem': f'Taxa de aprovação baixa: {taxa_aprovacao}% - revisar processos'
+        })
+
+    if taxa_retrabalho > 30:
+        insights.append({
+            'tipo': 'warning',
+            'icone': 'bi-arrow-repeat',
+            'titulo': 'Alto Retrabalho',
+            'mensagem': f'{taxa_retrabalho}% das provas precisaram de retrabalho'
+        })
+
+    if relatorios_recentes > 5:
+        insights.append({
+            'tipo': 'info',
+            'icone': 'bi-calendar-check',
+            'titulo': 'Alta Produtividade',
+            'mensagem': f'{relatorios_recentes} relatórios criados nos últimos 30 dias'
+        })
+
+    if provas_em_andamento > 10:
+        insights.append({
+            'tipo': 'info',
+            'icone': 'bi-hourglass-split',
+            'titulo': 'Provas Pendentes',
+            'mensagem': f'{provas_em_andamento} provas aguardando finalização'
+        })
+
+    return insights
+
+
+# ============================================================================
+# CACHE DE ESTATÍSTICAS
+# ============================================================================
+
+# Modelos cuja escrita altera as estatísticas do dashboard
+MODELOS_ESTATISTICAS = (Relatorio, Referencia, Prova)
+
+
+class EstatisticasCache:
+    """
+    Snapshot das estatísticas do dashboard invalidado por escrita
+
+    Cada worker mantém o snapshot em memória. A validade é controlada por um
+    arquivo marcador compartilhado: qualquer commit que altere relatórios,
+    referências ou provas atualiza o mtime do marcador, e a leitura compara
+    esse mtime (um único stat) com a versão do snapshot. Assim a leitura é
+    O(1) e a invalidação vale para todos os workers do Gunicorn.
+    """
+
+    NOME_MARCADOR = 'estatisticas.versao'
+
+    def __init__(self):
+        self.marcador = None
+        self.ttl = 3600
+        self._lock = threading.Lock()
+        self._stats = None
+        self._versao = None
+        self._gerado_em = 0
+
+    def init_app(self, app):
+        """Configura o marcador e registra os eventos de sessão"""
+        pasta = app.config['CACHE_FOLDER']
+        os.makedirs(pasta, exist_ok=True)
+        self.marcador = os.path.join(pasta, self.NOME_MARCADOR)
+        self.ttl = app.config.get('STATS_CACHE_TTL', self.ttl)
+        registrar_eventos_cache(self)
+
+    def _versao_atual(self):
+        """Versão global (mtime do marcador em ns) ou None se não existir"""
+        try:
+            return os.stat(self.marcador).st_mtime_ns
+        except (OSError, TypeError):
+            return None
+
+    def obter(self):
+        """
+        Retorna as estatísticas, recalculando apenas se o snapshot estiver inválido
+
+        Returns:
+            dict: Mesmo formato de calcular_estatisticas
+        """
+        versao = self._versao_atual()
+        with self._lock:
+            if (self._stats is not None and self._versao == versao
+                    and time.monotonic() - self._gerado_em < self.ttl):
+                return self._stats
+
+        stats = calcular_estatisticas()
+
+        with self._lock:
+            self._stats = stats
+            self._versao = versao
+            self._gerado_em = time.monotonic()
+        return stats
+
+    def invalidar(self):
+        """Descarta o snapshot local e avança a versão global"""
+        with self._lock:
+            self._stats = None
+
+        if not self.marcador:
+            return
+
+        try:
+            anterior = self._versao_atual() or 0
+            agora = max(time.time_ns(), anterior + 1)
+            with open(self.marcador, 'a'):
+                pass
+            os.utime(self.marcador, ns=(agora, agora))
+        except OSError as e:
+            logger.warning(f"Erro ao invalidar cache de estatísticas: {e}")
+
+
+def _sessao_altera_estatisticas(session):
+    """Verifica se o flush contém escrita em algum modelo das estatísticas"""
+    for colecao in (session.new, session.dirty, session.deleted):
+        for obj in colecao:
+            if isinstance(obj, MODELOS_ESTATISTICAS):
+                return True
+    return False
+
+
+def registrar_eventos_cache(cache):
+    """
+    Registra os eventos de sessão que mantêm o cache válido
+
+    after_flush marca a sessão como "suja" (new/dirty/deleted ainda refletem
+    o estado pré-flush nesse evento); after_commit invalida o cache apenas se
+    houve escrita relevante; rollback descarta a marcação.
+    """
+    if getattr(cache, '_eventos_registrados', False):
+        return
+    cache._eventos_registrados = True
+
+    @event.listens_for(Session, 'after_flush')
+    def marcar_alteracao(session, flush_context):
+        if _sessao_altera_estatisticas(session):
+            session.info['estatisticas_alteradas'] = True
+
+    @event.listens_for(Session, 'after_commit')
+    def invalidar_apos_commit(session):
+        if session.info.pop('estatisticas_alteradas', False):
+            cache.invalidar()
+
+    @event.listens_for(Session, 'after_rollback')
+    def descartar_marcacao(session):
+        session.info.pop('estatisticas_alteradas', None)
+
+
+# Instância global
+estatisticas_cache = EstatisticasCache()
@@ -0,0 +1,210 @@
+"""
+Edição por campo de provas e referências (salvamento automático)
+API usada pelo formulário de edição para gravar só os campos alterados
+
+Fluxo:
+    PATCH /api/provas/<id>         {versao, campos: {campo: valor}} -> nova versão
+    PATCH /api/referencias/<id>    {versao, campos: {campo: valor}} -> nova versão
+
+Controle otimista de concorrência: o cliente envia a versão que carregou
+(data-versao no formulário). Se a linha mudou desde então, a resposta é 409
+com a versão e os valores atuais dos campos enviados, e nada é gravado. A
+mesma verificação é repetida no UPDATE (version_id_col dos modelos), o que
+cobre duas edições simultâneas da mesma versão.
+"""
+import logging
+from datetime import datetime
+from flask import Blueprint, current_app, request, jsonify
+from flask_login import login_required
+from sqlalchemy.orm.exc import StaleDataError
+from models import db, Referencia, ProvaModelagem
+from utils import aplicar_alteracoes
+from pdf_jobs import enfileirar_pdf
+
+logger = logging.getLogger(__name__)
+
+edicao_bp = Blueprint('edicao', __name__, url_prefix='/api')
+
+# Campos de texto editáveis (nome do campo no formulário = atributo do modelo)
+CAMPOS_REFERENCIA = ['origem', 'fornecedor', 'materia_prima', 'composicao', 'gramatura', 'aviamentos']
+CAMPOS_PROVA = [
+    'data_recebimento', 'info_medidas', 'data_prova',
+    'time_qualidade', 'comentarios_qualidade', 'obs_qualidade',
+    'time_estilo', 'comentarios_estilo', 'obs_estilo',
+    'time_modelagem', 'comentarios_modelagem', 'obs_modelagem',
+    'data_lacre', 'numero_lacre', 'info_adicionais',
+]
+
+# Campos de data (input type="date": AAAA-MM-DD ou vazio)
+CAMPOS_DATA = ('data_recebimento', 'data_prova', 'data_lacre')
+
+# Tamanhos oferecidos no formulário para cada categoria
+TAMANHOS_POR_CATEGORIA = {
+    'baby': ['3a6meses', '6a9meses', '9a12meses'],
+    'kids': ['1', '2', '4', '6', '8'],
+    'teen': ['10', '12', '14'],
+    'adulto': ['PP', 'P', 'M', 'G', 'GG'],
+}
+
+
+def _validar_texto(modelo, campo, valor):
+    """Valor de texto (ou None) dentro do tamanho da coluna; retorna o erro ou None"""
+    if valor is not None and not isinstance(valor, str):
+        return "Valor deve ser texto"
+    limite = getattr(modelo.__table__.columns[campo].type, 'length', None)
+    if valor and limite and len(valor) > limite:
+        return f"Máximo de {limite} caracteres"
+    if valor and campo in CAMPOS_DATA:
+        try:
+            datetime.strptime(valor, '%Y-%m-%d')
+        except ValueError:
+            return "Data inválida (use AAAA-MM-DD)"
+    return None
+
+
+def _tamanhos(valor, categoria):
+    """
+    Normaliza tamanhos_recebidos (lista ou texto separado por vírgulas)
+
+    Returns:
+        tuple: (valor para a coluna, erro ou None)
+    """
+    if valor is None:
+        valor = []
+    if isinstance(valor, str):
+        valor = [t.strip() for t in valor.split(',') if t.strip()]
+    if not isinstance(valor, list) or not all(isinstance(t, str) for t in valor):
+        return None, "Informe uma lista de tamanhos"
+    disponiveis = TAMANHOS_POR_CATEGORIA.get(categoria)
+    if disponiveis is not None:
+        invalidos = [t for t in valor if t not in disponiveis]
+        if invalidos:
+            return None, f"Tamanhos inválidos para {categoria}: {', '.join(invalidos)}"
+        valor = [t for t in disponiveis if t in valor]
+    return ", ".join(valor), None
+
+
+def validar_campos_prova(prova, campos):
+    """
+    Valida os campos enviados para uma prova
+
+    Returns:
+        tuple: (valores normalizados, erros por campo)
+    """
+    valores, erros = {}, {}
+    for campo, valor in campos.items():
+        if campo == 'tamanhos_recebidos':
+            valores[campo], erro = _tamanhos(valor, prova.referencia.tipo_categoria)
+        elif campo in CAMPOS_PROVA:
+            valores[campo], erro = valor, _validar_texto(ProvaModelagem, campo, valor)
+        else:
+            erro = "Campo não editável"
+        if erro:
+            erros[campo] = erro
+    return valores, erros
+
+
+def validar_campos_referencia(referencia, campos):
+    """
+    Valida os campos enviados para uma referência
+
+    Returns:
+        tuple: (valores normalizados, erros por campo)
+    """
+    valores, erros = {}, {}
+    for campo, valor in campos.items():
+        if campo not in CAMPOS_REFERENCIA and campo != 'numero_ref':
+            erros[campo] = "Campo não editável"
+            continue
+        erro = _validar_texto(Referencia, campo, valor)
+        if not erro and campo == 'numero_ref' and not (valor or '').strip():
+            erro = "Número da referência é obrigatório"
+        if erro:
+            erros[campo] = erro
+        else:
+            valores[campo] = valor
+    return valores, erros
+
+
+def _conflito(obj, campos):
+    """409 com a versão e os valores atuais dos campos enviados"""
+    return jsonify(
+        error="O registro foi alterado por outra pessoa. Recarregue a página para continuar.",
+        versao=obj.versao,
+        valores={campo: getattr(obj, campo) for campo in campos if hasattr(obj, campo)},
+    ), 409
+
+
+def _enfileirar_pdf(relatorio_id):
+    """Reagenda o PDF do relatório (debounce da fila agrupa as edições seguidas)"""
+    if not current_app.config['PDF_ASSINCRONO']:
+        return
+    try:
+        enfileirar_pdf(relatorio_id, evento='ATUALIZADO')
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Erro ao enfileirar PDF do relatório {relatorio_id}: {e}")
+
+
+def _atualizar(obj, validar, relatorio_id):
+    """
+    Aplica os campos do corpo da requisição com verificação de versão
+
+    Returns:
+        200 com a nova versão e os campos alterados; 400 se o corpo ou algum
+        campo for inválido; 409 se a versão enviada não for a atual
+    """
+    dados = request.get_json(silent=True)
+    if not isinstance(dados, dict) or not isinstance(dados.get('campos'), dict):
+        return jsonify(error="Corpo deve ser um objeto JSON com 'versao' e 'campos'"), 400
+    versao = dados.get('versao')
+    if not isinstance(versao, int) or isinstance(versao, bool):
+        return jsonify(error="Versão ausente ou inválida"), 400
+
+    campos = dados['campos']
+    valores, erros = validar(obj, campos)
+    if erros:
+        return jsonify(error="Campos inválidos", campos=erros), 400
+    if versao != obj.versao:
+        return _conflito(obj, campos)
+
+    alterados = aplicar_alteracoes(obj, valores)
+    if alterados:
+        try:
+            db.session.commit()
+        except StaleDataError:
+            # Outra requisição gravou a mesma versão entre a leitura e o UPDATE
+            db.session.rollback()
+            return _conflito(obj, campos)
+        _enfileirar_pdf(relatorio_id)
+
+    return jsonify(
+        id=obj.id,
+        versao=obj.versao,
+        alterados=alterados,
+        updated_at=obj.updated_at.isoformat() if obj.updated_at else None,
+    )
+
+
+# ============================================================================
+# ROTAS
+# ============================================================================
+
+@edicao_bp.route('/provas/<int:id>', methods=['PATCH'])
+@login_required
+def atualizar_prova(id):
+    """Grava os campos alterados de uma prova"""
+    prova = db.session.get(ProvaModelagem, id)
+    if prova is None or prova.is_active is False:
+        return jsonify(error="Prova não encontrada"), 404
+    return _atualizar(prova, validar_campos_prova, prova.referencia.relatorio_id)
+
+
+@edicao_bp.route('/referencias/<int:id>', methods=['PATCH'])
+@login_required
+def atualizar_referencia(id):
+    """Grava os campos alterados de uma referência"""
+    referencia = db.session.get(Referencia, id)
+    if referencia is None or referencia.is_active is False:
+        return jsonify(error="Referência não encontrada"), 404
+    return _atualizar(referencia, validar_campos_referencia, referencia.relatorio_id)
@@ -48,6 +48,12 @@ def when_ready(server):
     """Executado quando o servidor está pronto"""
     print(f"Servidor pronto! Escutando em {bind}")
 
+def post_fork(server, worker):
+    """Executado em cada worker após o fork: prepara o contexto de PDF"""
+    from app import app
+    from pdf_render import aquecer
+    aquecer(app)
+
 def on_exit(server):
     """Executado quando o servidor encerra"""
     print("Encerrando servidor Gunicorn...")
@@ -0,0 +1,166 @@
+"""
+Derivados de imagens das fotos (FotoProva)
+Versões reduzidas e recomprimidas geradas a partir do upload original
+
+Os derivados ficam em UPLOAD_FOLDER/derivados/<variante>/ab/cd/<arquivo>.jpg
+(mesmas subpastas do original no layout particionado, ver storage_backends;
+derivados do layout plano continuam válidos até a migração) e são gerados no
+upload (save_file) ou pelo backfill. Como os uploads nunca são
+sobrescritos (o nome é o hash do conteúdo), um derivado existente é sempre
+válido. A orientação EXIF é aplicada nos pixels, pois o derivado é gravado sem
+metadados.
+
+Só a versão de impressão (PDF) é gerada antecipadamente; as telas usam
+imagens redimensionadas sob demanda (image_resize).
+"""
+import os
+import logging
+import threading
+from flask import current_app
+from PIL import Image, ImageOps
+from storage_backends import armazenamento, nome_particionado
+
+logger = logging.getLogger(__name__)
+
+# Pasta dos derivados dentro de UPLOAD_FOLDER
+PASTA_DERIVADOS = 'derivados'
+
+# Variantes: maior lado em pixels e qualidade JPEG
+VARIANTES = {
+    # PDF: as fotos ocupam no máximo ~9cm de largura (~1000px a 300dpi)
+    'impressao': {'max_lado': 1200, 'qualidade': 80},
+}
+
+# Extensões tratadas como imagem
+EXTENSOES_IMAGEM = ('.png', '.jpg', '.jpeg', '.gif')
+
+
+def caminho_original(file_path):
+    """Caminho no disco do upload original (cópia local, com o S3), ou None se não existir"""
+    return armazenamento().caminho_local(file_path)
+
+
+def _relativo_derivado(file_path, variante, particionado=True):
+    """Caminho do derivado relativo a UPLOAD_FOLDER (no layout particionado ou no plano)"""
+    nome = os.path.basename(file_path)
+    if particionado:
+        nome = nome_particionado(nome)
+    return f"{PASTA_DERIVADOS}/{variante}/{os.path.splitext(nome)[0]}.jpg"
+
+
+def caminho_derivado(file_path, variante, particionado=True):
+    """Caminho absoluto do derivado de uma foto"""
+    return os.path.join(current_app.config['UPLOAD_FOLDER'], _relativo_derivado(file_path, variante, particionado))
+
+
+def _derivado_existente(file_path, variante):
+    """Caminho relativo do derivado já gerado (em qualquer layout), ou None"""
+    for particionado in (True, False):
+        relativo = _relativo_derivado(file_path, variante, particionado)
+        if os.path.exists(os.path.join(current_app.config['UPLOAD_FOLDER'], relativo)):
+            return relativo
+    return None
+
+
+def converter_rgb(imagem):
+    """Converte para RGB, compondo a transparência sobre fundo branco"""
+    if imagem.mode in ('RGBA', 'LA') or (imagem.mode == 'P' and 'transparency' in imagem.info):
+        imagem = imagem.convert('RGBA')
+        fundo = Image.new('RGB', imagem.size, (255, 255, 255))
+        fundo.paste(imagem, mask=imagem.getchannel('A'))
+        return fundo
+    if imagem.mode != 'RGB':
+        return imagem.convert('RGB')
+    return imagem
+
+
+def gerar_derivado(file_path, variante='impressao', forcar=False):
+    """
+    Gera (se necessário) o derivado de uma foto
+
+    Args:
+        file_path: Nome do arquivo em UPLOAD_FOLDER (FotoProva.file_path)
+        variante: Chave de VARIANTES
+        forcar: Regenera mesmo se o derivado já existir
+
+    Returns:
+        str: Caminho absoluto do derivado, ou None se o arquivo não for uma
+        imagem válida (nesse caso o original deve ser usado)
+    """
+    if not file_path or not file_path.lower().endswith(EXTENSOES_IMAGEM):
+        return None
+
+    if not forcar:
+        existente = _derivado_existente(file_path, variante)
+        if existente:
+            return os.path.join(current_app.config['UPLOAD_FOLDER'], existente)
+
+    destino = caminho_derivado(file_path, variante)
+    origem = caminho_original(file_path)
+    if origem is None:
+        return None
+
+    parametros = VARIANTES[variante]
+    temporario = f"{destino}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with Image.open(origem) as imagem:
+            # Reduz na decodificação quando possível (JPEG), antes de rotacionar
+            imagem.draft('RGB', (parametros['max_lado'], parametros['max_lado']))
+            imagem = ImageOps.exif_transpose(imagem)
+            imagem = converter_rgb(imagem)
+            imagem.thumbnail((parametros['max_lado'], parametros['max_lado']), Image.LANCZOS)
+
+            os.makedirs(os.path.dirname(destino), exist_ok=True)
+            imagem.save(temporario, 'JPEG', quality=parametros['qualidade'],
+                        optimize=True, progressive=True)
+        os.replace(temporario, destino)
+        return destino
+
+    except Exception as e:
+        if os.path.exists(temporario):
+            os.remove(temporario)
+        logger.warning(f"Erro ao gerar derivado '{variante}' de {file_path}: {e}")
+        return None
+
+
+def gerar_derivados(file_path, forcar=False):
+    """
+    Gera todas as variantes de uma foto (chamada no upload)
+
+    Returns:
+        bool: True se todas as variantes estão disponíveis
+    """
+    return all([gerar_derivado(file_path, variante, forcar=forcar) for variante in VARIANTES])
+
+
+def remover_derivados(file_path):
+    """Remove os derivados (todas as variantes, nos dois layouts) de um arquivo excluído"""
+    for variante in VARIANTES:
+        for particionado in (True, False):
+            try:
+                os.remove(caminho_derivado(file_path, variante, particionado))
+            except FileNotFoundError:
+                pass
+
+
+def particionar_derivados(file_path):
+    """Move os derivados de um arquivo do layout plano para o particionado (migração)"""
+    for variante in VARIANTES:
+        origem = caminho_derivado(file_path, variante, particionado=False)
+        if os.path.exists(origem):
+            destino = caminho_derivado(file_path, variante)
+            os.makedirs(os.path.dirname(destino), exist_ok=True)
+            os.replace(origem, destino)
+
+
+def caminho_impressao(foto):
+    """
+    Caminho da versão de impressão de uma foto, usado pelo template do PDF
+
+    Args:
+        foto: Dicionário da foto (árvore do relatório)
+
+    Returns:
+        str: Caminho absoluto do derivado ou, na falta dele, do original
+    """
+    return gerar_derivado(foto['file_path'], 'impressao') or foto['caminho_absoluto']
@@ -0,0 +1,292 @@
+"""
+Imagens redimensionadas sob demanda (rota /uploads/imagem/<largura>/<arquivo>)
+Cada tela pede a largura de que precisa; só as combinações usadas são geradas
+
+As larguras aceitas são as de LARGURAS (evita gerar tamanhos arbitrários) e o
+formato segue o Accept: WebP quando o navegador aceita, JPEG caso contrário.
+O resultado fica em CACHE_FOLDER/imagens, com descarte LRU (mtime atualizado a
+cada acesso) quando o total passa de IMAGENS_CACHE_MAX_MB. Requisições
+simultâneas pela mesma imagem no mesmo worker esperam uma única geração; entre
+workers a gravação atômica (os.replace) torna a geração duplicada inofensiva.
+
+O PDF continua usando o derivado 'impressao' (image_derivatives), gerado no upload.
+"""
+import os
+import time
+import hashlib
+import logging
+import threading
+from flask import current_app, request, send_file, abort, url_for
+from PIL import Image, ImageOps, features
+from werkzeug.security import safe_join
+from image_derivatives import EXTENSOES_IMAGEM, converter_rgb
+from upload_store import nome_por_conteudo, MAX_AGE_IMUTAVEL
+from storage_backends import armazenamento, RECONTAGEM_CACHE_SEGUNDOS
+
+logger = logging.getLogger(__name__)
+
+# Larguras servidas (px): cards e miniaturas, grade de detalhes, zoom do modal
+LARGURAS = (160, 320, 480, 640, 960, 1280, 1920)
+
+# Formatos de saída: extensão, mimetype e qualidade
+FORMATOS = {
+    'webp': {'mimetype': 'image/webp', 'pil': 'WEBP', 'qualidade': 78},
+    'jpg': {'mimetype': 'image/jpeg', 'pil': 'JPEG', 'qualidade': 80},
+}
+
+# Incluído na chave: alterar a qualidade ou o algoritmo invalida o cache
+VERSAO_CACHE = '1'
+
+
+def formato_preferido():
+    """'webp' se o Accept da requisição aceita WebP (e o Pillow o suporta), senão 'jpg'"""
+    if request.accept_mimetypes['image/webp'] and features.check('webp'):
+        return 'webp'
+    return 'jpg'
+
+
+def url_imagem(file_path, largura):
+    """
+    URL da imagem redimensionada para os templates (src/srcset)
+
+    Arquivos que não são imagem apontam para o original.
+    """
+    if not file_path or not file_path.lower().endswith(EXTENSOES_IMAGEM):
+        return url_for('serve_upload', filename=file_path)
+    return url_for('serve_imagem', largura=largura, filename=file_path)
+
+
+def _chave(file_path, info, largura, formato):
+    """Chave do cache: nome por conteúdo (sem as subpastas do layout) ou nome + tamanho + mtime do original"""
+    identidade = os.path.basename(file_path) if info is None else f"{file_path}:{info['tamanho']}:{info['mtime']}"
+    return hashlib.sha256(f"{VERSAO_CACHE}:{identidade}:{largura}:{formato}".encode('utf-8')).hexdigest()
+
+
+# Orientações EXIF com rotação de 90°: largura e altura trocam após exif_transpose
+ORIENTACOES_GIRADAS = (5, 6, 7, 8)
+
+
+def reduzir_na_decodificacao(imagem, largura):
+    """
+    Pede ao decodificador (JPEG) a menor escala que ainda cubra a largura final
+
+    A caixa pedida é a do tamanho final, na orientação armazenada: a rotação
+    EXIF só é aplicada depois. Formatos sem suporte a draft não mudam.
+    """
+    largura_original, altura_original = imagem.size
+    if imagem.getexif().get(0x0112) in ORIENTACOES_GIRADAS:
+        largura_original, altura_original = altura_original, largura_original
+    if largura_original <= largura:
+        return
+    caixa = (largura, max(1, round(altura_original * largura / largura_original)))
+    if imagem.size != (largura_original, altura_original):
+        caixa = caixa[::-1]
+    imagem.draft('RGB', caixa)
+
+
+def redimensionar(origem, destino, largura, formato):
+    """Grava em destino (atomicamente) a imagem com no máximo largura px de largura"""
+    parametros = FORMATOS[formato]
+    temporario = f"{destino}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with Image.open(origem) as imagem:
+            # Reduz na decodificação quando possível (JPEG)
+            reduzir_na_decodificacao(imagem, largura)
+            imagem = ImageOps.exif_transpose(imagem)
+            imagem = converter_rgb(imagem)
+            if imagem.width > largura:
+                altura = max(1, round(imagem.height * largura / imagem.width))
+                imagem = imagem.resize((largura, altura), Image.LANCZOS)
+            imagem.save(temporario, parametros['pil'], quality=parametros['qualidade'], optimize=True)
+        os.replace(temporario, destino)
+    except Exception:
+        if os.path.exists(temporario):
+            os.remove(temporario)
+        raise
+
+
+class CacheImagens:
+    """
+    Imagens redimensionadas em CACHE_FOLDER/imagens com descarte LRU por tamanho
+
+    Também coalesce gerações concorrentes da mesma chave: a primeira thread
+    gera, as demais aguardam o Event dela e reaproveitam o arquivo.
+    """
+
+    def __init__(self, max_bytes=256 * 1024 * 1024):
+        self.pasta = None
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._em_geracao = {}
+        self._total = None  # Bytes na pasta (None: percorrer a pasta)
+        self._contado_em = 0.0
+
+    def init_app(self, app):
+        """Configura a pasta e o orçamento de espaço do cache"""
+        self.pasta = os.path.join(app.config['CACHE_FOLDER'], 'imagens')
+        os.makedirs(self.pasta, exist_ok=True)
+        self.max_bytes = app.config.get('IMAGENS_CACHE_MAX_MB', self.max_bytes // (1024 * 1024)) * 1024 * 1024
+
+    def caminho(self, chave, formato):
+        """Caminho absoluto de uma imagem do cache"""
+        return os.path.join(self.pasta, f"{chave}.{formato}")
+
+    def obter(self, chave, formato):
+        """Caminho da imagem em cache, ou None; um acerto atualiza o mtime (LRU)"""
+        caminho = self.caminho(chave, formato)
+        try:
+            os.utime(caminho)
+        except OSError:
+            return None
+        return caminho
+
+    def obter_ou_gerar(self, chave, formato, gerar):
+        """
+        Retorna a imagem em cache, gerando-a uma única vez se necessário
+
+        Args:
+            chave: Chave calculada por _chave
+            formato: Chave de FORMATOS
+            gerar: Função que recebe o caminho de destino e grava a imagem
+
+        Returns:
+            str: Caminho absoluto da imagem
+
+        Raises:
+            Exception: Erro de gerar (repassado a todas as requisições que aguardavam)
+        """
+        caminho = self.obter(chave, formato)
+        if caminho:
+            return caminho
+
+        with self._lock:
+            pendente = self._em_geracao.get(chave)
+            if pendente is None:
+                pendente = self._em_geracao[chave] = {'evento': threading.Event(), 'erro': None}
+                responsavel = True
+            else:
+                responsavel = False
+
+        if not responsavel:
+            pendente['evento'].wait()
+            if pendente['erro'] is not None:
+                raise pendente['erro']
+            return self.caminho(chave, formato)
+
+        try:
+            caminho = self.caminho(chave, formato)
+            gerar(caminho)
+            self._registrar(os.path.basename(caminho), os.path.getsize(caminho))
+            return caminho
+        except Exception as e:
+            pendente['erro'] = e
+            raise
+        finally:
+            with self._lock:
+                del self._em_geracao[chave]
+            pendente['evento'].set()
+
+    def _registrar(self, arquivo, tamanho):
+        """
+        Soma uma imagem nova ao total em memória
+
+        A pasta só é percorrida (descartar) quando o total passa do orçamento
+        ou quando a última contagem tem mais de RECONTAGEM_CACHE_SEGUNDOS
+        (outros workers gravam na mesma pasta).
+        """
+        with self._lock:
+            if self._total is not None and time.monotonic() - self._contado_em < RECONTAGEM_CACHE_SEGUNDOS:
+                self._total += tamanho
+                if self._total <= self.max_bytes:
+                    return
+        self.descartar(preservar=arquivo)
+
+    def descartar(self, preservar=None):
+        """
+        Remove as imagens menos usadas até o total caber em IMAGENS_CACHE_MAX_MB
+
+        Args:
+            preservar: Nome de arquivo que nunca deve ser removido (recém-gravado)
+
+        Returns:
+            int: Quantidade de arquivos removidos
+        """
+        with self._lock:
+            arquivos = []
+            total = 0
+            with os.scandir(self.pasta) as entradas:
+                for entrada in entradas:
+                    if not entrada.is_file() or entrada.name.endswith('.tmp'):
+                        continue
+                    st = entrada.stat()
+                    arquivos.append((st.st_mtime, st.st_size, entrada.path, entrada.name))
+                    total += st.st_size
+
+            removidos = 0
+            for _, tamanho, caminho, nome in sorted(arquivos):
+                if total <= self.max_bytes:
+                    break
+                if nome == preservar:
+                    continue
+                try:
+                    os.remove(caminho)
+                    total -= tamanho
+                    removidos += 1
+                except OSError as e:
+                    logger.warning(f"Erro ao descartar imagem {caminho}: {e}")
+            self._total = total
+            self._contado_em = time.monotonic()
+            return removidos
+
+
+def enviar_imagem(filename, largura):
+    """
+    Resposta com a imagem redimensionada (rota /uploads/imagem, já autenticada)
+
+    404 para larguras fora de LARGURAS, arquivos que não são imagem ou
+    imagens que não podem ser decodificadas. A ETag é a chave do cache; como
+    o formato depende do Accept, a resposta varia por ele.
+    """
+    if largura not in LARGURAS or not filename.lower().endswith(EXTENSOES_IMAGEM):
+        abort(404)
+    if any(parte.startswith('.') for parte in filename.split('/')):
+        abort(404)
+    if safe_join(current_app.config['UPLOAD_FOLDER'], filename) is None:
+        abort(404)
+
+    # Nomes por conteúdo dispensam consultar o original (acerto sem I/O no backend)
+    backend = armazenamento()
+    info = None
+    if not nome_por_conteudo(filename):
+        info = backend.info(filename)
+        if info is None:
+            abort(404)
+
+    def gerar(destino):
+        origem = backend.caminho_local(filename)
+        if origem is None:
+            raise FileNotFoundError(filename)
+        redimensionar(origem, destino, largura, formato)
+
+    formato = formato_preferido()
+    chave = _chave(filename, info, largura, formato)
+    try:
+        caminho = imagens_cache.obter_ou_gerar(chave, formato, gerar)
+    except Exception as e:
+        logger.warning(f"Erro ao redimensionar {filename} ({largura}px): {e}")
+        abort(404)
+
+    response = send_file(caminho, mimetype=FORMATOS[formato]['mimetype'], etag=chave, conditional=True)
+    response.vary.add('Accept')
+    response.cache_control.private = True
+    response.cache_control.no_cache = None
+    if nome_por_conteudo(filename):
+        response.cache_control.max_age = MAX_AGE_IMUTAVEL
+        response.cache_control.immutable = True
+    else:
+        response.cache_control.no_cache = True
+    return response
+
+
+# Instância global
+imagens_cache = CacheImagens()
@@ -42,6 +42,15 @@ class Relatorio(db.Model):
     ano = db.Column(db.Integer)
     ppt_path = db.Column(db.String(500))
     status_geral = db.Column(db.String(50), default='Em Andamento')
+
+    # Status da última prova (denormalizado, mantido por status_sync.py)
+    status_atual = db.Column(db.String(50), default='Novo', index=True)
+    ultima_prova_id = db.Column(db.Integer)
+    total_provas = db.Column(db.Integer, default=0)
+
+    # Versão da árvore (relatório + filhos), incrementada a cada escrita (report_tree.py)
+    versao = db.Column(db.Integer, default=1, nullable=False)
+
     is_active = db.Column(db.Boolean, default=True)
     created_by = db.Column(db.Integer, db.ForeignKey('usuarios.id'))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
@@ -50,6 +59,11 @@ class Relatorio(db.Model):
     # Relacionamentos
     referencias = db.relationship('Referencia', backref='relatorio', lazy=True, cascade="all, delete-orphan")
 
+    # Índices (listagem paginada por created_at, id)
+    __table_args__ = (
+        db.Index('ix_relatorios_created_at_id', 'created_at', 'id'),
+    )
+
 class Referencia(db.Model):
     """
     Tabela de referências de produtos
@@ -71,6 +85,15 @@ class Referencia(db.Model):
     gramatura = db.Column(db.String(100))
     aviamentos = db.Column(db.String(500))
     observacoes = db.Column(db.Text)
+
+    # Status da última prova (denormalizado, mantido por status_sync.py)
+    status_atual = db.Column(db.String(50), default='Novo', index=True)
+    ultima_prova_id = db.Column(db.Integer)
+    total_provas = db.Column(db.Integer, default=0)
+
+    # Versão da linha (controle otimista de concorrência; ver field_updates.py)
+    versao = db.Column(db.Integer, default=1, nullable=False)
+
     is_active = db.Column(db.Boolean, default=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, onupdate=datetime.utcnow)
@@ -78,6 +101,9 @@ class Referencia(db.Model):
     # Relacionamentos
     provas = db.relationship('ProvaModelagem', backref='referencia', lazy=True, cascade="all, delete-orphan")
 
+    # UPDATEs pelo ORM exigem a versão carregada e a incrementam
+    __mapper_args__ = {'version_id_col': versao}
+
 class ProvaModelagem(db.Model):
     """
     Tabela de provas de modelagem
@@ -126,6 +152,7 @@ class ProvaModelagem(db.Model):
     info_adicionais = db.Column(db.Text)
 
     # Controle
+    versao = db.Column(db.Integer, default=1, nullable=False)  # Controle otimista (field_updates.py)
     is_active = db.Column(db.Boolean, default=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, onupdate=datetime.utcnow)
@@ -133,6 +160,9 @@ class ProvaModelagem(db.Model):
     # Relacionamentos
     fotos = db.relationship('FotoProva', backref='prova', lazy=True, cascade="all, delete-orphan")
 
+    # UPDATEs pelo ORM exigem a versão carregada e a incrementam
+    __mapper_args__ = {'version_id_col': versao}
+
 class FotoProva(db.Model):
     """
     Tabela de fotos das provas
@@ -146,6 +176,55 @@ class FotoProva(db.Model):
     tamanho = db.Column(db.String(50))  # Para amostra/prova_modelo
     file_path = db.Column(db.String(500), nullable=False)
 
+class TarefaPdf(db.Model):
+    """
+    Fila de geração de PDFs de relatórios
+    Processada fora dos workers web por pdf_worker.py
+    """
+    __tablename__ = 'tarefas_pdf'
+
+    id = db.Column(db.Integer, primary_key=True)
+    relatorio_id = db.Column(db.Integer, nullable=False, index=True)
+    evento = db.Column(db.String(50))  # CRIADO, ATUALIZADO, MANUAL
+    status = db.Column(db.String(20), default='pendente', nullable=False, index=True)  # pendente, processando, concluida, erro
+    executar_apos = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)  # Debounce
+    tentativas = db.Column(db.Integer, default=0)
+    versao_relatorio = db.Column(db.Integer)  # Versão do relatório renderizada
+    arquivo = db.Column(db.String(500))  # Nome do arquivo em PDF_FOLDER
+    erro = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    iniciado_em = db.Column(db.DateTime)
+    concluido_em = db.Column(db.DateTime)
+
+class ArquivoUpload(db.Model):
+    """
+    Arquivos do armazenamento de uploads endereçado por conteúdo
+    Contagem de referências (fotos, PPTs e tabelas de medidas) de cada arquivo
+    """
+    __tablename__ = 'arquivos_upload'
+
+    nome = db.Column(db.String(255), primary_key=True)  # <sha256>.<extensão> em UPLOAD_FOLDER
+    referencias = db.Column(db.Integer, default=0, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class SessaoUpload(db.Model):
+    """
+    Uploads em partes (retomáveis) de PPTs e tabelas de medidas
+    O arquivo é montado em UPLOAD_FOLDER/.sessoes e movido para o armazenamento ao final
+    """
+    __tablename__ = 'sessoes_upload'
+
+    id = db.Column(db.String(32), primary_key=True)  # uuid4 hex, referenciado pelos formulários
+    usuario_id = db.Column(db.Integer, db.ForeignKey('usuarios.id'), nullable=False, index=True)
+    filename = db.Column(db.String(255), nullable=False)  # Nome original (define a extensão)
+    tamanho = db.Column(db.Integer, nullable=False)  # Tamanho total declarado
+    sha256 = db.Column(db.String(64))  # Checksum informado pelo cliente (opcional)
+    recebido = db.Column(db.Integer, default=0, nullable=False)  # Offset: bytes já gravados
+    status = db.Column(db.String(20), default='ativa', nullable=False)  # ativa, concluida
+    arquivo = db.Column(db.String(255))  # Nome no armazenamento após a conclusão
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    atualizado_em = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
 # Classes removidas (não existem no banco de dados real):
 # - HistoricoStatus
 # - ConfiguracaoSistema
@@ -0,0 +1,285 @@
+"""
+Exportação em lote dos PDFs de relatórios
+ZIP (ou PDF único mesclado) com os relatórios de uma coleção/temporada
+
+Os PDFs já em cache (pdf_cache) são reaproveitados; os demais são renderizados
+em paralelo em um pool de processos. O ZIP é transmitido ao cliente à medida
+que cada PDF fica pronto, sem montar o arquivo inteiro em memória.
+"""
+import io
+import os
+import zipfile
+import logging
+import tempfile
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+from flask import Blueprint, current_app, request, jsonify, Response, stream_with_context, send_file
+from flask_login import login_required
+from sqlalchemy import select
+from models import db, Relatorio
+from dashboard_stats import normalizar_filtros, aplicar_filtros
+from report_tree import carregar_arvore_relatorio
+from pdf_cache import pdf_cache, chave_pdf
+
+logger = logging.getLogger(__name__)
+
+pdf_lote_bp = Blueprint('pdf_lote', __name__, url_prefix='/pdf/lote')
+
+# Tamanho dos blocos lidos dos PDFs em disco
+TAMANHO_BLOCO = 64 * 1024
+
+FORMATOS = ('zip', 'pdf')
+
+
+# ============================================================================
+# POOL DE RENDERIZAÇÃO (um por processo do Gunicorn)
+# ============================================================================
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+def obter_pool():
+    """Pool de processos de renderização, criado na primeira exportação"""
+    global _pool, _pool_pid
+    with _pool_lock:
+        if _pool is None or _pool_pid != os.getpid():
+            from pdf_render import inicializar_processo
+            _pool = ProcessPoolExecutor(
+                max_workers=current_app.config['PDF_LOTE_PROCESSOS'],
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=inicializar_processo,
+            )
+            _pool_pid = os.getpid()
+        return _pool
+
+
+def _descartar_pool():
+    """Descarta um pool quebrado (processo filho encerrado); o próximo lote cria outro"""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+
+def _gerar_no_processo(relatorio_id):
+    """Gera (ou reaproveita) o PDF de um relatório dentro do pool"""
+    from pdf_render import gerar_pdf
+    try:
+        return gerar_pdf(relatorio_id)[1]
+    finally:
+        db.session.remove()
+
+
+# ============================================================================
+# SELEÇÃO E PREPARO
+# ============================================================================
+
+def selecionar_relatorios(args):
+    """
+    IDs dos relatórios do lote, em ordem de criação
+
+    Aceita os mesmos filtros da listagem do dashboard (colecao, temporada, ...)
+    ou uma lista explícita em 'ids' (separados por vírgula).
+
+    Raises:
+        ValueError: Sem filtros, IDs inválidos ou lote acima de PDF_LOTE_MAX_RELATORIOS
+    """
+    consulta = select(Relatorio.id).order_by(Relatorio.created_at, Relatorio.id)
+
+    ids = (args.get('ids') or '').strip()
+    if ids:
+        try:
+            consulta = consulta.where(Relatorio.id.in_([int(i) for i in ids.split(',') if i.strip()]))
+        except ValueError:
+            raise ValueError("Lista de IDs inválida")
+    else:
+        filtros = normalizar_filtros(args)
+        if not filtros:
+            raise ValueError("Informe a coleção, a temporada ou outro filtro do lote")
+        consulta = aplicar_filtros(consulta, filtros)
+
+    limite = current_app.config['PDF_LOTE_MAX_RELATORIOS']
+    relatorio_ids = db.session.execute(consulta.limit(limite + 1)).scalars().all()
+    if len(relatorio_ids) > limite:
+        raise ValueError(f"O lote excede o limite de {limite} relatórios")
+    return relatorio_ids
+
+
+def preparar_lote(relatorio_ids):
+    """
+    Separa os PDFs já em cache dos que precisam ser renderizados
+
+    Returns:
+        list: Tuplas (relatorio_id, nome no lote, arquivo em cache ou None)
+    """
+    from pdf_render import nome_download_pdf
+
+    itens = []
+    for relatorio_id in relatorio_ids:
+        relatorio, referencias = carregar_arvore_relatorio(relatorio_id)
+        arquivo = pdf_cache.obter(chave_pdf(relatorio, referencias))
+        itens.append((relatorio_id, nome_download_pdf(relatorio), arquivo))
+    return itens
+
+
+def _resultados(itens):
+    """
+    Gera (relatorio_id, nome, arquivo ou None, erro) na ordem em que ficam prontos
+
+    Os PDFs em cache saem primeiro; os demais à medida que o pool conclui.
+    """
+    pendentes = {}
+    for relatorio_id, nome, arquivo in itens:
+        if arquivo:
+            yield relatorio_id, nome, arquivo, None
+            continue
+        try:
+            pendentes[obter_pool().submit(_gerar_no_processo, relatorio_id)] = (relatorio_id, nome)
+        except BrokenProcessPool as e:
+            _descartar_pool()
+            yield relatorio_id, nome, None, str(e)
+
+    for futuro in as_completed(pendentes):
+        relatorio_id, nome = pendentes[futuro]
+        try:
+            yield relatorio_id, nome, futuro.result(), None
+        except Exception as e:
+            if isinstance(e, BrokenProcessPool):
+                _descartar_pool()
+            logger.error(f"Erro ao gerar PDF do relatório {relatorio_id} no lote: {e}")
+            yield relatorio_id, nome, None, str(e)
+
+
+# ============================================================================
+# SAÍDA
+# ============================================================================
+
+class _SaidaStream(io.RawIOBase):
+    """Destino não-posicionável do ZipFile: acumula os bytes até serem enviados"""
+
+    def __init__(self):
+        super().__init__()
+        self._partes = []
+
+    def writable(self):
+        return True
+
+    def write(self, dados):
+        self._partes.append(bytes(dados))
+        return len(dados)
+
+    def esvaziar(self):
+        dados = b''.join(self._partes)
+        self._partes.clear()
+        return dados
+
+
+def gerar_zip(itens, pasta):
+    """
+    Gera o ZIP em blocos (PDFs sem recompressão), emitindo cada PDF ao ficar pronto
+
+    Falhas de renderização são listadas em ERROS.txt ao final do arquivo.
+    """
+    saida = _SaidaStream()
+    erros = []
+    with zipfile.ZipFile(saida, 'w', compression=zipfile.ZIP_STORED) as zf:
+        for relatorio_id, nome, arquivo, erro in _resultados(itens):
+            if erro:
+                erros.append(f"Relatório {relatorio_id} ({nome}): {erro}")
+                continue
+            try:
+                origem = open(os.path.join(pasta, arquivo), 'rb')
+            except OSError as e:
+                # Descartado do cache entre o preparo e o envio
+                erros.append(f"Relatório {relatorio_id} ({nome}): {e}")
+                continue
+            with origem, zf.open(nome, 'w', force_zip64=True) as destino:
+                while True:
+                    bloco = origem.read(TAMANHO_BLOCO)
+                    if not bloco:
+                        break
+                    destino.write(bloco)
+                    yield saida.esvaziar()
+            yield saida.esvaziar()
+
+        if erros:
+            zf.writestr('ERROS.txt', '\n'.join(erros) + '\n')
+    yield saida.esvaziar()
+
+
+def mesclar_pdf(itens, pasta):
+    """
+    Mescla os PDFs do lote, na ordem dos relatórios, em um arquivo temporário
+
+    Returns:
+        tuple: (caminho do arquivo temporário, lista de erros)
+    """
+    from pypdf import PdfWriter
+
+    prontos = {}
+    erros = []
+    for relatorio_id, nome, arquivo, erro in _resultados(itens):
+        if erro:
+            erros.append(f"Relatório {relatorio_id} ({nome}): {erro}")
+        else:
+            prontos[relatorio_id] = arquivo
+
+    writer = PdfWriter()
+    for relatorio_id, nome, _ in itens:
+        if relatorio_id in prontos:
+            writer.append(os.path.join(pasta, prontos[relatorio_id]), outline_item=nome[:-len('.pdf')])
+
+    descritor, caminho = tempfile.mkstemp(suffix='.pdf')
+    with os.fdopen(descritor, 'wb') as destino:
+        writer.write(destino)
+    writer.close()
+    return caminho, erros
+
+
+# ============================================================================
+# ROTA
+# ============================================================================
+
+@pdf_lote_bp.route('')
+@login_required
+def exportar_lote():
+    """
+    Exporta os PDFs dos relatórios filtrados
+
+    Query string: filtros da listagem (colecao, temporada, ...) ou ids=1,2,3;
+    formato=zip (padrão) ou formato=pdf (único PDF mesclado).
+    """
+    formato = request.args.get('formato', 'zip')
+    if formato not in FORMATOS:
+        return jsonify(error=f"Formato inválido: use {' ou '.join(FORMATOS)}"), 400
+
+    try:
+        relatorio_ids = selecionar_relatorios(request.args)
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+    if not relatorio_ids:
+        return jsonify(error="Nenhum relatório encontrado para os filtros informados"), 404
+
+    itens = preparar_lote(relatorio_ids)
+    pasta = current_app.config['PDF_FOLDER']
+    nome_lote = f"relatorios_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+
+    if formato == 'zip':
+        response = Response(stream_with_context(gerar_zip(itens, pasta)), mimetype='application/zip')
+        response.headers['Content-Disposition'] = f'attachment; filename={nome_lote}.zip'
+        response.headers['X-Accel-Buffering'] = 'no'
+        return response
+
+    caminho, erros = mesclar_pdf(itens, pasta)
+    response = send_file(caminho, mimetype='application/pdf', as_attachment=True,
+                         download_name=f"{nome_lote}.pdf", conditional=False)
+    response.call_on_close(lambda: os.remove(caminho))
+    if erros:
+        response.headers['X-Relatorios-Com-Erro'] = str(len(erros))
+    return response
@@ -0,0 +1,291 @@
+"""
+Cache de PDFs endereçado por conteúdo
+Os PDFs renderizados ficam em PDF_FOLDER como <chave>.pdf
+
+A chave é um hash da árvore do relatório, da identidade dos arquivos de foto
+(caminho, tamanho e mtime) e da versão do template; qualquer mudança em um
+deles gera uma chave nova e o PDF antigo deixa de ser usado. A chave também é
+o ETag das respostas. Os arquivos são descartados por LRU (mtime atualizado a
+cada acesso) quando o total passa de PDF_CACHE_MAX_MB.
+
+O PDF completo é montado a partir de seções (capa e uma por referência),
+cacheadas em PDF_FOLDER/secoes com chaves próprias: uma alteração em uma
+referência só renderiza de novo a seção dela.
+"""
+import os
+import json
+import hashlib
+import time
+import logging
+import threading
+from flask import current_app, send_from_directory
+from image_derivatives import VARIANTES
+from upload_store import nome_por_conteudo
+from storage_backends import RECONTAGEM_CACHE_SEGUNDOS
+
+logger = logging.getLogger(__name__)
+
+# Template e folha de estilos (relativa à pasta static) usados na renderização
+TEMPLATE_PDF = 'relatorio_pdf.html'
+CSS_PDF = os.path.join('css', 'relatorio_pdf.css')
+
+# Campos do relatório que não aparecem no PDF (controle e status denormalizado)
+CAMPOS_IGNORADOS = ('versao', 'status_atual', 'ultima_prova_id', 'total_provas')
+
+
+def _identidade_arquivo(caminho):
+    """(tamanho, mtime) do arquivo, ou None se não existir"""
+    try:
+        st = os.stat(caminho)
+    except OSError:
+        return None
+    return st.st_size, st.st_mtime_ns
+
+
+def versao_template():
+    """
+    Versão do template do PDF: hash do template e da folha de estilos + PDF_TEMPLATE_VERSAO
+
+    PDF_TEMPLATE_VERSAO permite invalidar o cache manualmente (ex.: troca de
+    fontes ou do logo, que não fazem parte do template nem do CSS).
+    """
+    app = current_app._get_current_object()
+    versao = app.extensions.get('pdf_template_versao')
+    if versao is None:
+        fonte, _, _ = app.jinja_env.loader.get_source(app.jinja_env, TEMPLATE_PDF)
+        digest = hashlib.sha256(fonte.encode('utf-8'))
+        caminho_css = os.path.join(app.static_folder, CSS_PDF)
+        if os.path.exists(caminho_css):
+            with open(caminho_css, 'rb') as f:
+                digest.update(f.read())
+        versao = f"{app.config.get('PDF_TEMPLATE_VERSAO', '1')}-{digest.hexdigest()[:16]}"
+        app.extensions['pdf_template_versao'] = versao
+    return versao
+
+
+def _identidades_fotos(referencias):
+    """
+    (file_path, identidade do arquivo) de todas as fotos das referências
+
+    Nomes por conteúdo (<sha256>.<extensão>) já identificam o arquivo: não há
+    stat (nem consulta ao bucket, com o armazenamento S3).
+    """
+    fotos = []
+    for ref in referencias:
+        for prova in ref['provas']:
+            for lista in prova['fotos'].values():
+                for foto in lista:
+                    if nome_por_conteudo(foto['file_path']):
+                        fotos.append((foto['file_path'], None))
+                    else:
+                        fotos.append((foto['file_path'], _identidade_arquivo(foto['caminho_absoluto'])))
+    return fotos
+
+
+def _hash(conteudo):
+    """sha256 do conteúdo serializado, incluindo a versão do template"""
+    conteudo = dict(conteudo, template=versao_template(), impressao=VARIANTES['impressao'])
+    serializado = json.dumps(conteudo, sort_keys=True, default=str)
+    return hashlib.sha256(serializado.encode('utf-8')).hexdigest()
+
+
+def _relatorio_sem_ignorados(relatorio):
+    return {k: v for k, v in relatorio.items() if k not in CAMPOS_IGNORADOS}
+
+
+def chave_pdf(relatorio, referencias):
+    """
+    Calcula a chave de cache do PDF de um relatório
+
+    Args:
+        relatorio: Dicionário do relatório (carregar_arvore_relatorio)
+        referencias: Lista referencias_completas
+
+    Returns:
+        str: Hash hexadecimal (sha256)
+    """
+    return _hash({
+        'relatorio': _relatorio_sem_ignorados(relatorio),
+        'referencias': referencias,
+        'fotos': _identidades_fotos(referencias),
+    })
+
+
+def chave_secao_capa(relatorio, referencias, final):
+    """
+    Chave da seção de capa (cabeçalho, informações gerais e resumo)
+
+    Das referências a capa só usa categoria e quantidade de provas; editar
+    uma prova não invalida a capa.
+
+    Args:
+        final: True se a capa também leva o rodapé final (relatório sem referências)
+    """
+    return _hash({
+        'secao': 'capa',
+        'relatorio': _relatorio_sem_ignorados(relatorio),
+        'resumo': [(ref['tipo_categoria'], len(ref['provas'])) for ref in referencias],
+        'final': final,
+    })
+
+
+def chave_secao_referencia(ref, final):
+    """
+    Chave da seção de uma referência (dados da referência e suas provas)
+
+    Args:
+        ref: Dicionário da referência (com 'provas')
+        final: True se a seção também leva o rodapé final (última referência)
+    """
+    return _hash({
+        'secao': 'referencia',
+        'referencia': ref,
+        'fotos': _identidades_fotos([ref]),
+        'final': final,
+    })
+
+
+class PdfCache:
+    """
+    Armazenamento de PDFs em PDF_FOLDER (ou subpasta) com descarte LRU por tamanho
+
+    Args:
+        subpasta: Subpasta de PDF_FOLDER (None: a própria PDF_FOLDER)
+        config_max_mb: Chave de configuração do orçamento de espaço
+    """
+
+    def __init__(self, subpasta=None, config_max_mb='PDF_CACHE_MAX_MB', max_bytes=512 * 1024 * 1024):
+        self.subpasta = subpasta
+        self.config_max_mb = config_max_mb
+        self.max_bytes = max_bytes
+        self.pasta = None
+        self._lock = threading.Lock()
+        self._total = None  # Bytes na pasta (None: percorrer a pasta)
+        self._contado_em = 0.0
+
+    def init_app(self, app):
+        """Configura a pasta e o orçamento de espaço do cache"""
+        self.pasta = app.config['PDF_FOLDER']
+        if self.subpasta:
+            self.pasta = os.path.join(self.pasta, self.subpasta)
+            os.makedirs(self.pasta, exist_ok=True)
+        self.max_bytes = app.config.get(self.config_max_mb, self.max_bytes // (1024 * 1024)) * 1024 * 1024
+
+    @staticmethod
+    def nome_arquivo(chave):
+        """Nome do arquivo do PDF na pasta do cache"""
+        return f"{chave}.pdf"
+
+    def caminho(self, arquivo):
+        """Caminho absoluto de um arquivo do cache"""
+        return os.path.join(self.pasta, arquivo)
+
+    def obter(self, chave):
+        """
+        Retorna o nome do arquivo em cache para a chave, ou None
+
+        Um acerto atualiza o mtime do arquivo (ordem LRU do descarte).
+        """
+        caminho = os.path.join(self.pasta, self.nome_arquivo(chave))
+        try:
+            os.utime(caminho)
+        except OSError:
+            return None
+        return self.nome_arquivo(chave)
+
+    def guardar(self, chave, pdf):
+        """
+        Grava o PDF de forma atômica e aplica o orçamento de espaço
+
+        Args:
+            chave: Chave calculada por chave_pdf
+            pdf: Bytes do PDF
+
+        Returns:
+            str: Nome do arquivo gravado
+        """
+        arquivo = self.nome_arquivo(chave)
+        caminho = os.path.join(self.pasta, arquivo)
+        temporario = f"{caminho}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temporario, 'wb') as f:
+            f.write(pdf)
+        os.replace(temporario, caminho)
+
+        self._registrar(arquivo, len(pdf))
+        return arquivo
+
+    def _registrar(self, arquivo, tamanho):
+        """
+        Soma um arquivo novo ao total em memória
+
+        A pasta só é percorrida (descartar) quando o total passa do orçamento
+        ou quando a última contagem tem mais de RECONTAGEM_CACHE_SEGUNDOS
+        (outros processos gravam na mesma pasta).
+        """
+        with self._lock:
+            if self._total is not None and time.monotonic() - self._contado_em < RECONTAGEM_CACHE_SEGUNDOS:
+                self._total += tamanho
+                if self._total <= self.max_bytes:
+                    return
+        self.descartar(preservar=arquivo)
+
+    def descartar(self, preservar=None):
+        """
+        Remove os PDFs menos usados até o total caber em PDF_CACHE_MAX_MB
+
+        Args:
+            preservar: Nome de arquivo que nunca deve ser removido (recém-gravado)
+
+        Returns:
+            int: Quantidade de arquivos removidos
+        """
+        with self._lock:
+            arquivos = []
+            total = 0
+            with os.scandir(self.pasta) as entradas:
+                for entrada in entradas:
+                    if not entrada.is_file() or not entrada.name.endswith('.pdf'):
+                        continue
+                    st = entrada.stat()
+                    arquivos.append((st.st_mtime, st.st_size, entrada.path, entrada.name))
+                    total += st.st_size
+
+            removidos = 0
+            for _, tamanho, caminho, nome in sorted(arquivos):
+                if total <= self.max_bytes:
+                    break
+                if nome == preservar:
+                    continue
+                try:
+                    os.remove(caminho)
+                    total -= tamanho
+                    removidos += 1
+                except OSError as e:
+                    logger.warning(f"Erro ao descartar PDF {caminho}: {e}")
+            self._total = total
+            self._contado_em = time.monotonic()
+            return removidos
+
+
+def enviar_pdf(arquivo, nome_download=None):
+    """
+    Resposta com o PDF em cache, usando a chave como ETag
+
+    Responde 304 quando o If-None-Match do cliente bate com a chave. O
+    navegador sempre revalida (no-cache), pois a mesma URL pode passar a
+    apontar para outra chave após uma edição.
+    """
+    chave = arquivo[:-len('.pdf')]
+    response = send_from_directory(pdf_cache.pasta, arquivo,
+                                   mimetype='application/pdf',
+                                   download_name=nome_download,
+                                   etag=chave,
+                                   conditional=True)
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
+
+# Instâncias globais: PDFs completos e seções (capa e referências)
+pdf_cache = PdfCache()
+secoes_cache = PdfCache(subpasta='secoes', config_max_mb='PDF_SECOES_CACHE_MAX_MB', max_bytes=256 * 1024 * 1024)
@@ -0,0 +1,207 @@
+"""
+Fila de geração de PDFs
+Enfileiramento (com debounce), API de status/download e execução das tarefas
+
+As tarefas ficam na tabela tarefas_pdf e são executadas por pdf_worker.py,
+em um pool de processos separado dos workers do Gunicorn.
+"""
+import logging
+from datetime import datetime, timedelta
+from flask import Blueprint, current_app, jsonify, url_for, abort
+from flask_login import login_required
+from sqlalchemy import update
+from models import db, Relatorio, TarefaPdf
+from pdf_cache import enviar_pdf
+
+logger = logging.getLogger(__name__)
+
+pdf_bp = Blueprint('pdf', __name__, url_prefix='/pdf')
+
+# Status das tarefas
+STATUS_PENDENTE = 'pendente'
+STATUS_PROCESSANDO = 'processando'
+STATUS_CONCLUIDA = 'concluida'
+STATUS_ERRO = 'erro'
+
+
+def enfileirar_pdf(relatorio_id, evento='ATUALIZADO', atraso=None):
+    """
+    Enfileira a geração do PDF de um relatório (com debounce)
+
+    Se já existe uma tarefa pendente para o relatório, apenas reagenda sua
+    execução; edições seguidas geram um único PDF.
+
+    Args:
+        relatorio_id: ID do relatório
+        evento: CRIADO, ATUALIZADO ou MANUAL
+        atraso: Segundos até a execução (padrão: PDF_DEBOUNCE_SEGUNDOS)
+
+    Returns:
+        TarefaPdf: Tarefa criada ou reagendada
+    """
+    if atraso is None:
+        atraso = current_app.config['PDF_DEBOUNCE_SEGUNDOS']
+    executar_apos = datetime.utcnow() + timedelta(seconds=atraso)
+
+    tarefa = (
+        TarefaPdf.query
+        .filter_by(relatorio_id=relatorio_id, status=STATUS_PENDENTE)
+        .order_by(TarefaPdf.id.desc())
+        .first()
+    )
+    if tarefa:
+        tarefa.executar_apos = executar_apos
+        tarefa.evento = evento
+    else:
+        tarefa = TarefaPdf(relatorio_id=relatorio_id, evento=evento, executar_apos=executar_apos)
+        db.session.add(tarefa)
+
+    db.session.commit()
+    return tarefa
+
+
+def tarefa_para_dict(tarefa):
+    """Serializa a tarefa para a API de status"""
+    dados = {
+        'id': tarefa.id,
+        'relatorio_id': tarefa.relatorio_id,
+        'evento': tarefa.evento,
+        'status': tarefa.status,
+        'tentativas': tarefa.tentativas,
+        'versao_relatorio': tarefa.versao_relatorio,
+        'erro': tarefa.erro,
+        'created_at': tarefa.created_at.isoformat() if tarefa.created_at else None,
+        'concluido_em': tarefa.concluido_em.isoformat() if tarefa.concluido_em else None,
+        'status_url': url_for('pdf.status_tarefa', tarefa_id=tarefa.id),
+    }
+    if tarefa.status == STATUS_CONCLUIDA:
+        dados['download_url'] = url_for('pdf.download_tarefa', tarefa_id=tarefa.id)
+    return dados
+
+
+# ============================================================================
+# API
+# ============================================================================
+
+@pdf_bp.route('/relatorio/<int:relatorio_id>', methods=['POST'])
+@login_required
+def submeter_tarefa(relatorio_id):
+    """Enfileira a geração imediata do PDF de um relatório"""
+    if not db.session.get(Relatorio, relatorio_id):
+        abort(404)
+    tarefa = enfileirar_pdf(relatorio_id, evento='MANUAL', atraso=0)
+    return jsonify(tarefa_para_dict(tarefa)), 202
+
+
+@pdf_bp.route('/tarefas/<int:tarefa_id>')
+@login_required
+def status_tarefa(tarefa_id):
+    """Status de uma tarefa de geração de PDF"""
+    tarefa = db.get_or_404(TarefaPdf, tarefa_id)
+    return jsonify(tarefa_para_dict(tarefa))
+
+
+@pdf_bp.route('/tarefas/<int:tarefa_id>/download')
+@login_required
+def download_tarefa(tarefa_id):
+    """Download do PDF gerado por uma tarefa concluída"""
+    tarefa = db.get_or_404(TarefaPdf, tarefa_id)
+    if tarefa.status != STATUS_CONCLUIDA or not tarefa.arquivo:
+        return jsonify(error="PDF ainda não disponível", status=tarefa.status), 409
+    return enviar_pdf(tarefa.arquivo)
+
+
+# ============================================================================
+# EXECUÇÃO (pdf_worker.py)
+# ============================================================================
+
+def recuperar_tarefas_interrompidas():
+    """Devolve à fila as tarefas que ficaram 'processando' (worker reiniciado)"""
+    total = TarefaPdf.query.filter_by(status=STATUS_PROCESSANDO).update(
+        {'status': STATUS_PENDENTE}, synchronize_session=False
+    )
+    db.session.commit()
+    return total
+
+
+def reivindicar_tarefas(limite):
+    """
+    Marca como 'processando' até `limite` tarefas pendentes vencidas
+
+    O UPDATE condicionado ao status garante que cada tarefa seja
+    reivindicada por um único worker.
+
+    Returns:
+        list: IDs das tarefas reivindicadas
+    """
+    if limite <= 0:
+        return []
+
+    agora = datetime.utcnow()
+    candidatas = (
+        db.session.query(TarefaPdf.id)
+        .filter(TarefaPdf.status == STATUS_PENDENTE, TarefaPdf.executar_apos <= agora)
+        .order_by(TarefaPdf.executar_apos)
+        .limit(limite)
+        .all()
+    )
+
+    reivindicadas = []
+    for (tarefa_id,) in candidatas:
+        resultado = db.session.execute(
+            update(TarefaPdf)
+            .where(TarefaPdf.id == tarefa_id, TarefaPdf.status == STATUS_PENDENTE)
+            .values(status=STATUS_PROCESSANDO, iniciado_em=agora, tentativas=TarefaPdf.tentativas + 1)
+        )
+        if resultado.rowcount == 1:
+            reivindicadas.append(tarefa_id)
+    db.session.commit()
+    return reivindicadas
+
+
+def executar_tarefa(tarefa_id):
+    """
+    Renderiza o PDF de uma tarefa reivindicada (executa no processo do pool)
+
+    Em caso de falha a tarefa volta para a fila com backoff até
+    PDF_MAX_TENTATIVAS; depois disso fica com status 'erro'.
+
+    Returns:
+        str: Status final da tarefa
+    """
+    from pdf_render import gerar_pdf
+
+    tarefa = db.session.get(TarefaPdf, tarefa_id)
+    if tarefa is None:
+        return None
+    status = None
+
+    try:
+        relatorio, arquivo, _ = gerar_pdf(tarefa.relatorio_id)
+
+        tarefa.status = STATUS_CONCLUIDA
+        tarefa.arquivo = arquivo
+        tarefa.versao_relatorio = relatorio['versao']
+        tarefa.erro = None
+        tarefa.concluido_em = datetime.utcnow()
+        status = tarefa.status
+        db.session.commit()
+        logger.info(f"PDF gerado: {arquivo} (tarefa {tarefa_id})")
+
+    except Exception as e:
+        db.session.rollback()
+        tarefa = db.session.get(TarefaPdf, tarefa_id)
+        tarefa.erro = str(e)
+        if tarefa.tentativas < current_app.config['PDF_MAX_TENTATIVAS']:
+            tarefa.status = STATUS_PENDENTE
+            tarefa.executar_apos = datetime.utcnow() + timedelta(seconds=30 * tarefa.tentativas)
+        else:
+            tarefa.status = STATUS_ERRO
+        status = tarefa.status
+        db.session.commit()
+        logger.error(f"Erro ao gerar PDF (tarefa {tarefa_id}): {e}")
+
+    finally:
+        db.session.remove()
+
+    return status
@@ -0,0 +1,288 @@
+"""
+Renderização de PDFs de relatórios (WeasyPrint)
+Usada tanto pela rota relatorio_pdf quanto pelos processos de pdf_worker.py
+
+Os PDFs gerados são gravados no cache endereçado por conteúdo (pdf_cache).
+Os recursos caros do WeasyPrint (CSS pré-processado, configuração de fontes e
+fetcher de arquivos locais) são criados uma vez por processo em ContextoPdf.
+
+O PDF é montado por seções (capa e uma por referência), renderizadas sem
+numeração de páginas e cacheadas individualmente (secoes_cache). Após a
+mescla, cada página recebe a numeração "Página X de Y" de um PDF de
+numeração, também cacheado por total de páginas.
+"""
+import os
+import logging
+import mimetypes
+import threading
+from io import BytesIO
+from datetime import datetime
+from urllib.parse import urlsplit, unquote
+from urllib.request import url2pathname
+from flask import current_app, render_template, request, has_request_context
+from werkzeug.security import safe_join
+from werkzeug.utils import secure_filename
+from weasyprint import HTML, CSS
+from weasyprint.text.fonts import FontConfiguration
+from weasyprint.urls import URLFetcher, URLFetcherResponse
+from report_tree import carregar_arvore_relatorio
+from pypdf import PdfReader, PdfWriter
+from pdf_cache import (
+    pdf_cache, secoes_cache, chave_pdf, chave_secao_capa, chave_secao_referencia,
+    versao_template, CSS_PDF
+)
+from image_derivatives import caminho_impressao
+from storage_backends import armazenamento
+
+logger = logging.getLogger(__name__)
+
+# Seções são renderizadas sem numeração; ela é aplicada depois da mescla
+CSS_SECAO = '@page { @bottom-center { content: none; } }'
+
+
+def nome_download_pdf(relatorio):
+    """Nome sugerido para o download/exibição do PDF"""
+    return f"relatorio_{relatorio['id']}_{secure_filename(relatorio['descricao_geral'])}.pdf"
+
+
+# ============================================================================
+# CONTEXTO DE RENDERIZAÇÃO (um por processo)
+# ============================================================================
+
+class FetcherLocal(URLFetcher):
+    """
+    Fetcher do WeasyPrint que lê static/ e uploads/ direto do disco
+
+    URLs da própria aplicação (/static/..., /uploads/...) e file:// dentro
+    dessas pastas não geram requisições HTTP de volta para o app. Arquivos
+    file:// fora delas são recusados; demais URLs seguem o fetcher padrão.
+    pastas_extras permite file:// em outras pastas (cópias locais do S3).
+    """
+
+    def __init__(self, static_folder, static_url_path, upload_folder, pastas_extras=(), **kwargs):
+        super().__init__(**kwargs)
+        self.pastas = {
+            static_url_path.rstrip('/') + '/': os.path.realpath(static_folder),
+            '/uploads/': os.path.realpath(upload_folder),
+        }
+        self.pastas_arquivos = list(self.pastas.values()) + [os.path.realpath(p) for p in pastas_extras]
+
+    def _resolver(self, url):
+        """Caminho local do recurso, None se não for local"""
+        partes = urlsplit(url)
+        if partes.scheme == 'file':
+            caminho = os.path.realpath(url2pathname(partes.path))
+            for pasta in self.pastas_arquivos:
+                if os.path.commonpath([caminho, pasta]) == pasta:
+                    return caminho
+            raise ValueError(f'Arquivo fora das pastas permitidas: {url}')
+
+        if partes.scheme in ('http', 'https'):
+            caminho = unquote(partes.path)
+            for prefixo, pasta in self.pastas.items():
+                if caminho.startswith(prefixo):
+                    local = safe_join(pasta, caminho[len(prefixo):])
+                    if local is None:
+                        raise ValueError(f'Caminho inválido: {url}')
+                    return local
+        return None
+
+    def fetch(self, url, headers=None):
+        caminho = self._resolver(url)
+        if caminho is None:
+            return super().fetch(url, headers)
+
+        with open(caminho, 'rb') as f:
+            conteudo = f.read()
+        mime_type = mimetypes.guess_type(caminho)[0] or 'application/octet-stream'
+        return URLFetcherResponse(url, conteudo, {'Content-Type': mime_type})
+
+
+class ContextoPdf:
+    """Recursos do WeasyPrint compartilhados entre renderizações do processo"""
+
+    def __init__(self, app):
+        self.font_config = FontConfiguration()
+        self.url_fetcher = FetcherLocal(app.static_folder, app.static_url_path,
+                                        app.config['UPLOAD_FOLDER'],
+                                        pastas_extras=[armazenamento(app).pasta_local])
+        self.stylesheets = [
+            CSS(filename=os.path.join(app.static_folder, CSS_PDF),
+                font_config=self.font_config, url_fetcher=self.url_fetcher),
+        ]
+        self.stylesheets_secao = self.stylesheets + [
+            CSS(string=CSS_SECAO, font_config=self.font_config),
+        ]
+        self.pid = os.getpid()
+
+    def renderizar(self, html_string, base_url, secao=False):
+        """Renderiza o HTML com o CSS e as fontes pré-carregados"""
+        return HTML(string=html_string, base_url=base_url, url_fetcher=self.url_fetcher).write_pdf(
+            stylesheets=self.stylesheets_secao if secao else self.stylesheets,
+            font_config=self.font_config
+        )
+
+
+_contexto = None
+_contexto_lock = threading.Lock()
+
+
+def obter_contexto():
+    """
+    Retorna o ContextoPdf do processo atual, criando-o na primeira chamada
+
+    Um contexto herdado por fork é descartado: a configuração de fontes
+    não deve ser compartilhada entre processos.
+    """
+    global _contexto
+    if _contexto is None or _contexto.pid != os.getpid():
+        with _contexto_lock:
+            if _contexto is None or _contexto.pid != os.getpid():
+                _contexto = ContextoPdf(current_app._get_current_object())
+    return _contexto
+
+
+def aquecer(app):
+    """
+    Prepara o contexto de renderização do processo (worker do Gunicorn/PDF)
+
+    Além de pré-processar o CSS, renderiza um documento mínimo para carregar
+    as fontes e o layout do WeasyPrint antes da primeira requisição real.
+    """
+    inicio = datetime.now()
+    try:
+        with app.app_context():
+            contexto = obter_contexto()
+            contexto.renderizar('<p class="pdf-header">Puket</p>', app.config['PDF_BASE_URL'])
+        logger.info(f"Contexto de PDF aquecido em {(datetime.now() - inicio).total_seconds():.2f}s (pid {os.getpid()})")
+    except Exception as e:
+        logger.warning(f"Erro ao aquecer contexto de PDF: {e}")
+
+
+_contexto_processo = None
+
+
+def inicializar_processo():
+    """
+    Inicializador de processos de um pool de renderização (pdf_worker, lotes)
+
+    Carrega o app, mantém um contexto de aplicação ativo durante toda a vida
+    do processo e aquece o contexto de PDF.
+    """
+    global _contexto_processo
+    from app import app
+    _contexto_processo = app.app_context()
+    _contexto_processo.push()
+    aquecer(app)
+
+
+# ============================================================================
+# RENDERIZAÇÃO
+# ============================================================================
+
+def _renderizar_secao(relatorio, referencias, secoes, capa, final):
+    html_string = render_template('relatorio_pdf.html',
+                                  relatorio=relatorio,
+                                  referencias=referencias,
+                                  secoes=secoes,
+                                  capa=capa,
+                                  final=final,
+                                  caminho_impressao=caminho_impressao,
+                                  now=datetime.now)
+
+    return obter_contexto().renderizar(html_string, request.url_root, secao=True)
+
+
+def _secao(chave, renderizar):
+    """Caminho da seção em cache, renderizando-a se necessário"""
+    arquivo = secoes_cache.obter(chave)
+    if arquivo is None:
+        arquivo = secoes_cache.guardar(chave, renderizar())
+    return secoes_cache.caminho(arquivo)
+
+
+def _numeracao(total_paginas):
+    """
+    PDF com apenas a numeração "Página X de Y" de um documento com Y páginas
+
+    Renderizado com a mesma folha de estilos (mesmo @page) e cacheado por total.
+    """
+    def renderizar():
+        paginas = '<div style="page-break-after: always"></div>' * (total_paginas - 1) + '<div></div>'
+        return obter_contexto().renderizar(f'<html><body>{paginas}</body></html>', request.url_root)
+
+    return _secao(f"numeracao-{total_paginas}-{versao_template()}", renderizar)
+
+
+def _mesclar(caminhos):
+    """Mescla as seções e aplica a numeração de páginas sobre o resultado"""
+    writer = PdfWriter()
+    for caminho in caminhos:
+        writer.append(caminho)
+
+    numeracao = PdfReader(_numeracao(len(writer.pages)))
+    for pagina, pagina_numeracao in zip(writer.pages, numeracao.pages):
+        pagina.merge_page(pagina_numeracao)
+
+    saida = BytesIO()
+    writer.write(saida)
+    writer.close()
+    return saida.getvalue()
+
+
+def _renderizar(relatorio, referencias):
+    caminhos = [_secao(
+        chave_secao_capa(relatorio, referencias, final=not referencias),
+        lambda: _renderizar_secao(relatorio, referencias, [], capa=True, final=not referencias),
+    )]
+
+    for indice, ref in enumerate(referencias):
+        final = indice == len(referencias) - 1
+        caminhos.append(_secao(
+            chave_secao_referencia(ref, final),
+            lambda: _renderizar_secao(relatorio, [], [ref], capa=False, final=final),
+        ))
+
+    return _mesclar(caminhos)
+
+
+def renderizar_pdf(relatorio, referencias):
+    """
+    Renderiza o PDF de um relatório a partir das seções em cache
+
+    Só as seções alteradas (capa ou referências) são renderizadas de novo.
+    Fora de uma requisição (worker de PDF) cria um contexto de requisição com
+    PDF_BASE_URL, necessário para url_for no template; as URLs resultantes são
+    lidas do disco pelo FetcherLocal.
+
+    Args:
+        relatorio: Dicionário do relatório (carregar_arvore_relatorio)
+        referencias: Lista referencias_completas
+
+    Returns:
+        bytes: Conteúdo do PDF
+    """
+    if has_request_context():
+        return _renderizar(relatorio, referencias)
+
+    with current_app.test_request_context(base_url=current_app.config['PDF_BASE_URL']):
+        return _renderizar(relatorio, referencias)
+
+
+def gerar_pdf(relatorio_id):
+    """
+    Retorna o PDF do relatório a partir do cache, renderizando se necessário
+
+    Args:
+        relatorio_id: ID do relatório
+
+    Returns:
+        tuple: (dicionário do relatório, nome do arquivo em PDF_FOLDER, chave/ETag)
+    """
+    relatorio, referencias = carregar_arvore_relatorio(relatorio_id)
+    chave = chave_pdf(relatorio, referencias)
+
+    arquivo = pdf_cache.obter(chave)
+    if arquivo is None:
+        arquivo = pdf_cache.guardar(chave, renderizar_pdf(relatorio, referencias))
+    return relatorio, arquivo, chave
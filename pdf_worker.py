@@ -0,0 +1,78 @@
+"""
+Worker de geração de PDFs
+Processa a fila tarefas_pdf em um pool de processos limitado (PDF_WORKERS),
+fora dos workers web do Gunicorn.
+
+Uso:
+    python pdf_worker.py
+"""
+import os
+import time
+import signal
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from dotenv import load_dotenv
+
+# Carregar variáveis de ambiente de produção
+env_file = os.getenv('ENV_FILE', '.env.production')
+load_dotenv(env_file)
+
+logger = logging.getLogger('pdf_worker')
+
+# Intervalo entre consultas à fila (segundos)
+INTERVALO_POLLING = float(os.getenv('PDF_WORKER_INTERVALO', 2))
+
+def _inicializar_processo():
+    from pdf_render import inicializar_processo
+    inicializar_processo()
+
+
+def _executar(tarefa_id):
+    from pdf_jobs import executar_tarefa
+    return executar_tarefa(tarefa_id)
+
+
+def main():
+    from app import app
+    from pdf_jobs import recuperar_tarefas_interrompidas, reivindicar_tarefas
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    max_processos = app.config['PDF_WORKERS']
+    executando = set()
+    parar = False
+
+    def encerrar(signum, frame):
+        nonlocal parar
+        logger.info("Encerrando worker de PDF...")
+        parar = True
+
+    signal.signal(signal.SIGTERM, encerrar)
+    signal.signal(signal.SIGINT, encerrar)
+
+    with app.app_context():
+        recuperadas = recuperar_tarefas_interrompidas()
+        if recuperadas:
+            logger.info(f"{recuperadas} tarefas interrompidas devolvidas à fila")
+
+    # 'spawn' evita herdar conexões de banco abertas no processo principal
+    with ProcessPoolExecutor(max_workers=max_processos,
+                             mp_context=multiprocessing.get_context('spawn'),
+                             initializer=_inicializar_processo) as pool:
+        logger.info(f"Worker de PDF iniciado com {max_processos} processos")
+
+        while not parar:
+            executando = {f for f in executando if not f.done()}
+
+            with app.app_context():
+                tarefas = reivindicar_tarefas(max_processos - len(executando))
+
+            for tarefa_id in tarefas:
+                executando.add(pool.submit(_executar, tarefa_id))
+
+            time.sleep(INTERVALO_POLLING)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,386 @@
+"""
+Ingestão em lote de fotos por pasta monitorada (INGESTAO_PASTA)
+Executada por scripts/management/ingerir_fotos.py (serviço contínuo ou cron)
+
+A equipe copia as fotos da sessão para a pasta com nomes no padrão
+
+    <numero_ref>_P<numero_prova>_<contexto>[_<tamanho>][_<sequência>].<extensão>
+
+ex.: 12345_P2_qualidade_01.jpg, 12345_P1_amostra_M_03.jpg. Os contextos são
+os do formulário (CONTEXTOS_FOTO); amostra e prova_modelo exigem o tamanho.
+
+Cada ciclo:
+- considera só arquivos sem alteração há INGESTAO_ESTABILIDADE_SEGUNDOS (cópia concluída);
+- interpreta os nomes e localiza as provas em um índice em memória
+  (numero_ref + numero_prova -> prova), carregado com uma consulta;
+- valida, grava no armazenamento e gera os derivados em um pool de threads;
+- insere as FotoProva em transações de INGESTAO_LOTE arquivos, ignorando
+  fotos que a prova já tem (mesmo conteúdo, contexto e tamanho).
+
+Os arquivos importados vão para processadas/<data>/ e os recusados para
+rejeitadas/<data>/, com o motivo em <arquivo>.erro.txt. Falhas ao gravar
+(armazenamento, derivados) deixam o arquivo na pasta e são contadas em
+.<arquivo>.tentativas: a próxima tentativa espera INGESTAO_ESPERA_SEGUNDOS,
+dobrando a cada falha, e após INGESTAO_MAX_TENTATIVAS o arquivo vai para
+rejeitadas/. Falhas no banco não contam (o lote inteiro é refeito no próximo
+ciclo). O resultado de cada arquivo também é gravado em
+relatorios/ingestao-<data-hora>.csv.
+"""
+import os
+import csv
+import time
+import logging
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from flask import current_app
+from PIL import Image
+from sqlalchemy import select
+from models import db, Relatorio, Referencia, ProvaModelagem, FotoProva
+from upload_store import gravar_stream, UploadInvalido
+from image_derivatives import gerar_derivados, EXTENSOES_IMAGEM
+
+logger = logging.getLogger(__name__)
+
+# Contextos aceitos no nome do arquivo (os mesmos do formulário)
+CONTEXTOS_FOTO = ('desenho', 'qualidade', 'estilo', 'modelagem', 'amostra', 'prova_modelo')
+CONTEXTOS_COM_TAMANHO = ('amostra', 'prova_modelo')
+
+# Subpastas da pasta monitorada
+PASTA_PROCESSADAS = 'processadas'
+PASTA_REJEITADAS = 'rejeitadas'
+PASTA_RELATORIOS = 'relatorios'
+
+# Situação de cada arquivo no relatório
+IMPORTADA = 'importada'
+DUPLICADA = 'duplicada'
+REJEITADA = 'rejeitada'
+ERRO = 'erro'
+
+
+class ArquivoRecusado(ValueError):
+    """Arquivo que não pode ser importado; a mensagem vai para o relatório"""
+
+
+def _normalizar_ref(numero_ref):
+    return numero_ref.strip().upper()
+
+
+def interpretar_nome(filename):
+    """
+    Extrai referência, prova, contexto e tamanho do nome do arquivo
+
+    Returns:
+        dict: {'numero_ref', 'numero_prova', 'contexto', 'tamanho'}
+
+    Raises:
+        ArquivoRecusado: Nome fora do padrão
+    """
+    partes = os.path.splitext(filename)[0].split('_')
+    posicao = next((i for i, parte in enumerate(partes)
+                    if i > 0 and len(parte) > 1 and parte[0] in 'pP' and parte[1:].isdigit()), None)
+    if posicao is None:
+        raise ArquivoRecusado('Nome fora do padrão <referência>_P<prova>_<contexto>[_<tamanho>]')
+
+    restante = [parte.lower() for parte in partes[posicao + 1:]]
+    if restante[:2] == ['prova', 'modelo']:
+        contexto, restante = 'prova_modelo', restante[2:]
+    elif restante and restante[0] in CONTEXTOS_FOTO:
+        contexto, restante = restante[0], restante[1:]
+    else:
+        raise ArquivoRecusado(f'Contexto inválido; use um de: {", ".join(CONTEXTOS_FOTO)}')
+
+    tamanho = None
+    if contexto in CONTEXTOS_COM_TAMANHO:
+        if not restante:
+            raise ArquivoRecusado(f'O contexto {contexto} exige o tamanho no nome')
+        tamanho = partes[len(partes) - len(restante)]  # Grafia original
+        restante = restante[1:]
+    # O que sobra é só a numeração das fotos
+    if len(restante) > 1 or (restante and not restante[0].isdigit()):
+        raise ArquivoRecusado('Nome fora do padrão <referência>_P<prova>_<contexto>[_<tamanho>]')
+
+    return {
+        'numero_ref': _normalizar_ref('_'.join(partes[:posicao])),
+        'numero_prova': int(partes[posicao][1:]),
+        'contexto': contexto,
+        'tamanho': tamanho,
+    }
+
+
+class IndiceProvas:
+    """
+    Provas ativas por (numero_ref normalizado, numero_prova), carregadas com uma consulta
+
+    Um numero_ref pode existir em mais de um relatório; a foto só é
+    associada se a combinação referência + prova for única.
+    """
+
+    def __init__(self):
+        self._provas = {}
+
+    @classmethod
+    def carregar(cls):
+        indice = cls()
+        consulta = (
+            select(Referencia.numero_ref, ProvaModelagem.numero_prova, ProvaModelagem.id,
+                   ProvaModelagem.tamanhos_recebidos)
+            .join(ProvaModelagem, ProvaModelagem.referencia_id == Referencia.id)
+            .join(Relatorio, Referencia.relatorio_id == Relatorio.id)
+            .where(Referencia.numero_ref.isnot(None),
+                   Relatorio.is_active.isnot(False),
+                   Referencia.is_active.isnot(False),
+                   ProvaModelagem.is_active.isnot(False))
+            .execution_options(yield_per=1000)
+        )
+        for numero_ref, numero_prova, prova_id, tamanhos in db.session.execute(consulta):
+            lista = [t.strip() for t in (tamanhos or '').split(',') if t.strip()]
+            indice._provas.setdefault((_normalizar_ref(numero_ref), numero_prova), []).append((prova_id, lista))
+        return indice
+
+    def localizar(self, dados):
+        """
+        Prova e tamanho (na grafia cadastrada) de um arquivo interpretado
+
+        Returns:
+            tuple: (prova_id, tamanho)
+
+        Raises:
+            ArquivoRecusado: Prova inexistente, ambígua ou tamanho não recebido
+        """
+        chave = (dados['numero_ref'], dados['numero_prova'])
+        provas = self._provas.get(chave, [])
+        if not provas:
+            raise ArquivoRecusado(f"Prova {dados['numero_prova']} da referência {dados['numero_ref']} não encontrada")
+        if len(provas) > 1:
+            raise ArquivoRecusado(f"Referência {dados['numero_ref']} existe em mais de um relatório")
+
+        prova_id, tamanhos = provas[0]
+        tamanho = dados['tamanho']
+        if tamanho is not None and tamanhos:
+            cadastrado = next((t for t in tamanhos if t.upper() == tamanho.upper()), None)
+            if cadastrado is None:
+                raise ArquivoRecusado(f"Tamanho {tamanho} não foi recebido na prova (recebidos: {', '.join(tamanhos)})")
+            tamanho = cadastrado
+        return prova_id, tamanho
+
+
+def _arquivos_prontos(pasta, limite):
+    """Arquivos da raiz da pasta cuja cópia terminou (mtime anterior ao limite), em ordem de nome"""
+    prontos = []
+    with os.scandir(pasta) as entradas:
+        for entrada in entradas:
+            if entrada.name.startswith('.') or not entrada.is_file(follow_symlinks=False):
+                continue
+            if entrada.stat(follow_symlinks=False).st_mtime < limite:
+                prontos.append(entrada.name)
+    return sorted(prontos)
+
+
+def _caminho_tentativas(pasta, arquivo):
+    return os.path.join(pasta, f".{arquivo}.tentativas")
+
+
+def _tentativas(pasta, arquivo):
+    """(falhas anteriores, instante da última) do arquivo; (0, None) se nunca falhou"""
+    caminho = _caminho_tentativas(pasta, arquivo)
+    try:
+        with open(caminho, encoding='utf-8') as f:
+            return int(f.read().strip() or 0), os.stat(caminho).st_mtime
+    except (OSError, ValueError):
+        return 0, None
+
+
+def _limpar_tentativas(pasta, arquivo):
+    try:
+        os.remove(_caminho_tentativas(pasta, arquivo))
+    except FileNotFoundError:
+        pass
+
+
+def _limpar_tentativas_orfas(pasta):
+    """Remove contadores de arquivos que saíram da pasta por fora do serviço"""
+    with os.scandir(pasta) as entradas:
+        nomes = {entrada.name for entrada in entradas}
+    for nome in nomes:
+        if nome.startswith('.') and nome.endswith('.tentativas') and nome[1:-len('.tentativas')] not in nomes:
+            _limpar_tentativas(pasta, nome[1:-len('.tentativas')])
+
+
+def _aguardando_nova_tentativa(pasta, arquivo, espera_segundos, agora):
+    """True se o arquivo falhou e a espera (dobrada a cada falha) ainda não passou"""
+    falhas, ultima = _tentativas(pasta, arquivo)
+    return bool(falhas) and agora - ultima < espera_segundos * 2 ** (falhas - 1)
+
+
+def _registrar_falha(pasta, arquivo, erro, max_tentativas):
+    """Conta a falha; na última tentativa o arquivo é rejeitado"""
+    falhas = _tentativas(pasta, arquivo)[0] + 1
+    if falhas >= max_tentativas:
+        return _rejeitar(pasta, arquivo, f'{erro} (desistência após {falhas} tentativas)')
+    with open(_caminho_tentativas(pasta, arquivo), 'w', encoding='utf-8') as f:
+        f.write(f"{falhas}\n")
+    return {'arquivo': arquivo, 'situacao': ERRO, 'detalhe': f'{erro} (tentativa {falhas} de {max_tentativas})',
+            'foto_id': None}
+
+
+def _arquivar(pasta, subpasta, arquivo):
+    """Move o arquivo para <subpasta>/<data>/ sem sobrescrever um homônimo; retorna o destino"""
+    destino_pasta = os.path.join(pasta, subpasta, datetime.now().strftime('%Y-%m-%d'))
+    os.makedirs(destino_pasta, exist_ok=True)
+    destino = os.path.join(destino_pasta, arquivo)
+    if os.path.exists(destino):
+        raiz, extensao = os.path.splitext(arquivo)
+        destino = os.path.join(destino_pasta, f"{raiz}-{datetime.now().strftime('%H%M%S%f')}{extensao}")
+    os.replace(os.path.join(pasta, arquivo), destino)
+    _limpar_tentativas(pasta, arquivo)
+    return destino
+
+
+def _rejeitar(pasta, arquivo, motivo):
+    try:
+        destino = _arquivar(pasta, PASTA_REJEITADAS, arquivo)
+        with open(f"{destino}.erro.txt", 'w', encoding='utf-8') as f:
+            f.write(motivo + '\n')
+    except OSError as e:
+        logger.warning(f"Erro ao mover {arquivo} para {PASTA_REJEITADAS}: {e}")
+    return {'arquivo': arquivo, 'situacao': REJEITADA, 'detalhe': motivo, 'foto_id': None}
+
+
+def _gravar(app, caminho, arquivo, max_bytes):
+    """Valida a imagem, grava no armazenamento e gera os derivados (thread do pool)"""
+    with app.app_context():
+        try:
+            with Image.open(caminho) as imagem:
+                imagem.verify()
+        except Exception as e:
+            raise ArquivoRecusado(f'Imagem inválida ou incompleta: {e}')
+        with open(caminho, 'rb') as origem:
+            try:
+                nome = gravar_stream(origem, arquivo, max_bytes)
+            except UploadInvalido as e:
+                raise ArquivoRecusado(str(e))
+        gerar_derivados(nome)
+        return nome
+
+
+def _inserir_lote(pasta, itens, resultados):
+    """
+    Insere as fotos de um lote em uma transação e arquiva os arquivos importados
+
+    Args:
+        itens: [(arquivo, contexto, prova_id, tamanho, nome no armazenamento)]
+    """
+    existentes = set(db.session.execute(
+        select(FotoProva.prova_id, FotoProva.contexto, FotoProva.tamanho, FotoProva.file_path)
+        .where(FotoProva.prova_id.in_({item[2] for item in itens}),
+               FotoProva.file_path.in_({item[4] for item in itens}))
+    ).all())
+
+    fotos = []
+    duplicadas = []
+    for arquivo, contexto, prova_id, tamanho, nome in itens:
+        chave = (prova_id, contexto, tamanho, nome)
+        if chave in existentes:
+            duplicadas.append(arquivo)
+            continue
+        existentes.add(chave)
+        foto = FotoProva(prova_id=prova_id, contexto=contexto, tamanho=tamanho, file_path=nome)
+        db.session.add(foto)
+        fotos.append((arquivo, foto))
+
+    try:
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Erro ao inserir lote de fotos: {e}")
+        for arquivo, _ in fotos:
+            resultados.append({'arquivo': arquivo, 'situacao': ERRO, 'detalhe': f'Erro no banco: {e}', 'foto_id': None})
+        fotos = []
+
+    for arquivo, foto in fotos:
+        resultados.append({'arquivo': arquivo, 'situacao': IMPORTADA, 'detalhe': '', 'foto_id': foto.id})
+    for arquivo in duplicadas:
+        resultados.append({'arquivo': arquivo, 'situacao': DUPLICADA,
+                           'detalhe': 'A prova já tem esta foto', 'foto_id': None})
+    for arquivo in [arquivo for arquivo, _ in fotos] + duplicadas:
+        try:
+            _arquivar(pasta, PASTA_PROCESSADAS, arquivo)
+        except OSError as e:
+            logger.warning(f"Erro ao mover {arquivo} para {PASTA_PROCESSADAS}: {e}")
+
+
+def _gravar_relatorio(pasta, resultados):
+    """Grava o resultado de cada arquivo em relatorios/ingestao-<data-hora>.csv"""
+    destino_pasta = os.path.join(pasta, PASTA_RELATORIOS)
+    os.makedirs(destino_pasta, exist_ok=True)
+    caminho = os.path.join(destino_pasta, f"ingestao-{datetime.now().strftime('%Y%m%d-%H%M%S')}.csv")
+    with open(caminho, 'w', newline='', encoding='utf-8') as f:
+        escritor = csv.DictWriter(f, fieldnames=['arquivo', 'situacao', 'detalhe', 'foto_id'])
+        escritor.writeheader()
+        escritor.writerows(resultados)
+    return caminho
+
+
+def ingerir_pasta(pasta=None, lote=None, estabilidade_segundos=None):
+    """
+    Importa as fotos prontas da pasta monitorada (um ciclo)
+
+    Args:
+        pasta: Pasta monitorada (padrão: INGESTAO_PASTA)
+        lote: Fotos por transação (padrão: INGESTAO_LOTE)
+        estabilidade_segundos: Idade mínima do arquivo (padrão: INGESTAO_ESTABILIDADE_SEGUNDOS)
+
+    Returns:
+        list: [{'arquivo', 'situacao', 'detalhe', 'foto_id'}] na ordem dos nomes
+    """
+    config = current_app.config
+    pasta = pasta or config['INGESTAO_PASTA']
+    lote = lote or config['INGESTAO_LOTE']
+    if estabilidade_segundos is None:
+        estabilidade_segundos = config['INGESTAO_ESTABILIDADE_SEGUNDOS']
+
+    os.makedirs(pasta, exist_ok=True)
+    _limpar_tentativas_orfas(pasta)
+    agora = time.time()
+    arquivos = [arquivo for arquivo in _arquivos_prontos(pasta, agora - estabilidade_segundos)
+                if not _aguardando_nova_tentativa(pasta, arquivo, config['INGESTAO_ESPERA_SEGUNDOS'], agora)]
+    if not arquivos:
+        return []
+
+    resultados = []
+    aceitos = []
+    indice = IndiceProvas.carregar()
+    for arquivo in arquivos:
+        try:
+            if not arquivo.lower().endswith(EXTENSOES_IMAGEM):
+                raise ArquivoRecusado(f'Tipo de arquivo não é imagem; use: {", ".join(EXTENSOES_IMAGEM)}')
+            dados = interpretar_nome(arquivo)
+            prova_id, tamanho = indice.localizar(dados)
+        except ArquivoRecusado as e:
+            resultados.append(_rejeitar(pasta, arquivo, str(e)))
+            continue
+        aceitos.append((arquivo, dados['contexto'], prova_id, tamanho))
+
+    app = current_app._get_current_object()
+    max_bytes = config['UPLOAD_MAX_MB'] * 1024 * 1024
+    with ThreadPoolExecutor(max_workers=config['UPLOAD_THREADS'], thread_name_prefix='ingestao') as pool:
+        futuros = [pool.submit(_gravar, app, os.path.join(pasta, item[0]), item[0], max_bytes) for item in aceitos]
+        for inicio in range(0, len(aceitos), lote):
+            itens = []
+            for item, futuro in zip(aceitos[inicio:inicio + lote], futuros[inicio:inicio + lote]):
+                try:
+                    itens.append(item + (futuro.result(),))
+                except ArquivoRecusado as e:
+                    resultados.append(_rejeitar(pasta, item[0], str(e)))
+                except Exception as e:
+                    logger.error(f"Erro ao gravar {item[0]}: {e}")
+                    resultados.append(_registrar_falha(pasta, item[0], str(e), config['INGESTAO_MAX_TENTATIVAS']))
+            if itens:
+                _inserir_lote(pasta, itens, resultados)
+
+    resultados.sort(key=lambda resultado: resultado['arquivo'])
+    try:
+        _gravar_relatorio(pasta, resultados)
+    except OSError as e:
+        logger.warning(f"Erro ao gravar o relatório da ingestão: {e}")
+    return resultados
@@ -0,0 +1,176 @@
+"""
+Aplicação do formulário de edição de relatório (rota editar_relatorio)
+
+Referências e provas enviadas são carregadas de uma vez (uma query IN por
+nível) e só os campos que diferem do estado atual são atribuídos; um
+formulário reenviado sem mudanças não gera escrita nenhuma.
+
+Cada card de referência/prova envia a versão carregada (versao_ref_<id> e
+versao_<id>). Se a linha mudou desde então (outra pessoa ou o salvamento
+automático de outra aba) e o formulário traz valores diferentes dos atuais, o
+card é recusado como conflito em vez de sobrescrever a alteração mais nova.
+"""
+from models import db, Referencia, Prova, Foto
+from utils import aplicar_alteracoes, campos_diferentes
+from field_updates import CAMPOS_REFERENCIA, CAMPOS_PROVA
+
+
+def _versao_enviada(form, campo):
+    valor = form.get(campo) or ''
+    return int(valor) if valor.isdigit() else None
+
+
+def _aplicar_versionado(obj, valores, versao):
+    """
+    aplicar_alteracoes com verificação da versão enviada pelo formulário
+
+    Returns:
+        list: Atributos alterados, ou None em conflito (nada é atribuído)
+    """
+    if versao is not None and versao != obj.versao and campos_diferentes(obj, valores):
+        return None
+    return aplicar_alteracoes(obj, valores)
+
+
+def aplicar_formulario(relatorio, form, files, lote):
+    """
+    Aplica o formulário de edição na sessão (sem commit)
+
+    Args:
+        relatorio: Relatório editado
+        form: request.form
+        files: request.files
+        lote: LoteUploads que recebe os arquivos do formulário
+
+    Returns:
+        tuple: (True se algum registro foi alterado ou criado (uploads à
+        parte), lista com a descrição dos cards recusados por conflito)
+    """
+    conflitos = []
+    # 1. Atualiza as informações gerais do relatório (só campos alterados)
+    alterado = bool(aplicar_alteracoes(relatorio, {
+        'colecao': form.get('colecao'),
+        'descricao_geral': form.get('descricao_geral'),
+    }))
+
+    # Novo PPT, se enviado (o antigo é excluído pela view após o commit)
+    lote.adicionar(files.get('ppt'), relatorio, 'ppt_path')
+    lote.adicionar_sessao(form.get('ppt_upload_id'), relatorio, 'ppt_path')
+
+    # Referências e provas enviadas carregadas de uma vez (uma query IN cada)
+    tipos = [tipo for tipo in ['baby', 'kids', 'teen', 'adulto'] if form.get(f'ref_{tipo}')]
+    referencias_por_tipo = {}
+    for ref in (Referencia.query
+                .filter(Referencia.relatorio_id == relatorio.id, Referencia.tipo_categoria.in_(tipos))
+                .order_by(Referencia.id)):
+        referencias_por_tipo.setdefault(ref.tipo_categoria, ref)
+    ids_provas = {
+        int(prova_id)
+        for tipo in referencias_por_tipo
+        for prova_id in form.getlist(f'prova_id_{tipo}')
+        if prova_id.isdigit()
+    }
+    provas_por_id = {}
+    if ids_provas:
+        ids_referencias = [ref.id for ref in referencias_por_tipo.values()]
+        provas_por_id = {
+            prova.id: prova
+            for prova in Prova.query.filter(Prova.id.in_(ids_provas),
+                                            Prova.referencia_id.in_(ids_referencias))
+        }
+
+    # 2. Itera sobre os tipos enviados
+    for tipo in tipos:
+        ref_numero = form.get(f'ref_{tipo}')
+        ref_existente = referencias_por_tipo.get(tipo)
+
+        if ref_existente:
+            # --- ATUALIZAÇÃO ---
+            # Dados da referência (busca por ID específico ou por tipo)
+            valores_ref = {'numero_ref': ref_numero}
+            for campo in CAMPOS_REFERENCIA:
+                valores_ref[campo] = form.get(f'{campo}_ref_{ref_existente.id}') or form.get(f'{campo}_{tipo}')
+            alterados = _aplicar_versionado(ref_existente, valores_ref,
+                                            _versao_enviada(form, f'versao_ref_{ref_existente.id}'))
+            if alterados is None:
+                conflitos.append(f"Referência {ref_existente.numero_ref}")
+            elif alterados:
+                alterado = True
+
+            # Atualiza provas existentes
+            provas_existentes_ids = form.getlist(f'prova_id_{tipo}')
+            for prova_id in provas_existentes_ids:
+                prova = provas_por_id.get(int(prova_id)) if prova_id.isdigit() else None
+                if prova:
+                    valores_prova = {campo: form.get(f'{campo}_{prova_id}') for campo in CAMPOS_PROVA}
+                    valores_prova['tamanhos_recebidos'] = ", ".join(form.getlist(f'tamanhos_recebidos_{prova_id}'))
+                    alterados = _aplicar_versionado(prova, valores_prova, _versao_enviada(form, f'versao_{prova_id}'))
+                    if alterados is None:
+                        conflitos.append(f"{prova.numero_prova}ª prova da referência {ref_existente.numero_ref}")
+                    elif alterados:
+                        alterado = True
+
+                    # Adicionar fotos
+                    campos_fotos = ['desenho', 'qualidade', 'estilo', 'modelagem']
+                    for contexto in campos_fotos:
+                        for file in files.getlist(f'fotos_{contexto}_{prova_id}'):
+                            lote.adicionar(file, Foto(prova_id=prova.id, contexto=contexto), 'file_path')
+                    
+                    for tamanho in form.getlist(f'tamanhos_recebidos_{prova_id}'):
+                        for contexto in ['amostra', 'prova_modelo']:
+                            for file in files.getlist(f'fotos_{contexto}_{prova_id}_{tamanho.replace(" ", "")}'):
+                                lote.adicionar(file, Foto(prova_id=prova.id, contexto=contexto, tamanho=tamanho), 'file_path')
+
+        else:
+            # --- CRIAÇÃO ---
+            nova_ref = Referencia(
+                relatorio_id=relatorio.id,
+                tipo_categoria=tipo,
+                numero_ref=ref_numero,
+                origem=form.get(f'origem_{tipo}'),
+                fornecedor=form.get(f'fornecedor_{tipo}'),
+                materia_prima=form.get(f'materia_prima_{tipo}'),
+                composicao=form.get(f'composicao_{tipo}'),
+                gramatura=form.get(f'gramatura_{tipo}'),
+                aviamentos=form.get(f'aviamentos_{tipo}')
+            )
+            db.session.add(nova_ref)
+            db.session.flush() # Para obter o ID
+            alterado = True
+
+            nova_prova = Prova(
+                referencia_id=nova_ref.id,
+                numero_prova=1,
+                data_recebimento=form.get(f'data_recebimento_{tipo}'),
+                tamanhos_recebidos=", ".join(form.getlist(f'tamanhos_recebidos_{tipo}')),
+                info_medidas=form.get(f'info_medidas_{tipo}'),
+                data_prova=form.get(f'data_prova_{tipo}'),
+                time_qualidade=form.get(f'time_qualidade_{tipo}'),
+                comentarios_qualidade=form.get(f'comentarios_qualidade_{tipo}'),
+                obs_qualidade=form.get(f'obs_qualidade_{tipo}'),
+                time_estilo=form.get(f'time_estilo_{tipo}'),
+                comentarios_estilo=form.get(f'comentarios_estilo_{tipo}'),
+                obs_estilo=form.get(f'obs_estilo_{tipo}'),
+                time_modelagem=form.get(f'time_modelagem_{tipo}'),
+                comentarios_modelagem=form.get(f'comentarios_modelagem_{tipo}'),
+                obs_modelagem=form.get(f'obs_modelagem_{tipo}'),
+                data_lacre=form.get(f'data_lacre_{tipo}'),
+                numero_lacre=form.get(f'numero_lacre_{tipo}'),
+                info_adicionais=form.get(f'info_adicionais_{tipo}')
+            )
+            db.session.add(nova_prova)
+            lote.adicionar(files.get(f'tabela_medidas_{tipo}'), nova_prova, 'tabela_medidas_path')
+            lote.adicionar_sessao(form.get(f'tabela_medidas_{tipo}_upload_id'), nova_prova, 'tabela_medidas_path')
+            db.session.flush()
+            
+            campos_fotos = ['desenho', 'qualidade', 'estilo', 'modelagem']
+            for contexto in campos_fotos:
+                for file in files.getlist(f'fotos_{contexto}_{tipo}'):
+                    lote.adicionar(file, Foto(prova_id=nova_prova.id, contexto=contexto), 'file_path')
+
+            for tamanho in form.getlist(f'tamanhos_recebidos_{tipo}'):
+                for contexto in ['amostra', 'prova_modelo']:
+                    for file in files.getlist(f'fotos_{contexto}_{tipo}_{tamanho.replace(" ", "")}'):
+                        lote.adicionar(file, Foto(prova_id=nova_prova.id, contexto=contexto, tamanho=tamanho), 'file_path')
+
+    return alterado, conflitos
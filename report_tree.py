@@ -0,0 +1,234 @@
+"""
+Carregamento da árvore de um relatório
+Relatorio -> referencias -> provas -> fotos em número constante de queries
+
+Compartilhado por detalhes_relatorio, editar_relatorio (GET) e relatorio_pdf.
+A árvore serializada fica em cache por relatório, indexada por Relatorio.versao,
+que é incrementada a cada escrita no relatório ou em qualquer filho.
+"""
+import threading
+from collections import OrderedDict
+from flask import abort
+from sqlalchemy import select, update, event
+from sqlalchemy.orm import Session, selectinload
+from models import db, Relatorio, Referencia, ProvaModelagem, FotoProva
+from storage_backends import armazenamento
+
+
+def _colunas(obj):
+    """Serializa as colunas de um modelo em dicionário"""
+    return {c.name: getattr(obj, c.name) for c in obj.__table__.columns}
+
+
+def carregar_relatorio(relatorio_id):
+    """
+    Carrega o relatório com referências, provas e fotos (eager loading)
+
+    São 4 queries independentemente do tamanho do relatório: o relatório e um
+    SELECT ... IN por nível (referencias, provas, fotos).
+
+    Args:
+        relatorio_id: ID do relatório
+
+    Returns:
+        Relatorio (aborta com 404 se não existir)
+    """
+    return (
+        Relatorio.query
+        .options(
+            selectinload(Relatorio.referencias)
+            .selectinload(Referencia.provas)
+            .selectinload(ProvaModelagem.fotos)
+        )
+        .filter_by(id=relatorio_id)
+        .first_or_404()
+    )
+
+
+def montar_referencias(relatorio):
+    """
+    Monta a estrutura referencias_completas usada pelos templates
+
+    - Referências em ordem de criação (id)
+    - Provas ordenadas por numero_prova, com 'tamanhos_lista'
+    - Fotos agrupadas por contexto, com 'caminho_absoluto' (usado pelo PDF)
+
+    Args:
+        relatorio: Relatorio carregado por carregar_relatorio
+
+    Returns:
+        list: Dicionários de referência com a chave 'provas'
+    """
+    backend = armazenamento()
+
+    referencias_completas = []
+    for ref in sorted(relatorio.referencias, key=lambda r: r.id):
+        ref_dict = _colunas(ref)
+
+        provas_completas = []
+        for prova in sorted(ref.provas, key=lambda p: p.numero_prova):
+            prova_dict = _colunas(prova)
+            prova_dict['tamanhos_lista'] = [t.strip() for t in (prova.tamanhos_recebidos or '').split(',') if t.strip()]
+
+            prova_dict['fotos'] = {}
+            for foto in prova.fotos:
+                foto_dict = _colunas(foto)
+                foto_dict['caminho_absoluto'] = backend.caminho(foto.file_path)
+                prova_dict['fotos'].setdefault(foto.contexto, []).append(foto_dict)
+
+            provas_completas.append(prova_dict)
+
+        ref_dict['provas'] = provas_completas
+        referencias_completas.append(ref_dict)
+
+    return referencias_completas
+
+
+def carregar_arvore_relatorio(relatorio_id):
+    """
+    Retorna a árvore serializada do relatório, usando o cache quando válido
+
+    Em cache hit o custo é uma única query (a versão do relatório): não há
+    hidratação de ORM nem montagem de dicionários.
+
+    Args:
+        relatorio_id: ID do relatório
+
+    Returns:
+        tuple: (dicionário do relatório, lista referencias_completas)
+        Ambos são compartilhados pelo cache e não devem ser alterados.
+    """
+    versao = db.session.execute(
+        select(Relatorio.versao).where(Relatorio.id == relatorio_id)
+    ).first()
+    if versao is None:
+        abort(404)
+
+    arvore = arvore_cache.obter(relatorio_id, versao[0])
+    if arvore is not None:
+        return arvore
+
+    relatorio = carregar_relatorio(relatorio_id)
+    arvore = (_colunas(relatorio), montar_referencias(relatorio))
+    arvore_cache.guardar(relatorio_id, relatorio.versao, arvore)
+    return arvore
+
+
+# ============================================================================
+# CACHE VERSIONADO
+# ============================================================================
+
+class ArvoreCache:
+    """
+    Cache LRU (por worker) das árvores serializadas de relatórios
+
+    A chave de validade é Relatorio.versao, persistida no banco; por isso uma
+    escrita feita em qualquer worker invalida o cache de todos.
+    """
+
+    def __init__(self, max_itens=128):
+        self.max_itens = max_itens
+        self._lock = threading.Lock()
+        self._itens = OrderedDict()  # {relatorio_id: (versao, arvore)}
+
+    def init_app(self, app):
+        """Configura o tamanho do cache e registra os eventos de versão"""
+        self.max_itens = app.config.get('ARVORE_CACHE_MAX_ITENS', self.max_itens)
+        registrar_eventos_versao()
+
+    def obter(self, relatorio_id, versao):
+        """Retorna a árvore se a versão em cache for a atual, senão None"""
+        with self._lock:
+            item = self._itens.get(relatorio_id)
+            if item is None or item[0] != versao:
+                return None
+            self._itens.move_to_end(relatorio_id)
+            return item[1]
+
+    def guardar(self, relatorio_id, versao, arvore):
+        """Armazena a árvore, descartando os itens menos usados"""
+        with self._lock:
+            self._itens[relatorio_id] = (versao, arvore)
+            self._itens.move_to_end(relatorio_id)
+            while len(self._itens) > self.max_itens:
+                self._itens.popitem(last=False)
+
+    def limpar(self):
+        """Descarta todas as árvores em cache"""
+        with self._lock:
+            self._itens.clear()
+
+
+def _relatorios_alterados(session):
+    """
+    Resolve os IDs de relatórios afetados pelo flush
+
+    Relatórios e referências trazem o relatorio_id diretamente; provas e fotos
+    são resolvidas com uma query por nível (IN) na conexão da transação.
+    """
+    relatorios = set()
+    referencias = set()
+    provas = set()
+
+    alterados = list(session.new) + list(session.deleted) + [
+        obj for obj in session.dirty if session.is_modified(obj)
+    ]
+    for obj in alterados:
+        if isinstance(obj, Relatorio):
+            relatorios.add(obj.id)
+        elif isinstance(obj, Referencia):
+            relatorios.add(obj.relatorio_id)
+        elif isinstance(obj, ProvaModelagem):
+            referencias.add(obj.referencia_id)
+        elif isinstance(obj, FotoProva):
+            provas.add(obj.prova_id)
+
+    provas.discard(None)
+    if provas:
+        referencias.update(session.connection().execute(
+            select(ProvaModelagem.referencia_id).where(ProvaModelagem.id.in_(provas))
+        ).scalars())
+    referencias.discard(None)
+    if referencias:
+        relatorios.update(session.connection().execute(
+            select(Referencia.relatorio_id).where(Referencia.id.in_(referencias))
+        ).scalars())
+
+    relatorios.discard(None)
+    return relatorios
+
+
+def registrar_eventos_versao():
+    """
+    Registra os eventos que incrementam Relatorio.versao
+
+    O incremento roda em after_flush, na mesma transação da escrita; as
+    instâncias carregadas têm 'versao' expirada em after_flush_postexec.
+    """
+    if getattr(registrar_eventos_versao, '_registrado', False):
+        return
+    registrar_eventos_versao._registrado = True
+
+    @event.listens_for(Session, 'after_flush')
+    def incrementar_versao(session, flush_context):
+        relatorios = _relatorios_alterados(session)
+        if not relatorios:
+            return
+
+        session.connection().execute(
+            update(Relatorio)
+            .where(Relatorio.id.in_(relatorios))
+            .values(versao=Relatorio.versao + 1, updated_at=Relatorio.updated_at)
+        )
+        session.info.setdefault('versao_incrementada', set()).update(relatorios)
+
+    @event.listens_for(Session, 'after_flush_postexec')
+    def expirar_versao(session, flush_context):
+        for relatorio_id in session.info.pop('versao_incrementada', ()):
+            obj = session.identity_map.get(session.identity_key(Relatorio, relatorio_id))
+            if obj is not None:
+                session.expire(obj, ['versao'])
+
+
+# Instância global
+arvore_cache = ArvoreCache()
@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+"""
+Backfill / reparo da contagem de referências dos arquivos enviados
+Recalcula arquivos_upload.referencias a partir de fotos, PPTs e tabelas de medidas
+
+Necessário uma vez para bancos com uploads anteriores ao armazenamento por
+conteúdo (a tabela arquivos_upload é criada pelo db.create_all na inicialização).
+Uso (a partir da raiz do projeto):
+    python scripts/database/backfill_arquivos.py
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+from app import app
+from models import db
+from upload_store import recontar_referencias
+
+
+def backfill_arquivos():
+    """Recalcula a contagem de referências em uma única transação"""
+    print("=" * 60)
+    print("BACKFILL - REFERÊNCIAS DE ARQUIVOS")
+    print("=" * 60)
+
+    with app.app_context():
+        try:
+            arquivos = recontar_referencias(db.session)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            print(f"\n❌ Erro no backfill: {e}")
+            return False
+
+    print(f"   ✅ {arquivos} arquivos referenciados")
+    print("\n✅ Backfill concluído com sucesso!")
+    return True
+
+
+if __name__ == '__main__':
+    backfill_arquivos()
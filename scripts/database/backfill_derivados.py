@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+Backfill dos derivados de imagens
+Gera as versões reduzidas (image_derivatives.VARIANTES) das fotos já enviadas
+
+Idempotente: derivados existentes são mantidos, a não ser com --forcar.
+Uso (a partir da raiz do projeto):
+    python scripts/database/backfill_derivados.py [--variante impressao] [--forcar]
+"""
+import os
+import sys
+import argparse
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+from app import app
+from models import db, FotoProva
+from image_derivatives import VARIANTES, EXTENSOES_IMAGEM, gerar_derivado
+
+
+def backfill_derivados(variantes, forcar=False):
+    """Gera os derivados de todas as fotos cadastradas"""
+    print("=" * 60)
+    print("BACKFILL - DERIVADOS DE IMAGENS")
+    print("=" * 60)
+
+    gerados = 0
+    ignorados = 0
+    falhas = []
+
+    with app.app_context():
+        arquivos = [
+            file_path for (file_path,) in
+            db.session.query(FotoProva.file_path).distinct().order_by(FotoProva.file_path)
+        ]
+        print(f"   {len(arquivos)} arquivos de foto encontrados")
+
+        for file_path in arquivos:
+            if not file_path or not file_path.lower().endswith(EXTENSOES_IMAGEM):
+                ignorados += 1
+                continue
+            for variante in variantes:
+                if gerar_derivado(file_path, variante, forcar=forcar):
+                    gerados += 1
+                else:
+                    falhas.append((file_path, variante))
+
+    print(f"   ✅ {gerados} derivados prontos")
+    print(f"   ℹ️ {ignorados} arquivos que não são imagens ignorados")
+    for file_path, variante in falhas:
+        print(f"   ⚠️ Falha em '{variante}': {file_path}")
+    print("\n✅ Backfill concluído!")
+    return not falhas
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Gera derivados das fotos já enviadas')
+    parser.add_argument('--variante', choices=sorted(VARIANTES), action='append',
+                        help='Variante a gerar (padrão: todas)')
+    parser.add_argument('--forcar', action='store_true', help='Regenera derivados já existentes')
+    args = parser.parse_args()
+
+    sucesso = backfill_derivados(args.variante or sorted(VARIANTES), forcar=args.forcar)
+    sys.exit(0 if sucesso else 1)
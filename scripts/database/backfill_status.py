@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+"""
+Backfill / reparo do status atual denormalizado
+Recalcula status_atual, ultima_prova_id e total_provas de todas as
+referências e relatórios a partir das provas existentes
+
+Uso (a partir da raiz do projeto, após migrate_performance.py):
+    python scripts/database/backfill_status.py
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+from app import app
+from models import db
+from status_sync import reparar_status
+
+
+def backfill_status():
+    """Recalcula os campos denormalizados em uma única transação"""
+    print("=" * 60)
+    print("BACKFILL - STATUS ATUAL")
+    print("=" * 60)
+
+    with app.app_context():
+        try:
+            referencias, relatorios = reparar_status(db.session)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            print(f"\n❌ Erro no backfill: {e}")
+            return False
+
+    print(f"   ✅ {referencias} referências atualizadas")
+    print(f"   ✅ {relatorios} relatórios atualizados")
+    print("\n✅ Backfill concluído com sucesso!")
+    return True
+
+
+if __name__ == '__main__':
+    backfill_status()
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Limpeza de uploads órfãos (arquivos em UPLOAD_FOLDER que nada referencia)
+Sem --executar apenas relata o que seria recolhido e os bytes recuperáveis
+
+Por padrão os órfãos são movidos para UPLOAD_FOLDER/.quarentena/<data-hora>/;
+com --apagar são removidos. Pode ser agendado no cron.
+Uso (a partir da raiz do projeto):
+    python scripts/database/limpar_uploads_orfaos.py [--executar] [--apagar] [--carencia-horas 24] [--listar]
+"""
+import os
+import sys
+import argparse
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+from app import app
+from models import db
+from upload_gc import coletar_orfaos, CATEGORIAS
+
+# Rótulos das categorias no relatório
+ROTULOS = {
+    'arquivos': 'Uploads sem referência',
+    'temporarios': 'Temporários de gravações interrompidas',
+    'parciais': 'Partes de uploads em partes abandonados',
+    'derivados': 'Derivados de imagens sem original',
+}
+
+
+def _formatar_bytes(total):
+    if total < 1024:
+        return f"{total} B"
+    for unidade in ('KB', 'MB', 'GB'):
+        total /= 1024
+        if total < 1024 or unidade == 'GB':
+            return f"{total:.1f} {unidade}"
+
+
+def limpar_uploads_orfaos(executar=False, apagar=False, carencia_horas=None, listar=False):
+    """Relata (ou recolhe) os uploads órfãos"""
+    print("=" * 60)
+    print("LIMPEZA - UPLOADS ÓRFÃOS" + ("" if executar else " (SIMULAÇÃO)"))
+    print("=" * 60)
+
+    with app.app_context():
+        carencia = carencia_horas * 3600 if carencia_horas is not None else None
+        try:
+            relatorio = coletar_orfaos(executar=executar, apagar=apagar, carencia_segundos=carencia)
+        except Exception as e:
+            db.session.rollback()
+            print(f"\n❌ Erro na limpeza: {e}")
+            return False
+
+    total_arquivos = 0
+    total_bytes = 0
+    for categoria in CATEGORIAS:
+        dados = relatorio['categorias'][categoria]
+        total_arquivos += dados['arquivos']
+        total_bytes += dados['bytes']
+        print(f"   {ROTULOS[categoria]}: {dados['arquivos']} ({_formatar_bytes(dados['bytes'])})")
+
+    if listar:
+        print()
+        for categoria, caminho, tamanho in relatorio['orfaos']:
+            print(f"   [{categoria}] {caminho} ({_formatar_bytes(tamanho)})")
+
+    for caminho, erro in relatorio['falhas']:
+        print(f"   ⚠️ Falha em {caminho}: {erro}")
+
+    print(f"\n   Total: {total_arquivos} arquivos, {_formatar_bytes(total_bytes)}")
+    if not executar:
+        print("\nℹ️ Nada foi alterado. Use --executar para recolher os órfãos.")
+    elif relatorio['quarentena']:
+        print(f"\n✅ Órfãos movidos para {relatorio['quarentena']}")
+    else:
+        print("\n✅ Órfãos removidos")
+    return not relatorio['falhas']
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Recolhe uploads sem referência no banco')
+    parser.add_argument('--executar', action='store_true', help='Move/remove os órfãos (padrão: apenas relata)')
+    parser.add_argument('--apagar', action='store_true', help='Remove em vez de mover para a quarentena')
+    parser.add_argument('--carencia-horas', type=float,
+                        help='Idade mínima dos arquivos (padrão: UPLOAD_CARENCIA_SEGUNDOS)')
+    parser.add_argument('--listar', action='store_true', help='Lista cada arquivo órfão')
+    args = parser.parse_args()
+
+    sucesso = limpar_uploads_orfaos(args.executar, args.apagar, args.carencia_horas, args.listar)
+    sys.exit(0 if sucesso else 1)
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""
+Migração dos uploads para o layout particionado (ab/cd/<nome>)
+Move os arquivos em lotes e reescreve fotos.file_path, tabela_medidas_path e ppt_path
+
+Pode rodar com a aplicação no ar: os arquivos continuam legíveis durante toda
+a migração (a leitura procura no layout antigo) e uma execução interrompida
+pode ser repetida.
+Uso (a partir da raiz do projeto):
+    python scripts/database/migrar_layout_uploads.py [--lote 500] [--pausa 0.5]
+"""
+import os
+import sys
+import argparse
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+from app import app
+from models import db
+from upload_layout import migrar_layout, LOTE_PADRAO
+
+
+def _mostrar_progresso(totais):
+    print(f"   Lote {totais['lotes']}: {totais['arquivos']} arquivos movidos, "
+          f"{totais['linhas']} linhas atualizadas")
+
+
+def migrar_layout_uploads(lote=LOTE_PADRAO, pausa=0):
+    """Executa a migração em lotes"""
+    print("=" * 60)
+    print("MIGRAÇÃO - LAYOUT PARTICIONADO DOS UPLOADS")
+    print("=" * 60)
+
+    with app.app_context():
+        try:
+            totais = migrar_layout(lote=lote, pausa=pausa, progresso=_mostrar_progresso)
+        except Exception as e:
+            db.session.rollback()
+            print(f"\n❌ Erro na migração: {e}")
+            print("ℹ️ Os lotes anteriores foram mantidos; execute novamente para continuar.")
+            return False
+
+    print(f"\n   Total: {totais['arquivos']} arquivos movidos, {totais['linhas']} linhas atualizadas")
+    print("\n✅ Migração concluída com sucesso!")
+    return True
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Move os uploads para o layout particionado ab/cd/<nome>')
+    parser.add_argument('--lote', type=int, default=LOTE_PADRAO, help='Arquivos por transação')
+    parser.add_argument('--pausa', type=float, default=0, help='Segundos de espera entre lotes')
+    args = parser.parse_args()
+
+    sucesso = migrar_layout_uploads(args.lote, args.pausa)
+    sys.exit(0 if sucesso else 1)
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+Script de migração de performance
+Adiciona colunas e índices novos em bancos existentes (SQLite e PostgreSQL)
+
+Idempotente: pode ser executado várias vezes; só cria o que ainda não existe.
+Uso (a partir da raiz do projeto):
+    python scripts/database/migrate_performance.py
+"""
+import os
+import sys
+from sqlalchemy import inspect, text
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+from app import app
+from models import db
+
+# Colunas adicionadas após a criação das tabelas: (tabela, coluna, DDL do tipo)
+COLUNAS = [
+    ('relatorios', 'status_atual', "VARCHAR(50) DEFAULT 'Novo'"),
+    ('relatorios', 'ultima_prova_id', 'INTEGER'),
+    ('relatorios', 'total_provas', 'INTEGER DEFAULT 0'),
+    ('relatorios', 'versao', 'INTEGER NOT NULL DEFAULT 1'),
+    ('referencias', 'status_atual', "VARCHAR(50) DEFAULT 'Novo'"),
+    ('referencias', 'ultima_prova_id', 'INTEGER'),
+    ('referencias', 'total_provas', 'INTEGER DEFAULT 0'),
+    ('referencias', 'versao', 'INTEGER NOT NULL DEFAULT 1'),
+    ('provas', 'versao', 'INTEGER NOT NULL DEFAULT 1'),
+]
+
+# Índices: (nome, tabela, colunas)
+INDICES = [
+    ('ix_relatorios_created_at_id', 'relatorios', ['created_at', 'id']),
+    ('ix_relatorios_status_atual', 'relatorios', ['status_atual']),
+    ('ix_referencias_status_atual', 'referencias', ['status_atual']),
+]
+
+
+def migrate_performance():
+    """Cria as colunas e índices que estiverem faltando"""
+    print("=" * 60)
+    print("MIGRAÇÃO - PERFORMANCE")
+    print("=" * 60)
+
+    with app.app_context():
+        inspetor = inspect(db.engine)
+
+        with db.engine.begin() as conn:
+            for tabela, coluna, ddl in COLUNAS:
+                existentes = {c['name'] for c in inspetor.get_columns(tabela)}
+                if coluna in existentes:
+                    print(f"   ℹ️ Coluna '{tabela}.{coluna}' já existe")
+                    continue
+                conn.execute(text(f"ALTER TABLE {tabela} ADD COLUMN {coluna} {ddl}"))
+                print(f"   ✅ Coluna '{tabela}.{coluna}' adicionada")
+
+            for nome, tabela, colunas in INDICES:
+                existentes = {i['name'] for i in inspetor.get_indexes(tabela)}
+                if nome in existentes:
+                    print(f"   ℹ️ Índice '{nome}' já existe")
+                    continue
+                conn.execute(text(f"CREATE INDEX {nome} ON {tabela} ({', '.join(colunas)})"))
+                print(f"   ✅ Índice '{nome}' criado")
+
+    print("\n✅ Migração concluída com sucesso!")
+    print("   Execute scripts/database/backfill_status.py para preencher o status atual.")
+    return True
+
+
+if __name__ == '__main__':
+    migrate_performance()
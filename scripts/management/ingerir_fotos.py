@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Serviço de ingestão de fotos da pasta monitorada (INGESTAO_PASTA)
+Importa as fotos nomeadas <referência>_P<prova>_<contexto>[_<tamanho>][_<nº>].jpg
+
+Roda continuamente, verificando a pasta a cada INGESTAO_INTERVALO_SEGUNDOS;
+com --uma-vez processa a pasta uma vez e termina (cron). O padrão dos nomes e
+o destino dos arquivos estão descritos em photo_ingest.py.
+Uso (a partir da raiz do projeto):
+    python scripts/management/ingerir_fotos.py [--uma-vez] [--pasta /caminho] [--intervalo 10]
+"""
+import os
+import sys
+import signal
+import argparse
+import threading
+from collections import Counter
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+from app import app
+from models import db
+from photo_ingest import ingerir_pasta
+
+# Sinalizado por SIGTERM/SIGINT: termina após o ciclo atual
+parar = threading.Event()
+
+
+def _mostrar_resultados(resultados):
+    for resultado in resultados:
+        detalhe = f" - {resultado['detalhe']}" if resultado['detalhe'] else ''
+        print(f"   [{resultado['situacao']}] {resultado['arquivo']}{detalhe}")
+    totais = Counter(resultado['situacao'] for resultado in resultados)
+    print("   Total: " + ", ".join(f"{quantidade} {situacao}" for situacao, quantidade in sorted(totais.items())))
+
+
+def ciclo(pasta=None):
+    """Processa a pasta uma vez; retorna False se algum arquivo falhou"""
+    with app.app_context():
+        try:
+            resultados = ingerir_pasta(pasta)
+        except Exception as e:
+            db.session.rollback()
+            print(f"\n❌ Erro na ingestão: {e}")
+            return False
+        finally:
+            db.session.remove()
+
+    if resultados:
+        _mostrar_resultados(resultados)
+    return all(resultado['situacao'] != 'erro' for resultado in resultados)
+
+
+def ingerir_fotos(uma_vez=False, pasta=None, intervalo=None):
+    """Executa a ingestão uma vez ou em ciclos até receber SIGTERM/SIGINT"""
+    print("=" * 60)
+    print("INGESTÃO DE FOTOS - PASTA MONITORADA")
+    print("=" * 60)
+    print(f"   Pasta: {pasta or app.config['INGESTAO_PASTA']}")
+
+    if uma_vez:
+        return ciclo(pasta)
+
+    intervalo = intervalo or app.config['INGESTAO_INTERVALO_SEGUNDOS']
+    signal.signal(signal.SIGTERM, lambda *_: parar.set())
+    signal.signal(signal.SIGINT, lambda *_: parar.set())
+    while not parar.is_set():
+        ciclo(pasta)
+        parar.wait(intervalo)
+
+    print("\n✅ Serviço de ingestão encerrado")
+    return True
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Importa fotos da pasta monitorada para as provas')
+    parser.add_argument('--uma-vez', action='store_true', help='Processa a pasta uma vez e termina')
+    parser.add_argument('--pasta', help='Pasta monitorada (padrão: INGESTAO_PASTA)')
+    parser.add_argument('--intervalo', type=float, help='Segundos entre ciclos (padrão: INGESTAO_INTERVALO_SEGUNDOS)')
+    args = parser.parse_args()
+
+    sucesso = ingerir_fotos(args.uma_vez, args.pasta, args.intervalo)
+    sys.exit(0 if sucesso else 1)
@@ -0,0 +1,129 @@
+// ========================================
+// SALVAMENTO AUTOMÁTICO (PROVAS / REFERÊNCIAS)
+// ========================================
+//
+// Blocos com data-autosave-url gravam cada campo alterado via PATCH (JSON)
+// pouco depois que o usuário para de digitar, sem reenviar o formulário.
+// O campo é o name do input sem o sufixo data-autosave-sufixo (ex.:
+// obs_estilo_12 -> obs_estilo); data-versao guarda a versão carregada e é
+// atualizada a cada resposta, junto com o campo oculto versao<sufixo> que o
+// formulário completo envia. Em conflito (409) o bloco deixa de salvar
+// sozinho e o formulário completo continua disponível.
+
+(function () {
+    const ATRASO_MS = 800;       // Espera após a última tecla
+    const NOVA_TENTATIVA_MS = 5000;
+
+    async function lerJson(resposta) {
+        try {
+            return await resposta.json();
+        } catch (e) {
+            return {};
+        }
+    }
+
+    function prepararBloco(bloco) {
+        const url = bloco.dataset.autosaveUrl;
+        const sufixo = bloco.dataset.autosaveSufixo;
+        const status = bloco.querySelector('.autosave-status');
+        let pendentes = {};
+        let temporizador = null;
+        let enviando = false;
+        let desativado = false;
+
+        function mostrar(texto, classe) {
+            if (!status) return;
+            status.className = `autosave-status small ms-2 ${classe || 'text-muted'}`;
+            status.textContent = texto;
+        }
+
+        function campoDe(elemento) {
+            if (!elemento.name || !elemento.name.endsWith(sufixo)) return null;
+            if (elemento.type === 'file' || elemento.type === 'hidden') return null;
+            return elemento.name.slice(0, -sufixo.length);
+        }
+
+        function valorDe(elemento) {
+            if (elemento.type === 'checkbox') {
+                return Array.from(bloco.querySelectorAll(`input[name="${elemento.name}"]:checked`)).map(c => c.value);
+            }
+            return elemento.value;
+        }
+
+        function agendar(atraso) {
+            clearTimeout(temporizador);
+            temporizador = setTimeout(salvar, atraso);
+        }
+
+        async function salvar() {
+            temporizador = null;
+            if (desativado || enviando || Object.keys(pendentes).length === 0) return;
+            const campos = pendentes;
+            pendentes = {};
+            enviando = true;
+            mostrar('Salvando...');
+            try {
+                const resposta = await fetch(url, {
+                    method: 'PATCH',
+                    headers: { 'Content-Type': 'application/json', 'Accept': 'application/json' },
+                    body: JSON.stringify({ versao: Number(bloco.dataset.versao), campos: campos }),
+                });
+                const dados = await lerJson(resposta);
+                if (resposta.ok) {
+                    bloco.dataset.versao = dados.versao;
+                    // O formulário completo confere esta versão ao ser enviado
+                    const versaoFormulario = bloco.querySelector(`input[type="hidden"][name="versao${sufixo}"]`);
+                    if (versaoFormulario) versaoFormulario.value = dados.versao;
+                    mostrar('✓ Salvo', 'text-success');
+                } else if (resposta.status === 409) {
+                    desativado = true;
+                    mostrar(dados.error || 'Alterado por outra pessoa. Recarregue a página.', 'text-danger');
+                } else if (resposta.status === 400) {
+                    const erros = Object.entries(dados.campos || {}).map(([campo, erro]) => `${campo}: ${erro}`);
+                    mostrar(erros.join('; ') || dados.error || 'Valor inválido', 'text-danger');
+                } else {
+                    throw new Error(`HTTP ${resposta.status}`);
+                }
+            } catch (erro) {
+                // Rede/servidor: devolve os campos (sem sobrescrever edições mais novas) e tenta de novo
+                pendentes = Object.assign(campos, pendentes);
+                mostrar('Sem conexão; tentando salvar novamente...', 'text-warning');
+                agendar(NOVA_TENTATIVA_MS);
+            } finally {
+                enviando = false;
+            }
+            // Campos editados durante o envio
+            if (!desativado && Object.keys(pendentes).length > 0 && !temporizador) {
+                agendar(ATRASO_MS);
+            }
+        }
+
+        function alterado(evento) {
+            const campo = campoDe(evento.target);
+            if (!campo || desativado) return;
+            pendentes[campo] = valorDe(evento.target);
+            mostrar('Alterações não salvas');
+            agendar(ATRASO_MS);
+        }
+
+        bloco.addEventListener('input', alterado);
+        bloco.addEventListener('change', alterado);
+        bloco.addEventListener('focusout', function () {
+            // Saiu do campo: não espera o atraso
+            if (Object.keys(pendentes).length > 0) agendar(0);
+        });
+
+        const form = bloco.closest('form');
+        if (form) {
+            // O formulário completo já leva os valores: cancela o que está agendado
+            form.addEventListener('submit', function () {
+                clearTimeout(temporizador);
+                desativado = true;
+            });
+        }
+    }
+
+    document.addEventListener('DOMContentLoaded', function () {
+        document.querySelectorAll('[data-autosave-url]').forEach(prepararBloco);
+    });
+})();
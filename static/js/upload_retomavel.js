@@ -0,0 +1,164 @@
+// ========================================
+// UPLOAD RETOMÁVEL (PPT / TABELAS DE MEDIDAS)
+// ========================================
+//
+// Inputs com data-upload-retomavel são enviados em partes para /api/uploads
+// assim que o arquivo é escolhido. Falhas de rede são retomadas a partir do
+// último offset confirmado pelo servidor; o formulário envia apenas o id da
+// sessão (<campo>_upload_id) em vez do arquivo.
+
+(function () {
+    const TAMANHO_PARTE = 1024 * 1024;  // 1MB por requisição
+    const MAX_FALHAS = 8;
+
+    class ErroDefinitivo extends Error {}
+
+    function esperar(ms) {
+        return new Promise(resolve => setTimeout(resolve, ms));
+    }
+
+    function chaveLocal(arquivo) {
+        return `upload:${arquivo.name}:${arquivo.size}:${arquivo.lastModified}`;
+    }
+
+    async function calcularSha256(arquivo) {
+        // crypto.subtle só existe em contextos seguros (HTTPS/localhost)
+        if (!window.crypto || !window.crypto.subtle) {
+            return null;
+        }
+        const hash = await window.crypto.subtle.digest('SHA-256', await arquivo.arrayBuffer());
+        return Array.from(new Uint8Array(hash)).map(b => b.toString(16).padStart(2, '0')).join('');
+    }
+
+    async function lerJson(resposta) {
+        try {
+            return await resposta.json();
+        } catch (e) {
+            return {};
+        }
+    }
+
+    async function obterSessao(urlApi, arquivo) {
+        // Retoma a sessão do mesmo arquivo (ex.: após recarregar a página)
+        const salva = localStorage.getItem(chaveLocal(arquivo));
+        if (salva) {
+            const resposta = await fetch(`${urlApi}/${salva}`, { headers: { 'Accept': 'application/json' } });
+            if (resposta.ok) {
+                return resposta.json();
+            }
+            localStorage.removeItem(chaveLocal(arquivo));
+        }
+
+        const resposta = await fetch(urlApi, {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json', 'Accept': 'application/json' },
+            body: JSON.stringify({ filename: arquivo.name, tamanho: arquivo.size, sha256: await calcularSha256(arquivo) })
+        });
+        const dados = await lerJson(resposta);
+        if (!resposta.ok) {
+            throw new ErroDefinitivo(dados.error || 'Não foi possível iniciar o envio');
+        }
+        localStorage.setItem(chaveLocal(arquivo), dados.id);
+        return dados;
+    }
+
+    async function enviarArquivo(urlApi, arquivo, progresso) {
+        let sessao = await obterSessao(urlApi, arquivo);
+        let falhas = 0;
+
+        while (sessao.status !== 'concluida') {
+            progresso(sessao.offset / sessao.tamanho);
+            try {
+                const resposta = await fetch(sessao.url, {
+                    method: 'PUT',
+                    headers: {
+                        'Upload-Offset': String(sessao.offset),
+                        'Content-Type': 'application/octet-stream',
+                        'Accept': 'application/json'
+                    },
+                    body: arquivo.slice(sessao.offset, sessao.offset + TAMANHO_PARTE)
+                });
+                const dados = await lerJson(resposta);
+                if (resposta.ok || resposta.status === 409) {
+                    // 409: offset divergente; segue a partir do offset do servidor
+                    sessao = dados;
+                    falhas = 0;
+                } else if (resposta.status >= 500) {
+                    throw new Error(dados.error || `Erro ${resposta.status}`);
+                } else {
+                    localStorage.removeItem(chaveLocal(arquivo));
+                    throw new ErroDefinitivo(dados.error || `Erro ${resposta.status}`);
+                }
+            } catch (erro) {
+                if (erro instanceof ErroDefinitivo || ++falhas > MAX_FALHAS) {
+                    throw erro;
+                }
+                await esperar(Math.min(30000, 1000 * 2 ** falhas));
+                try {
+                    const resposta = await fetch(sessao.url, { headers: { 'Accept': 'application/json' } });
+                    if (resposta.ok) {
+                        sessao = await resposta.json();
+                    }
+                } catch (e) {
+                    // Sem rede: tenta novamente após a próxima espera
+                }
+            }
+        }
+
+        localStorage.removeItem(chaveLocal(arquivo));
+        return sessao;
+    }
+
+    function prepararInput(input) {
+        const form = input.form;
+        const hidden = document.createElement('input');
+        hidden.type = 'hidden';
+        hidden.name = `${input.name}_upload_id`;
+        const status = document.createElement('div');
+        status.className = 'form-text';
+        input.after(hidden, status);
+
+        input.addEventListener('change', async function () {
+            const arquivo = input.files[0];
+            hidden.value = '';
+            status.textContent = '';
+            if (!arquivo) {
+                return;
+            }
+
+            form.dataset.uploadsPendentes = Number(form.dataset.uploadsPendentes || 0) + 1;
+            status.className = 'form-text';
+            try {
+                const sessao = await enviarArquivo(input.dataset.uploadUrl, arquivo, fracao => {
+                    status.textContent = `Enviando ${arquivo.name}: ${Math.floor(fracao * 100)}%`;
+                });
+                hidden.value = sessao.id;
+                // O formulário envia só o id: o arquivo não é transmitido de novo
+                input.value = '';
+                status.className = 'form-text text-success';
+                status.textContent = `✓ ${arquivo.name} enviado`;
+            } catch (erro) {
+                status.className = 'form-text text-danger';
+                status.textContent = `Falha ao enviar ${arquivo.name}: ${erro.message}. Selecione o arquivo novamente.`;
+                input.value = '';
+            } finally {
+                form.dataset.uploadsPendentes = Number(form.dataset.uploadsPendentes) - 1;
+            }
+        });
+    }
+
+    document.addEventListener('DOMContentLoaded', function () {
+        document.querySelectorAll('input[type="file"][data-upload-retomavel]').forEach(prepararInput);
+
+        // Não envia o formulário enquanto houver arquivos em transmissão
+        document.querySelectorAll('form').forEach(form => {
+            form.addEventListener('submit', function (e) {
+                if (Number(form.dataset.uploadsPendentes || 0) > 0) {
+                    e.preventDefault();
+                    e.stopImmediatePropagation();
+                    alert('Aguarde o término do envio dos arquivos.');
+                }
+            }, true);
+        });
+    });
+})();
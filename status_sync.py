@@ -0,0 +1,193 @@
+"""
+Status atual denormalizado
+Mantém status_atual, ultima_prova_id e total_provas em Relatorio e Referencia
+
+A "prova atual" é a de maior numero_prova (desempate pelo maior id). Os campos
+são recalculados na mesma transação sempre que uma ProvaModelagem é criada,
+alterada (status, numero_prova, referencia_id) ou excluída, e também quando
+uma Referencia é excluída.
+"""
+from sqlalchemy import select, update, func, desc, event, inspect
+from sqlalchemy.orm import Session
+from models import Relatorio, Referencia, ProvaModelagem
+
+# Status de relatórios/referências sem nenhuma prova
+STATUS_NOVO = 'Novo'
+
+# Atributos de ProvaModelagem que alteram a denormalização
+ATRIBUTOS_PROVA = ('status', 'numero_prova', 'referencia_id')
+
+# Campos denormalizados (expirados na sessão após o recálculo)
+CAMPOS_STATUS = ('status_atual', 'ultima_prova_id', 'total_provas')
+
+
+def _ultima_prova_da_referencia(coluna):
+    """Subquery correlacionada: coluna da última prova da referência"""
+    return (
+        select(coluna)
+        .where(ProvaModelagem.referencia_id == Referencia.id)
+        .order_by(desc(ProvaModelagem.numero_prova), desc(ProvaModelagem.id))
+        .limit(1)
+        .scalar_subquery()
+    )
+
+
+def _ultima_prova_do_relatorio(coluna):
+    """Subquery correlacionada: coluna da última prova entre todas as referências do relatório"""
+    return (
+        select(coluna)
+        .join(Referencia, ProvaModelagem.referencia_id == Referencia.id)
+        .where(Referencia.relatorio_id == Relatorio.id)
+        .order_by(desc(ProvaModelagem.numero_prova), desc(ProvaModelagem.id))
+        .limit(1)
+        .scalar_subquery()
+    )
+
+
+def recalcular_referencias(conn, referencia_ids=None):
+    """
+    Recalcula os campos denormalizados das referências
+
+    Args:
+        conn: Conexão (ou sessão) onde executar o UPDATE
+        referencia_ids: IDs a recalcular; None recalcula todas
+
+    Returns:
+        int: Quantidade de linhas atualizadas
+    """
+    stmt = update(Referencia).values(
+        status_atual=func.coalesce(_ultima_prova_da_referencia(ProvaModelagem.status), STATUS_NOVO),
+        ultima_prova_id=_ultima_prova_da_referencia(ProvaModelagem.id),
+        total_provas=(
+            select(func.count(ProvaModelagem.id))
+            .where(ProvaModelagem.referencia_id == Referencia.id)
+            .scalar_subquery()
+        ),
+        # Preserva updated_at: a denormalização não é uma edição da referência
+        updated_at=Referencia.updated_at,
+    )
+    if referencia_ids is not None:
+        if not referencia_ids:
+            return 0
+        stmt = stmt.where(Referencia.id.in_(referencia_ids))
+    return conn.execute(stmt.execution_options(synchronize_session=False)).rowcount
+
+
+def recalcular_relatorios(conn, relatorio_ids=None):
+    """
+    Recalcula os campos denormalizados dos relatórios
+
+    Args:
+        conn: Conexão (ou sessão) onde executar o UPDATE
+        relatorio_ids: IDs a recalcular; None recalcula todos
+
+    Returns:
+        int: Quantidade de linhas atualizadas
+    """
+    stmt = update(Relatorio).values(
+        status_atual=func.coalesce(_ultima_prova_do_relatorio(ProvaModelagem.status), STATUS_NOVO),
+        ultima_prova_id=_ultima_prova_do_relatorio(ProvaModelagem.id),
+        total_provas=(
+            select(func.count(ProvaModelagem.id))
+            .join(Referencia, ProvaModelagem.referencia_id == Referencia.id)
+            .where(Referencia.relatorio_id == Relatorio.id)
+            .scalar_subquery()
+        ),
+        updated_at=Relatorio.updated_at,
+    )
+    if relatorio_ids is not None:
+        if not relatorio_ids:
+            return 0
+        stmt = stmt.where(Relatorio.id.in_(relatorio_ids))
+    return conn.execute(stmt.execution_options(synchronize_session=False)).rowcount
+
+
+def _coletar_afetados(session):
+    """
+    Identifica referências e relatórios afetados pelo flush
+
+    Returns:
+        tuple: (set de referencia_ids, set de relatorio_ids)
+    """
+    referencias = set()
+    relatorios = set()
+
+    for obj in session.new:
+        if isinstance(obj, ProvaModelagem):
+            referencias.add(obj.referencia_id)
+
+    for obj in session.deleted:
+        if isinstance(obj, ProvaModelagem):
+            referencias.add(obj.referencia_id)
+        elif isinstance(obj, Referencia):
+            relatorios.add(obj.relatorio_id)
+
+    for obj in session.dirty:
+        if not isinstance(obj, ProvaModelagem):
+            continue
+        estado = inspect(obj)
+        alterado = False
+        for atributo in ATRIBUTOS_PROVA:
+            historico = estado.attrs[atributo].history
+            if historico.has_changes():
+                alterado = True
+                if atributo == 'referencia_id':
+                    referencias.update(v for v in historico.deleted if v is not None)
+        if alterado:
+            referencias.add(obj.referencia_id)
+
+    referencias.discard(None)
+    relatorios.discard(None)
+    return referencias, relatorios
+
+
+def registrar_eventos_status():
+    """
+    Registra os eventos de sessão que mantêm a denormalização
+
+    after_flush executa os UPDATEs na conexão da própria transação (um rollback
+    desfaz tudo junto); after_flush_postexec expira os campos das instâncias
+    carregadas para que a próxima leitura busque os valores recalculados.
+    """
+    if getattr(registrar_eventos_status, '_registrado', False):
+        return
+    registrar_eventos_status._registrado = True
+
+    @event.listens_for(Session, 'after_flush')
+    def recalcular_status(session, flush_context):
+        referencias, relatorios = _coletar_afetados(session)
+        if not referencias and not relatorios:
+            return
+
+        conn = session.connection()
+        if referencias:
+            recalcular_referencias(conn, referencias)
+            relatorios.update(conn.execute(
+                select(Referencia.relatorio_id).where(Referencia.id.in_(referencias))
+            ).scalars())
+        recalcular_relatorios(conn, relatorios)
+
+        session.info.setdefault('status_recalculado', set()).update(
+            [(Referencia, i) for i in referencias] + [(Relatorio, i) for i in relatorios]
+        )
+
+    @event.listens_for(Session, 'after_flush_postexec')
+    def expirar_status(session, flush_context):
+        for modelo, ident in session.info.pop('status_recalculado', ()):
+            obj = session.identity_map.get(session.identity_key(modelo, ident))
+            if obj is not None:
+                session.expire(obj, CAMPOS_STATUS)
+
+
+def reparar_status(session):
+    """
+    Recalcula (backfill/reparo) os campos denormalizados de todas as linhas
+
+    Args:
+        session: Sessão SQLAlchemy; o commit fica a cargo de quem chama
+
+    Returns:
+        tuple: (referências atualizadas, relatórios atualizados)
+    """
+    conn = session.connection()
+    return recalcular_referencias(conn), recalcular_relatorios(conn)
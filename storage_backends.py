@@ -0,0 +1,521 @@
+"""
+Backends de armazenamento dos uploads: pasta local ou bucket compatível com S3
+Escolhido por ARMAZENAMENTO ('local' ou 's3'); obtido com armazenamento()
+
+Os arquivos são identificados pelo nome (<sha256>.<extensão>, ver
+upload_store). UPLOAD_FOLDER continua sendo a área local de trabalho em ambos
+os casos: temporários de gravação, partes de uploads em partes e derivados.
+
+- ArmazenamentoLocal: os arquivos ficam na própria UPLOAD_FOLDER (um nó ou
+  volume compartilhado); é o comportamento anterior.
+- ArmazenamentoS3: os arquivos ficam no bucket (AWS S3, MinIO e compatíveis).
+  A gravação usa multipart upload em partes de S3_TAMANHO_PARTE_MB, a leitura
+  aceita faixas (Range) e os downloads podem ser redirecionados para URLs
+  pré-assinadas. Quem precisa de um caminho no disco (PDF, derivados) usa
+  caminho_local(), que mantém uma cópia em CACHE_FOLDER/armazenamento com
+  descarte LRU por ARMAZENAMENTO_CACHE_MAX_MB.
+
+Com o S3 vários nós atrás do Nginx compartilham os arquivos; os uploads em
+partes (/api/uploads) ainda montam o arquivo na UPLOAD_FOLDER do nó e exigem
+afinidade de sessão no balanceador (ou UPLOAD_FOLDER compartilhada).
+
+Layout particionado: cada arquivo fica em <ab>/<cd>/<nome>, com ab e cd os
+quatro primeiros dígitos do hash (o do próprio nome, para <sha256>.<extensão>,
+ou o sha256 do nome, para nomes antigos). Arquivos do layout plano (<nome> na
+raiz) são movidos por scripts/database/migrar_layout_uploads.py; até lá, e
+durante a migração, a leitura tenta o outro layout quando o nome não existe.
+"""
+import os
+import hashlib
+import logging
+import time
+import mimetypes
+import threading
+from flask import current_app
+
+logger = logging.getLogger(__name__)
+
+# Tamanho dos blocos de leitura
+TAMANHO_BLOCO = 64 * 1024
+
+# Idade máxima do total em memória da cópia local; outros processos também gravam na pasta
+RECONTAGEM_CACHE_SEGUNDOS = 60
+
+# Códigos de erro do S3 para objeto inexistente
+CODIGOS_NAO_ENCONTRADO = ('404', 'NoSuchKey', 'NotFound')
+
+HEXADECIMAIS = frozenset('0123456789abcdef')
+
+
+def particao(nome):
+    """Subpastas 'ab/cd' de um nome do layout plano"""
+    raiz = os.path.splitext(nome)[0]
+    if len(raiz) != 64 or not HEXADECIMAIS.issuperset(raiz):
+        raiz = hashlib.sha256(nome.encode('utf-8')).hexdigest()
+    return f"{raiz[:2]}/{raiz[2:4]}"
+
+
+def nome_particionado(nome):
+    """Nome no layout particionado: '<sha256>.jpg' -> 'ab/cd/<sha256>.jpg'"""
+    return f"{particao(nome)}/{nome}"
+
+
+def nome_alternativo(nome):
+    """
+    O mesmo arquivo no outro layout (plano <-> particionado)
+
+    Returns:
+        str: Nome no outro layout, ou None se o nome não é de um upload
+        (derivados, ocultos, outras pastas)
+    """
+    if not nome or nome.startswith('.'):
+        return None
+    partes = nome.split('/')
+    if len(partes) == 1:
+        return nome_particionado(nome)
+    if len(partes) == 3 and not partes[2].startswith('.') and f"{partes[0]}/{partes[1]}" == particao(partes[2]):
+        return partes[2]
+    return None
+
+
+class ArmazenamentoLocal:
+    """Arquivos em uma pasta local (UPLOAD_FOLDER)"""
+
+    local = True
+
+    def __init__(self, pasta):
+        self.pasta = pasta
+        self.pasta_local = pasta
+
+    def localizar(self, nome):
+        """Nome com que o arquivo está gravado (o próprio ou o do outro layout), ou None"""
+        for candidato in (nome, nome_alternativo(nome)):
+            if candidato and os.path.isfile(os.path.join(self.pasta, candidato)):
+                return candidato
+        return None
+
+    def caminho(self, nome):
+        """Caminho no disco do arquivo (no layout em que ele estiver)"""
+        return os.path.join(self.pasta, self.localizar(nome) or nome)
+
+    def guardar(self, origem, nome):
+        """
+        Move um arquivo completo (na mesma partição) para o nome definitivo
+
+        Se o nome já existe (em qualquer layout) o conteúdo é o mesmo: a origem
+        é descartada e a data renovada protege o arquivo de uma remoção
+        concorrente até que a nova referência seja gravada.
+        """
+        existente = self.localizar(nome)
+        if existente:
+            os.utime(os.path.join(self.pasta, existente))
+            os.remove(origem)
+        else:
+            destino = os.path.join(self.pasta, nome)
+            os.makedirs(os.path.dirname(destino), exist_ok=True)
+            os.chmod(origem, 0o644)
+            os.replace(origem, destino)
+
+    def info(self, nome):
+        """{'nome', 'tamanho', 'mtime'} do arquivo (nome gravado), ou None se não existir"""
+        existente = self.localizar(nome)
+        try:
+            st = os.stat(os.path.join(self.pasta, existente)) if existente else None
+        except OSError:
+            st = None
+        if st is None:
+            return None
+        return {'nome': existente, 'tamanho': st.st_size, 'mtime': st.st_mtime}
+
+    def caminho_local(self, nome):
+        """Caminho no disco para leitura, ou None se o arquivo não existir"""
+        existente = self.localizar(nome)
+        return os.path.join(self.pasta, existente) if existente else None
+
+    def ler(self, nome, inicio=0, fim=None):
+        """Gera os blocos do arquivo no intervalo [inicio, fim)"""
+        with open(self.caminho(nome), 'rb') as f:
+            f.seek(inicio)
+            restante = None if fim is None else fim - inicio
+            while restante is None or restante > 0:
+                bloco = f.read(TAMANHO_BLOCO if restante is None else min(TAMANHO_BLOCO, restante))
+                if not bloco:
+                    break
+                if restante is not None:
+                    restante -= len(bloco)
+                yield bloco
+
+    def url_assinada(self, nome, expira_segundos, mimetype=None):
+        """Arquivos locais são entregues pela própria app (ou pelo Nginx)"""
+        return None
+
+    def remover(self, nome):
+        """Remove o arquivo; False se ele não existia"""
+        existente = self.localizar(nome)
+        if existente is None:
+            return False
+        try:
+            os.remove(os.path.join(self.pasta, existente))
+        except FileNotFoundError:
+            return False
+        return True
+
+    def mover(self, nome, destino):
+        """Move o arquivo (nome exato) para outro caminho relativo (ex.: quarentena)"""
+        caminho_destino = os.path.join(self.pasta, destino)
+        os.makedirs(os.path.dirname(caminho_destino), exist_ok=True)
+        os.replace(os.path.join(self.pasta, nome), caminho_destino)
+
+    def particionar(self, nome):
+        """Move um arquivo do layout plano para o particionado; False se ele não estava no plano"""
+        try:
+            self.mover(nome, nome_particionado(nome))
+        except FileNotFoundError:
+            return False
+        return True
+
+    def listar(self, apenas_planos=False):
+        """
+        Gera (nome, tamanho, mtime) dos arquivos armazenados nos dois layouts
+
+        Ignora ocultos e outras pastas (derivados, quarentena); com
+        apenas_planos, só os arquivos do layout plano.
+        """
+        with os.scandir(self.pasta) as entradas:
+            for entrada in entradas:
+                if entrada.name.startswith('.'):
+                    continue
+                if entrada.is_file(follow_symlinks=False):
+                    st = entrada.stat(follow_symlinks=False)
+                    yield entrada.name, st.st_size, st.st_mtime
+                elif not apenas_planos and len(entrada.name) == 2 and entrada.is_dir(follow_symlinks=False):
+                    yield from self._listar_particao(entrada)
+
+    def _listar_particao(self, pasta):
+        with os.scandir(pasta.path) as subpastas:
+            for subpasta in subpastas:
+                if len(subpasta.name) != 2 or not subpasta.is_dir(follow_symlinks=False):
+                    continue
+                with os.scandir(subpasta.path) as arquivos:
+                    for arquivo in arquivos:
+                        nome = f"{pasta.name}/{subpasta.name}/{arquivo.name}"
+                        if arquivo.is_file(follow_symlinks=False) and nome_alternativo(nome):
+                            st = arquivo.stat(follow_symlinks=False)
+                            yield nome, st.st_size, st.st_mtime
+
+
+class ArmazenamentoS3:
+    """
+    Arquivos em um bucket compatível com S3
+
+    Args:
+        cliente: Cliente boto3 ('s3') ou objeto com a mesma interface
+        bucket: Nome do bucket
+        prefixo: Prefixo das chaves (ex.: 'uploads/')
+        pasta_cache: Pasta da cópia local (caminho_local)
+        max_cache_bytes: Orçamento de espaço da cópia local
+        tamanho_parte: Tamanho das partes do multipart upload (mínimo do S3: 5MB)
+    """
+
+    local = False
+
+    def __init__(self, cliente, bucket, prefixo='', pasta_cache=None,
+                 max_cache_bytes=1024 * 1024 * 1024, tamanho_parte=8 * 1024 * 1024):
+        self.cliente = cliente
+        self.bucket = bucket
+        self.prefixo = prefixo
+        self.pasta_local = pasta_cache
+        self.max_cache_bytes = max_cache_bytes
+        self.tamanho_parte = max(tamanho_parte, 5 * 1024 * 1024)
+        self._lock = threading.Lock()
+        self._total_cache = None  # Bytes da cópia local (None: percorrer a pasta)
+        self._contado_em = 0.0
+        if pasta_cache:
+            os.makedirs(pasta_cache, exist_ok=True)
+
+    def _chave(self, nome):
+        return f"{self.prefixo}{nome}"
+
+    @staticmethod
+    def _nao_encontrado(erro):
+        codigo = getattr(erro, 'response', {}).get('Error', {}).get('Code')
+        return str(codigo) in CODIGOS_NAO_ENCONTRADO
+
+    def caminho(self, nome):
+        """Caminho da cópia local (pode ainda não existir; ver caminho_local)"""
+        # O nome base é o mesmo nos dois layouts: a cópia local fica em uma pasta só
+        return os.path.join(self.pasta_local, os.path.basename(nome))
+
+    def info(self, nome):
+        """{'nome', 'tamanho', 'mtime'} do objeto (nome gravado), ou None se não existir"""
+        for candidato in (nome, nome_alternativo(nome)):
+            if not candidato:
+                continue
+            try:
+                objeto = self.cliente.head_object(Bucket=self.bucket, Key=self._chave(candidato))
+            except Exception as e:
+                if self._nao_encontrado(e):
+                    continue
+                raise
+            return {'nome': candidato, 'tamanho': objeto['ContentLength'],
+                    'mtime': objeto['LastModified'].timestamp()}
+        return None
+
+    def guardar(self, origem, nome):
+        """
+        Envia um arquivo completo para o bucket e o mantém como cópia local
+
+        Conteúdo já armazenado não é enviado de novo; o objeto é copiado sobre
+        si mesmo para renovar a data (proteção contra a limpeza de órfãos).
+        """
+        existente = self.info(nome)
+        if existente is not None:
+            chave = self._chave(existente['nome'])
+            self.cliente.copy_object(Bucket=self.bucket, Key=chave, MetadataDirective='REPLACE',
+                                     CopySource={'Bucket': self.bucket, 'Key': chave},
+                                     ContentType=mimetypes.guess_type(nome)[0] or 'application/octet-stream')
+        else:
+            self._enviar(origem, self._chave(nome), mimetypes.guess_type(nome)[0] or 'application/octet-stream')
+
+        # O arquivo acabou de ser gravado e costuma ser lido em seguida (derivados)
+        tamanho = os.path.getsize(origem)
+        os.replace(origem, self.caminho(nome))
+        self._registrar_copia(nome, tamanho)
+
+    def _enviar(self, origem, chave, mimetype):
+        """put_object para arquivos pequenos, multipart upload em partes para os demais"""
+        if os.path.getsize(origem) <= self.tamanho_parte:
+            with open(origem, 'rb') as f:
+                self.cliente.put_object(Bucket=self.bucket, Key=chave, Body=f, ContentType=mimetype)
+            return
+
+        envio = self.cliente.create_multipart_upload(Bucket=self.bucket, Key=chave, ContentType=mimetype)
+        partes = []
+        try:
+            with open(origem, 'rb') as f:
+                numero = 1
+                while True:
+                    dados = f.read(self.tamanho_parte)
+                    if not dados:
+                        break
+                    resposta = self.cliente.upload_part(Bucket=self.bucket, Key=chave, PartNumber=numero,
+                                                        UploadId=envio['UploadId'], Body=dados)
+                    partes.append({'PartNumber': numero, 'ETag': resposta['ETag']})
+                    numero += 1
+            self.cliente.complete_multipart_upload(Bucket=self.bucket, Key=chave, UploadId=envio['UploadId'],
+                                                   MultipartUpload={'Parts': partes})
+        except Exception:
+            self.cliente.abort_multipart_upload(Bucket=self.bucket, Key=chave, UploadId=envio['UploadId'])
+            raise
+
+    def caminho_local(self, nome):
+        """
+        Caminho de uma cópia local do objeto (cache de leitura), ou None se não existir
+
+        Um acerto atualiza o mtime (ordem LRU); uma falta baixa o objeto inteiro.
+        """
+        caminho = self.caminho(nome)
+        try:
+            os.utime(caminho)
+            return caminho
+        except OSError:
+            pass
+
+        temporario = f"{caminho}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(temporario, 'wb') as f:
+                for bloco in self.ler(nome):
+                    f.write(bloco)
+            tamanho = os.path.getsize(temporario)
+            os.replace(temporario, caminho)
+        except Exception as e:
+            if os.path.exists(temporario):
+                os.remove(temporario)
+            if self._nao_encontrado(e):
+                return None
+            raise
+        self._registrar_copia(nome, tamanho)
+        return caminho
+
+    def _registrar_copia(self, nome, tamanho):
+        """
+        Soma uma cópia local nova ao total em memória
+
+        A pasta só é percorrida (descartar) quando o total passa do orçamento
+        ou quando a última contagem tem mais de RECONTAGEM_CACHE_SEGUNDOS.
+        """
+        with self._lock:
+            if self._total_cache is not None and time.monotonic() - self._contado_em < RECONTAGEM_CACHE_SEGUNDOS:
+                self._total_cache += tamanho
+                if self._total_cache <= self.max_cache_bytes:
+                    return
+        self.descartar(preservar=nome)
+
+    def _obter(self, nome, **parametros):
+        """get_object do nome ou, se não existir, do nome no outro layout"""
+        alternativo = nome_alternativo(nome)
+        try:
+            return self.cliente.get_object(Bucket=self.bucket, Key=self._chave(nome), **parametros)
+        except Exception as e:
+            if not alternativo or not self._nao_encontrado(e):
+                raise
+        return self.cliente.get_object(Bucket=self.bucket, Key=self._chave(alternativo), **parametros)
+
+    def ler(self, nome, inicio=0, fim=None):
+        """Gera os blocos do objeto no intervalo [inicio, fim) (GET com Range)"""
+        parametros = {}
+        if inicio or fim is not None:
+            parametros['Range'] = f"bytes={inicio}-{'' if fim is None else fim - 1}"
+        corpo = self._obter(nome, **parametros)['Body']
+        try:
+            while True:
+                bloco = corpo.read(TAMANHO_BLOCO)
+                if not bloco:
+                    break
+                yield bloco
+        finally:
+            corpo.close()
+
+    def url_assinada(self, nome, expira_segundos, mimetype=None):
+        """URL pré-assinada de download direto do bucket"""
+        parametros = {'Bucket': self.bucket, 'Key': self._chave(nome)}
+        if mimetype:
+            parametros['ResponseContentType'] = mimetype
+        return self.cliente.generate_presigned_url('get_object', Params=parametros, ExpiresIn=expira_segundos)
+
+    def remover(self, nome):
+        """Remove o objeto (e a cópia local); False se ele não existia"""
+        existente = self.info(nome)
+        if existente is None:
+            return False
+        self.cliente.delete_object(Bucket=self.bucket, Key=self._chave(existente['nome']))
+        try:
+            os.remove(self.caminho(nome))
+        except FileNotFoundError:
+            pass
+        return True
+
+    def mover(self, nome, destino):
+        """Copia o objeto (nome exato) para outra chave (ex.: quarentena) e remove o original"""
+        self.cliente.copy_object(Bucket=self.bucket, Key=self._chave(destino),
+                                 CopySource={'Bucket': self.bucket, 'Key': self._chave(nome)})
+        self.cliente.delete_object(Bucket=self.bucket, Key=self._chave(nome))
+        try:
+            os.remove(self.caminho(nome))
+        except FileNotFoundError:
+            pass
+
+    def particionar(self, nome):
+        """Move um objeto do layout plano para o particionado; False se ele não estava no plano"""
+        try:
+            self.cliente.head_object(Bucket=self.bucket, Key=self._chave(nome))
+        except Exception as e:
+            if self._nao_encontrado(e):
+                return False
+            raise
+        # A cópia local é a mesma nos dois layouts: só a chave muda
+        self.cliente.copy_object(Bucket=self.bucket, Key=self._chave(nome_particionado(nome)),
+                                 CopySource={'Bucket': self.bucket, 'Key': self._chave(nome)})
+        self.cliente.delete_object(Bucket=self.bucket, Key=self._chave(nome))
+        return True
+
+    def listar(self, apenas_planos=False):
+        """
+        Gera (nome, tamanho, mtime) dos objetos do prefixo nos dois layouts
+
+        Ignora ocultos e outras 'pastas' (quarentena); com apenas_planos, só
+        os objetos do layout plano.
+        """
+        parametros = {'Bucket': self.bucket, 'Prefix': self.prefixo}
+        if apenas_planos:
+            parametros['Delimiter'] = '/'
+        while True:
+            pagina = self.cliente.list_objects_v2(**parametros)
+            for objeto in pagina.get('Contents', []):
+                nome = objeto['Key'][len(self.prefixo):]
+                if '/' in nome and nome_alternativo(nome) is None:
+                    continue
+                if nome and not nome.startswith('.'):
+                    yield nome, objeto['Size'], objeto['LastModified'].timestamp()
+            if not pagina.get('IsTruncated'):
+                break
+            parametros['ContinuationToken'] = pagina['NextContinuationToken']
+
+    def descartar(self, preservar=None):
+        """
+        Remove as cópias locais menos usadas até o total caber em ARMAZENAMENTO_CACHE_MAX_MB
+
+        Args:
+            preservar: Nome (em qualquer layout) cuja cópia nunca deve ser removida
+
+        Returns:
+            int: Quantidade de arquivos removidos
+        """
+        preservar = os.path.basename(preservar) if preservar else None
+        with self._lock:
+            arquivos = []
+            total = 0
+            with os.scandir(self.pasta_local) as entradas:
+                for entrada in entradas:
+                    if not entrada.is_file() or entrada.name.endswith('.tmp'):
+                        continue
+                    st = entrada.stat()
+                    arquivos.append((st.st_mtime, st.st_size, entrada.path, entrada.name))
+                    total += st.st_size
+
+            removidos = 0
+            for _, tamanho, caminho, nome in sorted(arquivos):
+                if total <= self.max_cache_bytes:
+                    break
+                if nome == preservar:
+                    continue
+                try:
+                    os.remove(caminho)
+                    total -= tamanho
+                    removidos += 1
+                except OSError as e:
+                    logger.warning(f"Erro ao descartar cópia local {caminho}: {e}")
+            self._total_cache = total
+            self._contado_em = time.monotonic()
+            return removidos
+
+
+def criar_armazenamento(config):
+    """
+    Cria o backend configurado em ARMAZENAMENTO
+
+    Raises:
+        ValueError: Backend desconhecido ou S3 sem bucket
+    """
+    tipo = config.get('ARMAZENAMENTO', 'local')
+    if tipo == 'local':
+        return ArmazenamentoLocal(config['UPLOAD_FOLDER'])
+    if tipo != 's3':
+        raise ValueError(f"ARMAZENAMENTO desconhecido: {tipo}")
+    if not config.get('S3_BUCKET'):
+        raise ValueError("ARMAZENAMENTO=s3 exige S3_BUCKET")
+
+    # Dependência só necessária com o S3 (boto3, ver requirements.txt)
+    import boto3
+    cliente = boto3.client(
+        's3',
+        endpoint_url=config.get('S3_ENDPOINT_URL') or None,
+        region_name=config.get('S3_REGIAO') or None,
+        aws_access_key_id=config.get('S3_ACCESS_KEY') or None,
+        aws_secret_access_key=config.get('S3_SECRET_KEY') or None,
+    )
+    return ArmazenamentoS3(
+        cliente, config['S3_BUCKET'], prefixo=config.get('S3_PREFIXO', ''),
+        pasta_cache=os.path.join(config['CACHE_FOLDER'], 'armazenamento'),
+        max_cache_bytes=config.get('ARMAZENAMENTO_CACHE_MAX_MB', 1024) * 1024 * 1024,
+        tamanho_parte=config.get('S3_TAMANHO_PARTE_MB', 8) * 1024 * 1024,
+    )
+
+
+def armazenamento(app=None):
+    """Backend de armazenamento da aplicação (criado no primeiro uso)"""
+    app = app or current_app._get_current_object()
+    backend = app.extensions.get('armazenamento')
+    if backend is None:
+        backend = app.extensions['armazenamento'] = criar_armazenamento(app.config)
+    return backend
@@ -0,0 +1,143 @@
+import unittest
+import sys
+import os
+import tempfile
+from datetime import datetime, timedelta
+
+# Add the parent directory to the path so we can import the modules
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from flask import Flask
+from models import db, Relatorio, Referencia, Prova
+from status_sync import registrar_eventos_status
+from dashboard_stats import (calcular_estatisticas, estatisticas_cache, listar_relatorios_pagina,
+                             decodificar_cursor)
+
+
+class DashboardStatsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        self.cache_dir = tempfile.TemporaryDirectory()
+        self.app.config['CACHE_FOLDER'] = self.cache_dir.name
+        db.init_app(self.app)
+        registrar_eventos_status()
+        estatisticas_cache.init_app(self.app)
+
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+        # Relatório com duas referências; a última prova define o status
+        self.rel_antigo = Relatorio(descricao_geral='Antigo', colecao='Verão',
+                                    created_at=datetime.utcnow() - timedelta(days=60))
+        self.rel_novo = Relatorio(descricao_geral='Novo', colecao='Inverno')
+        self.rel_vazio = Relatorio(descricao_geral='Vazio')
+        db.session.add_all([self.rel_antigo, self.rel_novo, self.rel_vazio])
+        db.session.flush()
+
+        baby = Referencia(relatorio_id=self.rel_antigo.id, tipo_categoria='baby', numero_ref='B1')
+        kids = Referencia(relatorio_id=self.rel_antigo.id, tipo_categoria='kids', numero_ref='K1')
+        teen = Referencia(relatorio_id=self.rel_novo.id, tipo_categoria='teen', numero_ref='T1')
+        db.session.add_all([baby, kids, teen])
+        db.session.flush()
+
+        db.session.add_all([
+            Prova(referencia_id=baby.id, numero_prova=1, status='Reprovada'),
+            Prova(referencia_id=baby.id, numero_prova=2, status='Reprovada'),
+            Prova(referencia_id=kids.id, numero_prova=3, status='Aprovada'),
+            Prova(referencia_id=teen.id, numero_prova=1, status='Comitê'),
+        ])
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+        self.cache_dir.cleanup()
+
+    def test_estatisticas(self):
+        stats = calcular_estatisticas()
+        self.assertEqual(stats['total_relatorios'], 3)
+        self.assertEqual(stats['total_referencias'], 3)
+        self.assertEqual(stats['total_provas'], 4)
+        self.assertEqual(stats['provas_aprovadas'], 1)
+        self.assertEqual(stats['provas_reprovadas'], 2)
+        self.assertEqual(stats['provas_em_andamento'], 0)
+        self.assertEqual(stats['provas_comite'], 1)
+        self.assertEqual(stats['taxa_aprovacao'], 25.0)
+        self.assertEqual(stats['taxa_retrabalho'], 50.0)
+        self.assertEqual(stats['relatorios_recentes'], 2)
+        self.assertEqual(stats['categorias'], {'baby': 1, 'kids': 1, 'teen': 1})
+        self.assertEqual(stats['insights'][0]['tipo'], 'danger')
+
+    def test_estatisticas_sem_dados(self):
+        Prova.query.delete()
+        db.session.commit()
+        stats = calcular_estatisticas()
+        self.assertEqual(stats['total_provas'], 0)
+        self.assertEqual(stats['taxa_aprovacao'], 0)
+        self.assertEqual(stats['provas_aprovadas'], 0)
+
+    def test_cache_reutiliza_snapshot(self):
+        primeiro = estatisticas_cache.obter()
+        self.assertIs(estatisticas_cache.obter(), primeiro)
+
+    def test_cache_invalidado_apos_commit(self):
+        antes = estatisticas_cache.obter()
+        prova = Prova.query.filter_by(status='Comitê').first()
+        prova.status = 'Aprovada'
+        db.session.commit()
+
+        depois = estatisticas_cache.obter()
+        self.assertIsNot(depois, antes)
+        self.assertEqual(depois['provas_aprovadas'], antes['provas_aprovadas'] + 1)
+
+    def test_cache_mantido_apos_rollback(self):
+        antes = estatisticas_cache.obter()
+        prova = Prova.query.first()
+        prova.status = 'Aprovada'
+        db.session.flush()
+        db.session.rollback()
+        self.assertIs(estatisticas_cache.obter(), antes)
+
+    def test_paginacao_keyset_percorre_todos(self):
+        vistos = []
+        cursor = None
+        while True:
+            pagina, cursor = listar_relatorios_pagina(cursor=cursor, limite=1)
+            vistos.extend(r['id'] for r in pagina)
+            if not cursor:
+                break
+        # Mais recentes primeiro (created_at, id)
+        esperados = sorted([self.rel_antigo, self.rel_novo, self.rel_vazio],
+                           key=lambda r: (r.created_at, r.id), reverse=True)
+        self.assertEqual(vistos, [r.id for r in esperados])
+        self.assertEqual(vistos[-1], self.rel_antigo.id)
+
+    def test_paginacao_status_atual(self):
+        pagina, cursor = listar_relatorios_pagina(limite=10)
+        self.assertIsNone(cursor)
+        status = {r['id']: r['status_atual'] for r in pagina}
+        # A última prova define o status
+        self.assertEqual(status[self.rel_antigo.id], 'Aprovada')
+        self.assertEqual(status[self.rel_novo.id], 'Comitê')
+        self.assertEqual(status[self.rel_vazio.id], 'Novo')
+
+    def test_paginacao_filtros(self):
+        pagina, _ = listar_relatorios_pagina({'categoria': 'teen'})
+        self.assertEqual([r['id'] for r in pagina], [self.rel_novo.id])
+
+        pagina, _ = listar_relatorios_pagina({'colecao': 'Verão', 'categoria': 'baby'})
+        self.assertEqual([r['id'] for r in pagina], [self.rel_antigo.id])
+
+        pagina, _ = listar_relatorios_pagina({'busca': 'vaz'})
+        self.assertEqual([r['id'] for r in pagina], [self.rel_vazio.id])
+
+    def test_cursor_invalido(self):
+        with self.assertRaises(ValueError):
+            decodificar_cursor('nao-e-um-cursor')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,148 @@
+import unittest
+import sys
+import os
+import tempfile
+from unittest import mock
+
+# Add the parent directory to the path so we can import the modules
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from flask import Flask
+from flask_login import LoginManager
+from sqlalchemy import update
+from models import db, Usuario, Relatorio, Referencia, Prova
+from report_tree import registrar_eventos_versao
+import field_updates
+from field_updates import edicao_bp
+
+
+class FieldUpdatesTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = Flask(__name__)
+        # Arquivo (não :memory:): o teste de concorrência grava por outra conexão
+        self.banco = os.path.join(tempfile.mkdtemp(), 'teste.db')
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{self.banco}'
+        self.app.config['PDF_ASSINCRONO'] = False
+        self.app.secret_key = 'teste'
+        db.init_app(self.app)
+        self.app.register_blueprint(edicao_bp)
+        registrar_eventos_versao()
+
+        login_manager = LoginManager(self.app)
+
+        @login_manager.request_loader
+        def carregar_usuario(req):
+            usuario_id = req.headers.get('X-Usuario')
+            return db.session.get(Usuario, int(usuario_id)) if usuario_id else None
+
+        with self.app.app_context():
+            db.create_all()
+            db.session.add(Usuario(id=1, username='ana', password_hash='x'))
+            relatorio = Relatorio(descricao_geral='Teste')
+            db.session.add(relatorio)
+            db.session.flush()
+            referencia = Referencia(relatorio_id=relatorio.id, tipo_categoria='adulto', numero_ref='A1')
+            db.session.add(referencia)
+            db.session.flush()
+            prova = Prova(referencia_id=referencia.id, numero_prova=1, tamanhos_recebidos='P')
+            db.session.add(prova)
+            db.session.commit()
+            self.relatorio_id, self.referencia_id, self.prova_id = relatorio.id, referencia.id, prova.id
+            self.versao_relatorio = relatorio.versao
+        self.cliente = self.app.test_client()
+
+    def tearDown(self):
+        with self.app.app_context():
+            db.drop_all()
+
+    def _patch(self, url, versao, campos, usuario=1):
+        headers = {'X-Usuario': str(usuario)} if usuario else {}
+        return self.cliente.patch(url, headers=headers, json={'versao': versao, 'campos': campos})
+
+    def test_grava_so_campos_alterados_com_versao(self):
+        url = f'/api/provas/{self.prova_id}'
+        self.assertEqual(self._patch(url, 1, {'obs_estilo': 'x'}, usuario=None).status_code, 401)
+
+        resposta = self._patch(url, 1, {'obs_estilo': 'Ajustar gola', 'tamanhos_recebidos': ['M', 'P'],
+                                        'data_prova': '2025-03-01'})
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(resposta.get_json()['versao'], 2)
+        self.assertEqual(sorted(resposta.get_json()['alterados']), ['data_prova', 'obs_estilo', 'tamanhos_recebidos'])
+
+        # Mesmos valores: nenhuma escrita, versão mantida
+        resposta = self._patch(url, 2, {'obs_estilo': 'Ajustar gola'})
+        self.assertEqual((resposta.get_json()['versao'], resposta.get_json()['alterados']), (2, []))
+
+        with self.app.app_context():
+            prova = db.session.get(Prova, self.prova_id)
+            self.assertEqual((prova.obs_estilo, prova.tamanhos_recebidos), ('Ajustar gola', 'P, M'))
+            # A árvore do relatório (cache e PDF) é invalidada uma vez
+            self.assertEqual(db.session.get(Relatorio, self.relatorio_id).versao, self.versao_relatorio + 1)
+
+        resposta = self._patch(f'/api/referencias/{self.referencia_id}', 1, {'fornecedor': 'Malhas Sul'})
+        self.assertEqual((resposta.status_code, resposta.get_json()['versao']), (200, 2))
+
+    def test_conflito_de_versao_e_validacao(self):
+        url = f'/api/provas/{self.prova_id}'
+        self.assertEqual(self._patch(url, 1, {'obs_qualidade': 'Primeira'}).status_code, 200)
+
+        # Outra aba ainda com a versão 1: nada é gravado, valores atuais na resposta
+        resposta = self._patch(url, 1, {'obs_qualidade': 'Segunda'})
+        self.assertEqual(resposta.status_code, 409)
+        self.assertEqual(resposta.get_json()['versao'], 2)
+        self.assertEqual(resposta.get_json()['valores'], {'obs_qualidade': 'Primeira'})
+
+        resposta = self._patch(url, 2, {'status': 'Aprovado', 'data_lacre': '01/02/2025',
+                                        'tamanhos_recebidos': ['XG'], 'numero_lacre': 'x' * 101})
+        self.assertEqual(resposta.status_code, 400)
+        self.assertEqual(sorted(resposta.get_json()['campos']),
+                         ['data_lacre', 'numero_lacre', 'status', 'tamanhos_recebidos'])
+        self.assertEqual(self._patch(f'/api/referencias/{self.referencia_id}', 1, {'numero_ref': ' '}).status_code, 400)
+        self.assertEqual(self.cliente.patch(url, headers={'X-Usuario': '1'}, json={'campos': {}}).status_code, 400)
+        self.assertEqual(self._patch('/api/provas/999', 1, {}).status_code, 404)
+
+        with self.app.app_context():
+            self.assertEqual(db.session.get(Prova, self.prova_id).versao, 2)
+
+    def test_escrita_concorrente_da_mesma_versao(self):
+        url = f'/api/provas/{self.prova_id}'
+        aplicar_original = field_updates.aplicar_alteracoes
+
+        def aplicar_com_concorrente(obj, valores):
+            # Outra requisição grava a mesma versão entre a leitura e o UPDATE
+            with db.engine.begin() as conn:
+                conn.execute(update(Prova).where(Prova.id == self.prova_id)
+                             .values(versao=Prova.versao + 1, obs_estilo='Concorrente'))
+            return aplicar_original(obj, valores)
+
+        with mock.patch('field_updates.aplicar_alteracoes', side_effect=aplicar_com_concorrente):
+            resposta = self._patch(url, 1, {'obs_estilo': 'Minha'})
+
+        self.assertEqual(resposta.status_code, 409)
+        self.assertEqual(resposta.get_json()['versao'], 2)
+        self.assertEqual(resposta.get_json()['valores'], {'obs_estilo': 'Concorrente'})
+        with self.app.app_context():
+            self.assertEqual(db.session.get(Prova, self.prova_id).obs_estilo, 'Concorrente')
+
+    def test_tamanhos_da_categoria(self):
+        url = f'/api/provas/{self.prova_id}'
+        resposta = self._patch(url, 1, {'tamanhos_recebidos': ['M', '3a6meses']})
+        self.assertEqual(resposta.status_code, 400)
+        self.assertEqual(resposta.get_json()['campos'], {'tamanhos_recebidos': 'Tamanhos inválidos para adulto: 3a6meses'})
+
+        # Texto separado por vírgulas, gravado na ordem da categoria
+        self.assertEqual(self._patch(url, 1, {'tamanhos_recebidos': 'GG, P'}).status_code, 200)
+        with self.app.app_context():
+            self.assertEqual(db.session.get(Prova, self.prova_id).tamanhos_recebidos, 'P, GG')
+
+    def test_registros_inativos_nao_sao_editaveis(self):
+        with self.app.app_context():
+            db.session.get(Prova, self.prova_id).is_active = False
+            db.session.get(Referencia, self.referencia_id).is_active = False
+            db.session.commit()
+        self.assertEqual(self._patch(f'/api/provas/{self.prova_id}', 1, {'obs_estilo': 'x'}).status_code, 404)
+        self.assertEqual(self._patch(f'/api/referencias/{self.referencia_id}', 1, {'fornecedor': 'x'}).status_code, 404)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+import unittest
+import sys
+import os
+import tempfile
+
+# Add the parent directory to the path so we can import the modules
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from flask import Flask
+from PIL import Image
+from image_derivatives import (
+    gerar_derivado, gerar_derivados, caminho_derivado, caminho_impressao, VARIANTES
+)
+from storage_backends import particao
+
+
+class ImageDerivativesTestCase(unittest.TestCase):
+    def setUp(self):
+        self.upload_dir = tempfile.mkdtemp()
+        self.app = Flask(__name__)
+        self.app.config['UPLOAD_FOLDER'] = self.upload_dir
+        self.app.add_url_rule('/uploads/<path:filename>', 'serve_upload', lambda filename: filename)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+
+    def tearDown(self):
+        self.app_context.pop()
+
+    def _salvar(self, nome, imagem, **kwargs):
+        imagem.save(os.path.join(self.upload_dir, nome), **kwargs)
+
+    def test_reduz_e_recomprime(self):
+        self._salvar('grande.png', Image.new('RGBA', (4000, 3000), (255, 0, 0, 128)))
+
+        destino = gerar_derivado('grande.png', 'impressao')
+
+        self.assertEqual(destino, caminho_derivado('grande.png', 'impressao'))
+        with Image.open(destino) as derivado:
+            self.assertEqual(derivado.format, 'JPEG')
+            self.assertEqual(derivado.mode, 'RGB')
+            self.assertEqual(max(derivado.size), VARIANTES['impressao']['max_lado'])
+
+    def test_aplica_orientacao_exif(self):
+        exif = Image.Exif()
+        exif[0x0112] = 6  # Rotação de 90° no sentido horário
+        self._salvar('retrato.jpg', Image.new('RGB', (800, 400)), exif=exif)
+
+        with Image.open(gerar_derivado('retrato.jpg', 'impressao')) as derivado:
+            self.assertEqual(derivado.size, (400, 800))
+
+    def test_reutiliza_derivado_atualizado(self):
+        self._salvar('foto.jpg', Image.new('RGB', (100, 100)))
+        destino = gerar_derivado('foto.jpg', 'impressao')
+        mtime = os.stat(destino).st_mtime_ns
+
+        self.assertEqual(gerar_derivado('foto.jpg', 'impressao'), destino)
+        self.assertEqual(os.stat(destino).st_mtime_ns, mtime)
+
+    def test_arquivo_invalido_usa_original(self):
+        with open(os.path.join(self.upload_dir, 'quebrada.jpg'), 'wb') as f:
+            f.write(b'nao e imagem')
+        foto = {'file_path': 'quebrada.jpg', 'caminho_absoluto': os.path.join(self.upload_dir, 'quebrada.jpg')}
+
+        self.assertIsNone(gerar_derivado('quebrada.jpg', 'impressao'))
+        self.assertEqual(caminho_impressao(foto), foto['caminho_absoluto'])
+        self.assertIsNone(gerar_derivado('tabela.xlsx', 'impressao'))
+
+    def test_gera_variantes(self):
+        self._salvar('foto.png', Image.new('RGB', (2000, 1000)))
+
+        self.assertTrue(gerar_derivados('foto.png'))
+        for variante in VARIANTES:
+            with Image.open(caminho_derivado('foto.png', variante)) as derivado:
+                self.assertEqual(derivado.size[0], VARIANTES[variante]['max_lado'])
+
+        self.assertEqual(caminho_derivado('foto.png', 'impressao'),
+                         os.path.join(self.upload_dir, 'derivados', 'impressao', particao('foto.png'), 'foto.jpg'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,134 @@
+import unittest
+import sys
+import os
+import io
+import time
+import tempfile
+import threading
+from unittest import mock
+
+# Add the parent directory to the path so we can import the modules
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from flask import Flask
+from PIL import Image, features
+from image_resize import CacheImagens, imagens_cache, enviar_imagem, url_imagem, reduzir_na_decodificacao, redimensionar
+
+
+class ImageResizeTestCase(unittest.TestCase):
+    def setUp(self):
+        self.upload_dir = tempfile.mkdtemp()
+        self.app = Flask(__name__)
+        self.app.config['UPLOAD_FOLDER'] = self.upload_dir
+        self.app.config['CACHE_FOLDER'] = tempfile.mkdtemp()
+        self.app.add_url_rule('/uploads/<path:filename>', 'serve_upload', lambda filename: filename)
+        self.app.add_url_rule('/uploads/imagem/<int:largura>/<path:filename>', 'serve_imagem', enviar_imagem)
+        imagens_cache.init_app(self.app)
+        self.cliente = self.app.test_client()
+
+        self.nome = 'a' * 64 + '.png'
+        Image.new('RGB', (2000, 1000), 'blue').save(os.path.join(self.upload_dir, self.nome))
+
+    def test_redimensiona_pelo_accept_e_reaproveita(self):
+        url = f'/uploads/imagem/320/{self.nome}'
+        resposta = self.cliente.get(url, headers={'Accept': 'image/jpeg'})
+        self.assertEqual(resposta.mimetype, 'image/jpeg')
+        self.assertIn('immutable', resposta.headers['Cache-Control'])
+        self.assertIn('Accept', resposta.headers['Vary'])
+        with Image.open(io.BytesIO(resposta.data)) as imagem:
+            self.assertEqual(imagem.size, (320, 160))
+
+        etag = resposta.headers['ETag']
+        self.assertEqual(self.cliente.get(url, headers={'Accept': 'image/jpeg', 'If-None-Match': etag}).status_code, 304)
+
+        if features.check('webp'):
+            resposta = self.cliente.get(url, headers={'Accept': 'image/webp,image/*'})
+            self.assertEqual(resposta.mimetype, 'image/webp')
+            self.assertNotEqual(resposta.headers['ETag'], etag)
+        self.assertEqual(len(os.listdir(imagens_cache.pasta)), 2 if features.check('webp') else 1)
+
+    def test_recusa_largura_e_arquivo_invalidos(self):
+        self.assertEqual(self.cliente.get(f'/uploads/imagem/333/{self.nome}').status_code, 404)
+        self.assertEqual(self.cliente.get('/uploads/imagem/320/inexistente.png').status_code, 404)
+        self.assertEqual(self.cliente.get('/uploads/imagem/320/tabela.xlsx').status_code, 404)
+        with open(os.path.join(self.upload_dir, 'quebrada.jpg'), 'wb') as f:
+            f.write(b'nao e imagem')
+        self.assertEqual(self.cliente.get('/uploads/imagem/320/quebrada.jpg').status_code, 404)
+
+        with self.app.test_request_context():
+            self.assertEqual(url_imagem(self.nome, 320), f'/uploads/imagem/320/{self.nome}')
+            self.assertEqual(url_imagem('tabela.xlsx', 320), '/uploads/tabela.xlsx')
+
+    def test_jpeg_reduzido_na_decodificacao(self):
+        for orientacao in (1, 6):
+            exif = Image.Exif()
+            exif[0x0112] = orientacao
+            origem = os.path.join(self.upload_dir, f'grande_{orientacao}.jpg')
+            Image.new('RGB', (4000, 3000), 'red').save(origem, 'JPEG', exif=exif)
+
+            with Image.open(origem) as imagem:
+                reduzir_na_decodificacao(imagem, 160)
+                self.assertLess(imagem.size[0], 4000)
+                self.assertGreaterEqual(min(imagem.size), 160 if orientacao == 6 else 120)
+
+            destino = os.path.join(self.upload_dir, f'reduzida_{orientacao}.jpg')
+            redimensionar(origem, destino, 160, 'jpg')
+            with Image.open(destino) as imagem:
+                self.assertEqual(imagem.size, (160, 213) if orientacao == 6 else (160, 120))
+
+    def test_descarta_menos_usadas(self):
+        cache = CacheImagens()
+        cache.init_app(self.app)
+        cache.max_bytes = 250
+        for i, chave in enumerate(('a', 'b', 'c')):
+            with open(cache.caminho(chave, 'jpg'), 'wb') as f:
+                f.write(b'0' * 100)
+            os.utime(cache.caminho(chave, 'jpg'), (1000 + i, 1000 + i))
+        cache.obter('a', 'jpg')  # Acesso recente: 'b' passa a ser a menos usada
+
+        self.assertEqual(cache.descartar(), 1)
+        self.assertEqual(sorted(os.listdir(cache.pasta)), ['a.jpg', 'c.jpg'])
+
+    def test_geracoes_concorrentes_sao_coalescidas(self):
+        cache = CacheImagens()
+        cache.init_app(self.app)
+        geracoes = []
+
+        def gerar(destino):
+            geracoes.append(destino)
+            time.sleep(0.2)
+            with open(destino, 'wb') as f:
+                f.write(b'imagem')
+
+        resultados = []
+        threads = [threading.Thread(target=lambda: resultados.append(cache.obter_ou_gerar('x', 'jpg', gerar)))
+                   for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(geracoes), 1)
+        self.assertEqual(resultados, [cache.caminho('x', 'jpg')] * 5)
+
+    def test_geracao_sem_percorrer_a_pasta(self):
+        cache = CacheImagens()
+        cache.init_app(self.app)
+        cache.max_bytes = 250
+
+        def gerar(destino):
+            with open(destino, 'wb') as f:
+                f.write(b'0' * 100)
+
+        with mock.patch('image_resize.os.scandir', wraps=os.scandir) as scandir:
+            cache.obter_ou_gerar('a', 'jpg', gerar)
+            cache.obter_ou_gerar('b', 'jpg', gerar)
+            self.assertEqual(scandir.call_count, 1)  # Só a contagem inicial
+
+            cache.obter_ou_gerar('c', 'jpg', gerar)  # Acima do orçamento
+            self.assertEqual(scandir.call_count, 2)
+        self.assertEqual(len(os.listdir(cache.pasta)), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+import unittest
+import sys
+import os
+import io
+import zipfile
+import tempfile
+
+# Add the parent directory to the path so we can import the modules
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from flask import Flask
+from werkzeug.datastructures import MultiDict
+from models import db, Relatorio
+from pdf_batch import selecionar_relatorios, gerar_zip
+
+
+class PdfBatchTestCase(unittest.TestCase):
+    def setUp(self):
+        self.pdf_dir = tempfile.mkdtemp()
+        self.app = Flask(__name__)
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        self.app.config['PDF_LOTE_MAX_RELATORIOS'] = 3
+        db.init_app(self.app)
+
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+        for i in range(4):
+            db.session.add(Relatorio(descricao_geral=f'R{i}', colecao='Verão' if i < 2 else 'Inverno', temporada='2025'))
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_seleciona_por_filtros_e_ids(self):
+        self.assertEqual(selecionar_relatorios(MultiDict({'colecao': 'Verão'})), [1, 2])
+        self.assertEqual(selecionar_relatorios(MultiDict({'ids': '4,2'})), [2, 4])
+
+    def test_rejeita_lote_sem_filtro_invalido_ou_grande(self):
+        with self.assertRaises(ValueError):
+            selecionar_relatorios(MultiDict())
+        with self.assertRaises(ValueError):
+            selecionar_relatorios(MultiDict({'ids': '1,a'}))
+        with self.assertRaises(ValueError):
+            selecionar_relatorios(MultiDict({'temporada': '2025'}))
+
+    def test_zip_em_blocos_com_pdfs_em_cache(self):
+        itens = []
+        for i in range(2):
+            arquivo = f'chave{i}.pdf'
+            with open(os.path.join(self.pdf_dir, arquivo), 'wb') as f:
+                f.write(b'%PDF' + bytes([i]) * 200000)
+            itens.append((i, f'relatorio_{i}.pdf', arquivo))
+
+        blocos = list(gerar_zip(itens, self.pdf_dir))
+
+        self.assertGreater(len(blocos), 2)
+        with zipfile.ZipFile(io.BytesIO(b''.join(blocos))) as zf:
+            self.assertEqual(zf.namelist(), ['relatorio_0.pdf', 'relatorio_1.pdf'])
+            self.assertEqual(zf.read('relatorio_1.pdf')[:5], b'%PDF\x01')
+            self.assertIsNone(zf.testzip())
+
+
+if __name__ == '__main__':
+    unittest.main()
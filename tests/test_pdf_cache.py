@@ -0,0 +1,153 @@
+import unittest
+import sys
+import os
+import time
+import tempfile
+from unittest import mock
+
+# Add the parent directory to the path so we can import the modules
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from flask import Flask
+from models import db, Relatorio, Referencia, Prova, Foto
+from report_tree import carregar_arvore_relatorio, arvore_cache
+from pdf_cache import PdfCache, chave_pdf, chave_secao_capa, chave_secao_referencia
+
+
+class PdfCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.upload_dir = tempfile.mkdtemp()
+        self.pdf_dir = tempfile.mkdtemp()
+        self.app = Flask(__name__, root_path=os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        self.app.config['UPLOAD_FOLDER'] = self.upload_dir
+        self.app.config['PDF_FOLDER'] = self.pdf_dir
+        db.init_app(self.app)
+        arvore_cache.init_app(self.app)
+        arvore_cache.limpar()
+
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+        relatorio = Relatorio(descricao_geral='Cache')
+        db.session.add(relatorio)
+        db.session.flush()
+        ref = Referencia(relatorio_id=relatorio.id, tipo_categoria='kids', numero_ref='K1')
+        db.session.add(ref)
+        db.session.flush()
+        prova = Prova(referencia_id=ref.id, numero_prova=1)
+        db.session.add(prova)
+        db.session.flush()
+        db.session.add(Foto(prova_id=prova.id, contexto='desenho', file_path='desenho.jpg'))
+        outra = Referencia(relatorio_id=relatorio.id, tipo_categoria='baby', numero_ref='B1')
+        db.session.add(outra)
+        db.session.commit()
+        self.relatorio_id = relatorio.id
+        self.prova_id = prova.id
+
+        with open(os.path.join(self.upload_dir, 'desenho.jpg'), 'wb') as f:
+            f.write(b'foto')
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def _chave(self):
+        return chave_pdf(*carregar_arvore_relatorio(self.relatorio_id))
+
+    def test_chave_estavel_sem_alteracoes(self):
+        self.assertEqual(self._chave(), self._chave())
+
+    def test_chave_muda_com_conteudo(self):
+        antes = self._chave()
+        prova = db.session.get(Prova, self.prova_id)
+        prova.status = 'Aprovada'
+        db.session.commit()
+        self.assertNotEqual(antes, self._chave())
+
+    def test_chave_muda_com_arquivo_da_foto(self):
+        antes = self._chave()
+        with open(os.path.join(self.upload_dir, 'desenho.jpg'), 'wb') as f:
+            f.write(b'foto substituida')
+        self.assertNotEqual(antes, self._chave())
+
+    def test_chave_muda_com_versao_do_template(self):
+        antes = self._chave()
+        self.app.extensions.pop('pdf_template_versao', None)
+        self.app.config['PDF_TEMPLATE_VERSAO'] = '2'
+        self.assertNotEqual(antes, self._chave())
+
+    def _chaves_secoes(self):
+        relatorio, referencias = carregar_arvore_relatorio(self.relatorio_id)
+        return (
+            chave_secao_capa(relatorio, referencias, final=False),
+            [chave_secao_referencia(ref, final=i == len(referencias) - 1) for i, ref in enumerate(referencias)],
+        )
+
+    def test_alterar_prova_invalida_apenas_a_secao_da_referencia(self):
+        capa, referencias = self._chaves_secoes()
+        prova = db.session.get(Prova, self.prova_id)
+        prova.status = 'Aprovada'
+        prova.comentarios_qualidade = 'Ajustar barra'
+        db.session.commit()
+
+        nova_capa, novas_referencias = self._chaves_secoes()
+        self.assertEqual(capa, nova_capa)
+        self.assertNotEqual(referencias[0], novas_referencias[0])
+        self.assertEqual(referencias[1], novas_referencias[1])
+
+    def test_nova_prova_invalida_capa(self):
+        capa, referencias = self._chaves_secoes()
+        db.session.add(Prova(referencia_id=2, numero_prova=1))
+        db.session.commit()
+
+        nova_capa, novas_referencias = self._chaves_secoes()
+        self.assertNotEqual(capa, nova_capa)
+        self.assertEqual(referencias[0], novas_referencias[0])
+
+    def test_descarte_lru_por_tamanho(self):
+        cache = PdfCache()
+        cache.init_app(self.app)
+        cache.max_bytes = 250
+
+        cache.guardar('a', b'x' * 100)
+        cache.guardar('b', b'x' * 100)
+        antigo = time.time() - 60
+        os.utime(os.path.join(self.pdf_dir, 'a.pdf'), (antigo, antigo))
+        os.utime(os.path.join(self.pdf_dir, 'b.pdf'), (antigo - 60, antigo - 60))
+
+        # 'b' é o menos usado depois do acesso a 'a'
+        self.assertEqual(cache.obter('a'), 'a.pdf')
+        cache.guardar('c', b'x' * 100)
+
+        self.assertIsNotNone(cache.obter('a'))
+        self.assertIsNone(cache.obter('b'))
+        self.assertIsNotNone(cache.obter('c'))
+
+    def test_guardar_preserva_arquivo_novo_acima_do_limite(self):
+        cache = PdfCache()
+        cache.init_app(self.app)
+        cache.max_bytes = 10
+
+        cache.guardar('grande', b'x' * 100)
+        self.assertEqual(cache.obter('grande'), 'grande.pdf')
+
+    def test_guardar_sem_percorrer_a_pasta(self):
+        cache = PdfCache()
+        cache.init_app(self.app)
+        cache.max_bytes = 250
+
+        with mock.patch('pdf_cache.os.scandir', wraps=os.scandir) as scandir:
+            cache.guardar('a', b'x' * 100)
+            cache.guardar('b', b'x' * 100)
+            self.assertEqual(scandir.call_count, 1)  # Só a contagem inicial
+
+            cache.guardar('c', b'x' * 100)  # Acima do orçamento
+            self.assertEqual(scandir.call_count, 2)
+        self.assertEqual(len([n for n in os.listdir(self.pdf_dir) if n.endswith('.pdf')]), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+import unittest
+import sys
+import os
+import tempfile
+from datetime import datetime, timedelta
+
+# Add the parent directory to the path so we can import the modules
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from flask import Flask
+from models import db, Relatorio, TarefaPdf
+from pdf_jobs import (
+    pdf_bp, enfileirar_pdf, reivindicar_tarefas, recuperar_tarefas_interrompidas,
+    STATUS_PENDENTE, STATUS_PROCESSANDO
+)
+
+
+class PdfJobsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.pdf_dir = tempfile.mkdtemp()
+        self.app = Flask(__name__)
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        self.app.config['PDF_FOLDER'] = self.pdf_dir
+        self.app.config['PDF_DEBOUNCE_SEGUNDOS'] = 30
+        db.init_app(self.app)
+        self.app.register_blueprint(pdf_bp)
+
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+        relatorio = Relatorio(descricao_geral='PDF')
+        db.session.add(relatorio)
+        db.session.commit()
+        self.relatorio_id = relatorio.id
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_debounce_reagenda_tarefa_pendente(self):
+        primeira = enfileirar_pdf(self.relatorio_id, evento='CRIADO')
+        segunda = enfileirar_pdf(self.relatorio_id, evento='ATUALIZADO')
+
+        self.assertEqual(primeira.id, segunda.id)
+        self.assertEqual(TarefaPdf.query.count(), 1)
+        self.assertEqual(segunda.evento, 'ATUALIZADO')
+        self.assertGreater(segunda.executar_apos, datetime.utcnow() + timedelta(seconds=20))
+
+    def test_reivindicar_respeita_debounce_e_limite(self):
+        enfileirar_pdf(self.relatorio_id)
+        self.assertEqual(reivindicar_tarefas(5), [])
+
+        outro = Relatorio(descricao_geral='Outro')
+        db.session.add(outro)
+        db.session.commit()
+        imediata = enfileirar_pdf(outro.id, atraso=0)
+        enfileirar_pdf(self.relatorio_id, atraso=0)
+
+        reivindicadas = reivindicar_tarefas(1)
+        self.assertEqual(len(reivindicadas), 1)
+        self.assertEqual(reivindicar_tarefas(0), [])
+
+        tarefa = db.session.get(TarefaPdf, imediata.id)
+        self.assertIn(tarefa.status, (STATUS_PENDENTE, STATUS_PROCESSANDO))
+        self.assertEqual(TarefaPdf.query.filter_by(status=STATUS_PROCESSANDO).count(), 1)
+
+        # Uma tarefa já reivindicada não é reivindicada de novo
+        self.assertEqual(len(reivindicar_tarefas(5)), 1)
+        self.assertEqual(reivindicar_tarefas(5), [])
+
+    def test_recuperar_tarefas_interrompidas(self):
+        enfileirar_pdf(self.relatorio_id, atraso=0)
+        reivindicar_tarefas(1)
+
+        self.assertEqual(recuperar_tarefas_interrompidas(), 1)
+        self.assertEqual(TarefaPdf.query.filter_by(status=STATUS_PENDENTE).count(), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,139 @@
+import unittest
+import sys
+import os
+import io
+import time
+import tempfile
+from unittest import mock
+
+# Add the parent directory to the path so we can import the modules
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from flask import Flask
+from PIL import Image
+from models import db, Relatorio, Referencia, Prova, Foto
+from upload_store import registrar_eventos_arquivos
+from photo_ingest import interpretar_nome, ingerir_pasta, ArquivoRecusado, PASTA_PROCESSADAS, PASTA_REJEITADAS
+
+
+def _jpeg(cor):
+    saida = io.BytesIO()
+    Image.new('RGB', (40, 30), cor).save(saida, 'JPEG')
+    return saida.getvalue()
+
+
+class PhotoIngestTestCase(unittest.TestCase):
+    def setUp(self):
+        self.pasta = tempfile.mkdtemp()
+        self.app = Flask(__name__)
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        self.app.config['UPLOAD_FOLDER'] = tempfile.mkdtemp()
+        self.app.config['UPLOAD_MAX_MB'] = 1
+        self.app.config['UPLOAD_THREADS'] = 2
+        self.app.config['INGESTAO_PASTA'] = self.pasta
+        self.app.config['INGESTAO_LOTE'] = 2
+        self.app.config['INGESTAO_ESTABILIDADE_SEGUNDOS'] = 60
+        self.app.config['INGESTAO_MAX_TENTATIVAS'] = 3
+        self.app.config['INGESTAO_ESPERA_SEGUNDOS'] = 0
+        db.init_app(self.app)
+        registrar_eventos_arquivos()
+
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+        for descricao, numero_ref in (('Verão', 'B100'), ('Inverno', 'K200'), ('Outro', 'K200')):
+            relatorio = Relatorio(descricao_geral=descricao)
+            db.session.add(relatorio)
+            db.session.flush()
+            referencia = Referencia(relatorio_id=relatorio.id, tipo_categoria='baby', numero_ref=numero_ref)
+            db.session.add(referencia)
+            db.session.flush()
+            prova = Prova(referencia_id=referencia.id, numero_prova=1, tamanhos_recebidos='P, M')
+            db.session.add(prova)
+        db.session.commit()
+        self.prova = Prova.query.join(Referencia).filter(Referencia.numero_ref == 'B100').one()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def _soltar(self, arquivo, conteudo, antigo=True):
+        caminho = os.path.join(self.pasta, arquivo)
+        with open(caminho, 'wb') as f:
+            f.write(conteudo)
+        if antigo:
+            os.utime(caminho, (time.time() - 120, time.time() - 120))
+
+    def test_interpreta_nomes(self):
+        self.assertEqual(interpretar_nome('b100_P2_qualidade_01.jpg'),
+                         {'numero_ref': 'B100', 'numero_prova': 2, 'contexto': 'qualidade', 'tamanho': None})
+        self.assertEqual(interpretar_nome('REF_A_p1_prova_modelo_3a6meses_2.JPG'),
+                         {'numero_ref': 'REF_A', 'numero_prova': 1, 'contexto': 'prova_modelo', 'tamanho': '3a6meses'})
+        for nome in ('B100_qualidade.jpg', 'B100_P1_costas.jpg', 'B100_P1_amostra.jpg', 'B100_P1_estilo_M.jpg'):
+            with self.assertRaises(ArquivoRecusado, msg=nome):
+                interpretar_nome(nome)
+
+    def test_importa_em_lotes_e_relata_cada_arquivo(self):
+        self._soltar('B100_P1_desenho_01.jpg', _jpeg('red'))
+        self._soltar('B100_P1_desenho_02.jpg', _jpeg('red'))  # Mesmo conteúdo
+        self._soltar('b100_P1_amostra_m_01.jpg', _jpeg('blue'))
+        self._soltar('B100_P1_amostra_GG_01.jpg', _jpeg('blue'))
+        self._soltar('K200_P1_estilo.jpg', _jpeg('green'))  # Referência em dois relatórios
+        self._soltar('X999_P1_estilo.jpg', _jpeg('green'))
+        self._soltar('B100_P1_estilo.jpg', _jpeg('green')[:50])  # Cópia incompleta
+        self._soltar('B100_P1_modelagem.pdf', b'%PDF')
+        self._soltar('B100_P1_qualidade.jpg', _jpeg('white'), antigo=False)  # Ainda sendo copiada
+
+        resultados = {r['arquivo']: r['situacao'] for r in ingerir_pasta()}
+        self.assertEqual(resultados, {
+            'B100_P1_desenho_01.jpg': 'importada',
+            'B100_P1_desenho_02.jpg': 'duplicada',
+            'b100_P1_amostra_m_01.jpg': 'importada',
+            'B100_P1_amostra_GG_01.jpg': 'rejeitada',
+            'K200_P1_estilo.jpg': 'rejeitada',
+            'X999_P1_estilo.jpg': 'rejeitada',
+            'B100_P1_estilo.jpg': 'rejeitada',
+            'B100_P1_modelagem.pdf': 'rejeitada',
+        })
+
+        fotos = sorted((f.contexto, f.tamanho) for f in Foto.query.filter_by(prova_id=self.prova.id))
+        self.assertEqual(fotos, [('amostra', 'M'), ('desenho', None)])
+        self.assertEqual(sorted(os.listdir(self.pasta)),
+                         sorted(['B100_P1_qualidade.jpg', PASTA_PROCESSADAS, PASTA_REJEITADAS, 'relatorios']))
+        rejeitadas = os.path.join(self.pasta, PASTA_REJEITADAS, os.listdir(os.path.join(self.pasta, PASTA_REJEITADAS))[0])
+        with open(os.path.join(rejeitadas, 'X999_P1_estilo.jpg.erro.txt'), encoding='utf-8') as f:
+            self.assertIn('não encontrada', f.read())
+
+        # O mesmo arquivo enviado de novo não duplica a foto
+        self._soltar('B100_P1_desenho_03.jpg', _jpeg('red'))
+        self.assertEqual([r['situacao'] for r in ingerir_pasta()], ['duplicada'])
+        self.assertEqual(Foto.query.filter_by(prova_id=self.prova.id).count(), 2)
+
+    def test_falha_persistente_vai_para_rejeitadas(self):
+        self._soltar('B100_P1_desenho.jpg', _jpeg('red'))
+        contador = os.path.join(self.pasta, '.B100_P1_desenho.jpg.tentativas')
+
+        with mock.patch('photo_ingest.gerar_derivados', side_effect=OSError('disco cheio')):
+            resultado, = ingerir_pasta()
+            self.assertEqual((resultado['situacao'], resultado['detalhe']), ('erro', 'disco cheio (tentativa 1 de 3)'))
+            self.assertTrue(os.path.exists(contador))
+
+            # Dentro da espera após a falha o arquivo não é tentado de novo
+            self.app.config['INGESTAO_ESPERA_SEGUNDOS'] = 3600
+            self.assertEqual(ingerir_pasta(), [])
+            self.app.config['INGESTAO_ESPERA_SEGUNDOS'] = 0
+
+            self.assertEqual(ingerir_pasta()[0]['situacao'], 'erro')
+            resultado, = ingerir_pasta()
+
+        self.assertEqual(resultado['situacao'], 'rejeitada')
+        self.assertIn('desistência após 3 tentativas', resultado['detalhe'])
+        self.assertFalse(os.path.exists(contador))
+        self.assertNotIn('B100_P1_desenho.jpg', os.listdir(self.pasta))
+        self.assertEqual(Foto.query.count(), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
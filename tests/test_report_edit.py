@@ -0,0 +1,156 @@
+import unittest
+import sys
+import os
+from datetime import datetime
+
+# Add the parent directory to the path so we can import the modules
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from flask import Flask
+from sqlalchemy import event
+from werkzeug.datastructures import MultiDict
+from models import db, Relatorio, Referencia, Prova
+from report_tree import registrar_eventos_versao
+from utils import LoteUploads
+from report_edit import aplicar_formulario
+
+
+class ReportEditTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        db.init_app(self.app)
+        registrar_eventos_versao()
+
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+        ids = []
+        for descricao in ('Editado', 'Outro'):
+            relatorio = Relatorio(descricao_geral=descricao, colecao='Verão')
+            db.session.add(relatorio)
+            db.session.flush()
+            referencia = Referencia(relatorio_id=relatorio.id, tipo_categoria='adulto', numero_ref='A1',
+                                    fornecedor='Malhas Sul')
+            db.session.add(referencia)
+            db.session.flush()
+            prova = Prova(referencia_id=referencia.id, numero_prova=1, tamanhos_recebidos='P, M',
+                          obs_estilo='Ajustar gola')
+            db.session.add(prova)
+            db.session.flush()
+            ids.append((relatorio.id, referencia.id, prova.id))
+        db.session.commit()
+
+        # Datas fixas: qualquer UPDATE indevido muda updated_at
+        editado = datetime(2024, 1, 1)
+        for modelo in (Relatorio, Referencia, Prova):
+            db.session.execute(modelo.__table__.update().values(updated_at=editado))
+        db.session.commit()
+        (self.relatorio_id, self.referencia_id, self.prova_id), (_, _, self.prova_outro_id) = ids
+
+        self.comandos = []
+        event.listen(db.engine, 'before_cursor_execute', self._registrar)
+
+    def tearDown(self):
+        event.remove(db.engine, 'before_cursor_execute', self._registrar)
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def _registrar(self, conn, cursor, statement, *args):
+        self.comandos.append(statement)
+
+    def _formulario(self, **alteracoes):
+        p, r = self.prova_id, self.referencia_id
+        form = MultiDict({
+            'descricao_geral': 'Editado', 'colecao': 'Verão', 'ref_adulto': 'A1',
+            f'fornecedor_ref_{r}': 'Malhas Sul', f'obs_estilo_{p}': 'Ajustar gola',
+            f'versao_ref_{r}': '1', f'versao_{p}': '1',
+        })
+        form.setlist('prova_id_adulto', [str(p)])
+        form.setlist(f'tamanhos_recebidos_{p}', ['P', 'M'])
+        for campo, valor in alteracoes.items():
+            form[campo] = valor
+        return form
+
+    def _enviar(self, form):
+        """Mesmo fluxo da rota: aplica, conclui os uploads e grava se algo mudou"""
+        db.session.expire_all()
+        self.comandos.clear()
+        with self.app.test_request_context(method='POST'):
+            relatorio = db.session.get(Relatorio, self.relatorio_id)
+            lote = LoteUploads()
+            alterado, self.conflitos = aplicar_formulario(relatorio, form, MultiDict(), lote)
+            if lote.concluir() or alterado:
+                db.session.commit()
+        return alterado
+
+    def _escritas(self):
+        return [c for c in self.comandos if c.split()[0].upper() in ('INSERT', 'UPDATE', 'DELETE')]
+
+    def _estado(self):
+        db.session.expire_all()
+        return [(obj.versao, obj.updated_at) for obj in (db.session.get(Relatorio, self.relatorio_id),
+                                                         db.session.get(Referencia, self.referencia_id),
+                                                         db.session.get(Prova, self.prova_id))]
+
+    def test_formulario_sem_mudancas_nao_escreve(self):
+        antes = self._estado()
+
+        self.assertFalse(self._enviar(self._formulario()))
+
+        self.assertEqual(self._escritas(), [])
+        # Relatório, referências (IN) e provas (IN)
+        self.assertEqual(len([c for c in self.comandos if c.lstrip().upper().startswith('SELECT')]), 3)
+        self.assertEqual(self._estado(), antes)
+
+    def test_so_a_coluna_alterada_e_gravada(self):
+        antes = self._estado()
+
+        self.assertTrue(self._enviar(self._formulario(**{f'obs_estilo_{self.prova_id}': 'Gola ok'})))
+
+        atualizacoes = [c for c in self._escritas() if c.lstrip().upper().startswith('UPDATE PROVAS')]
+        self.assertEqual(len(atualizacoes), 1)
+        colunas = atualizacoes[0].split(' SET ')[1].split(' WHERE ')[0]
+        self.assertEqual(sorted(c.split('=')[0].strip() for c in colunas.split(',')),
+                         ['obs_estilo', 'updated_at', 'versao'])
+        self.assertFalse(any(c.lstrip().upper().startswith('UPDATE REFERENCIAS') for c in self._escritas()))
+
+        depois = self._estado()
+        self.assertEqual(depois[1], antes[1])  # Referência intacta
+        self.assertEqual(depois[2][0], antes[2][0] + 1)
+        self.assertEqual(db.session.get(Prova, self.prova_id).obs_estilo, 'Gola ok')
+
+    def test_prova_de_outro_relatorio_e_ignorada(self):
+        outra = self.prova_outro_id
+        form = self._formulario(**{f'obs_estilo_{outra}': 'Invadida'})
+        form.setlist('prova_id_adulto', [str(self.prova_id), str(outra)])
+
+        self.assertFalse(self._enviar(form))
+
+        self.assertEqual(self._escritas(), [])
+        self.assertEqual(db.session.get(Prova, outra).obs_estilo, 'Ajustar gola')
+
+    def test_card_com_versao_antiga_e_recusado(self):
+        # Outra pessoa salvou a prova (salvamento automático) depois que a página foi aberta
+        prova = db.session.get(Prova, self.prova_id)
+        prova.obs_estilo = 'Gola ok'
+        db.session.commit()
+
+        # Formulário aberto antes: reenviar o valor antigo não sobrescreve o novo
+        form = self._formulario(**{f'fornecedor_ref_{self.referencia_id}': 'Malhas Norte'})
+        self.assertTrue(self._enviar(form))
+        self.assertEqual(self.conflitos, ['1ª prova da referência A1'])
+        self.assertEqual(db.session.get(Prova, self.prova_id).obs_estilo, 'Gola ok')
+        self.assertEqual(db.session.get(Referencia, self.referencia_id).fornecedor, 'Malhas Norte')
+
+        # Mesmos valores atuais com a versão antiga (salvamento em andamento): sem conflito
+        self.assertFalse(self._enviar(self._formulario(**{
+            f'obs_estilo_{self.prova_id}': 'Gola ok', f'fornecedor_ref_{self.referencia_id}': 'Malhas Norte',
+            f'versao_ref_{self.referencia_id}': '2'})))
+        self.assertEqual(self.conflitos, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,107 @@
+import unittest
+import sys
+import os
+
+# Add the parent directory to the path so we can import the modules
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from flask import Flask
+from sqlalchemy import event
+from models import db, Relatorio, Referencia, Prova, Foto
+from report_tree import carregar_arvore_relatorio, arvore_cache
+
+
+class ReportTreeTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        self.app.config['UPLOAD_FOLDER'] = '/srv/uploads'
+        db.init_app(self.app)
+        arvore_cache.init_app(self.app)
+        arvore_cache.limpar()
+
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+        relatorio = Relatorio(descricao_geral='Árvore')
+        db.session.add(relatorio)
+        db.session.flush()
+        for tipo in ['baby', 'kids', 'teen', 'adulto']:
+            ref = Referencia(relatorio_id=relatorio.id, tipo_categoria=tipo, numero_ref=tipo.upper())
+            db.session.add(ref)
+            db.session.flush()
+            for numero in [3, 1, 2]:
+                prova = Prova(referencia_id=ref.id, numero_prova=numero, tamanhos_recebidos='P, M')
+                db.session.add(prova)
+                db.session.flush()
+                db.session.add_all([
+                    Foto(prova_id=prova.id, contexto='desenho', file_path=f'{tipo}_{numero}_a.jpg'),
+                    Foto(prova_id=prova.id, contexto='desenho', file_path=f'{tipo}_{numero}_b.jpg'),
+                    Foto(prova_id=prova.id, contexto='amostra', tamanho='P', file_path=f'{tipo}_{numero}_c.jpg'),
+                ])
+        db.session.commit()
+        self.relatorio_id = relatorio.id
+        db.session.expunge_all()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def _contar_queries(self, funcao):
+        queries = []
+
+        def contar(conn, cursor, statement, *args):
+            queries.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute', contar)
+        try:
+            resultado = funcao()
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', contar)
+        return resultado, len(queries)
+
+    def test_numero_constante_de_queries(self):
+        (_, referencias), queries = self._contar_queries(lambda: carregar_arvore_relatorio(self.relatorio_id))
+        self.assertEqual(len(referencias), 4)
+        # versão + relatório + referencias + provas + fotos
+        self.assertEqual(queries, 5)
+
+    def test_cache_hit_usa_apenas_versao(self):
+        primeira = carregar_arvore_relatorio(self.relatorio_id)
+        segunda, queries = self._contar_queries(lambda: carregar_arvore_relatorio(self.relatorio_id))
+        self.assertIs(segunda, primeira)
+        self.assertEqual(queries, 1)
+
+    def test_escrita_em_filho_invalida_cache(self):
+        relatorio, _ = carregar_arvore_relatorio(self.relatorio_id)
+        prova = Prova.query.first()
+        db.session.add(Foto(prova_id=prova.id, contexto='estilo', file_path='novo.jpg'))
+        db.session.commit()
+
+        atualizado, referencias = carregar_arvore_relatorio(self.relatorio_id)
+        self.assertEqual(atualizado['versao'], relatorio['versao'] + 1)
+        fotos_estilo = [f for ref in referencias for p in ref['provas'] for f in p['fotos'].get('estilo', [])]
+        self.assertEqual([f['file_path'] for f in fotos_estilo], ['novo.jpg'])
+
+    def test_escrita_no_relatorio_invalida_cache(self):
+        carregar_arvore_relatorio(self.relatorio_id)
+        db.session.get(Relatorio, self.relatorio_id).colecao = 'Inverno'
+        db.session.commit()
+
+        relatorio, _ = carregar_arvore_relatorio(self.relatorio_id)
+        self.assertEqual(relatorio['colecao'], 'Inverno')
+
+    def test_estrutura(self):
+        _, referencias = carregar_arvore_relatorio(self.relatorio_id)
+        provas = referencias[0]['provas']
+        self.assertEqual([p['numero_prova'] for p in provas], [1, 2, 3])
+        self.assertEqual(provas[0]['tamanhos_lista'], ['P', 'M'])
+        self.assertEqual(len(provas[0]['fotos']['desenho']), 2)
+        self.assertEqual(len(provas[0]['fotos']['amostra']), 1)
+        self.assertEqual(provas[0]['fotos']['amostra'][0]['caminho_absoluto'], '/srv/uploads/baby_1_c.jpg')
+
+
+if __name__ == '__main__':
+    unittest.main()
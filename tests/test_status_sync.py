@@ -0,0 +1,107 @@
+import unittest
+import sys
+import os
+
+# Add the parent directory to the path so we can import the modules
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from flask import Flask
+from sqlalchemy import update
+from models import db, Relatorio, Referencia, Prova
+from status_sync import registrar_eventos_status, reparar_status
+
+
+class StatusSyncTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        db.init_app(self.app)
+        registrar_eventos_status()
+
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+        self.relatorio = Relatorio(descricao_geral='Teste')
+        db.session.add(self.relatorio)
+        db.session.flush()
+        self.baby = Referencia(relatorio_id=self.relatorio.id, tipo_categoria='baby', numero_ref='B1')
+        self.kids = Referencia(relatorio_id=self.relatorio.id, tipo_categoria='kids', numero_ref='K1')
+        db.session.add_all([self.baby, self.kids])
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_relatorio_sem_provas(self):
+        self.assertEqual(self.relatorio.status_atual, 'Novo')
+        self.assertEqual(self.relatorio.total_provas, 0)
+        self.assertIsNone(self.relatorio.ultima_prova_id)
+
+    def test_criacao_de_prova(self):
+        p1 = Prova(referencia_id=self.baby.id, numero_prova=1, status='Reprovada')
+        p2 = Prova(referencia_id=self.kids.id, numero_prova=2, status='Comitê')
+        db.session.add_all([p1, p2])
+        db.session.commit()
+
+        self.assertEqual(self.baby.status_atual, 'Reprovada')
+        self.assertEqual(self.baby.total_provas, 1)
+        self.assertEqual(self.relatorio.status_atual, 'Comitê')
+        self.assertEqual(self.relatorio.ultima_prova_id, p2.id)
+        self.assertEqual(self.relatorio.total_provas, 2)
+
+    def test_atualizacao_de_status(self):
+        prova = Prova(referencia_id=self.baby.id, numero_prova=1)
+        db.session.add(prova)
+        db.session.commit()
+        self.assertEqual(self.relatorio.status_atual, 'Em Andamento')
+
+        prova.status = 'Aprovada'
+        db.session.commit()
+        self.assertEqual(self.relatorio.status_atual, 'Aprovada')
+        self.assertEqual(self.baby.status_atual, 'Aprovada')
+
+    def test_exclusao_de_prova(self):
+        p1 = Prova(referencia_id=self.baby.id, numero_prova=1, status='Reprovada')
+        p2 = Prova(referencia_id=self.baby.id, numero_prova=2, status='Aprovada')
+        db.session.add_all([p1, p2])
+        db.session.commit()
+
+        db.session.delete(p2)
+        db.session.commit()
+        self.assertEqual(self.relatorio.status_atual, 'Reprovada')
+        self.assertEqual(self.baby.total_provas, 1)
+        self.assertEqual(self.baby.ultima_prova_id, p1.id)
+
+    def test_exclusao_de_referencia(self):
+        db.session.add(Prova(referencia_id=self.kids.id, numero_prova=1, status='Aprovada'))
+        db.session.commit()
+
+        db.session.delete(self.kids)
+        db.session.commit()
+        self.assertEqual(self.relatorio.status_atual, 'Novo')
+        self.assertEqual(self.relatorio.total_provas, 0)
+
+    def test_rollback_desfaz_recalculo(self):
+        db.session.add(Prova(referencia_id=self.baby.id, numero_prova=1, status='Aprovada'))
+        db.session.flush()
+        db.session.rollback()
+        self.assertEqual(self.relatorio.status_atual, 'Novo')
+
+    def test_reparar_status(self):
+        db.session.add(Prova(referencia_id=self.baby.id, numero_prova=1, status='Aprovada'))
+        db.session.commit()
+        db.session.execute(update(Relatorio).values(status_atual=None, total_provas=None))
+        db.session.commit()
+        db.session.expire_all()
+
+        reparar_status(db.session)
+        db.session.commit()
+        self.assertEqual(self.relatorio.status_atual, 'Aprovada')
+        self.assertEqual(self.relatorio.total_provas, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
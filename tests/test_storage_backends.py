@@ -0,0 +1,173 @@
+import unittest
+import sys
+import os
+import io
+import time
+import tempfile
+from unittest import mock
+from datetime import datetime, timezone
+
+# Add the parent directory to the path so we can import the modules
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from flask import Flask
+from upload_store import gravar_stream, enviar_upload
+from storage_backends import ArmazenamentoS3
+
+
+class ErroCliente(Exception):
+    def __init__(self, codigo):
+        super().__init__(codigo)
+        self.response = {'Error': {'Code': codigo}}
+
+
+class ClienteS3Falso:
+    """Cliente S3 em memória com a parte da interface do boto3 usada pelo backend"""
+
+    def __init__(self):
+        self.objetos = {}
+        self.envios = {}
+        self.chamadas = []
+
+    def _objeto(self, Key):
+        if Key not in self.objetos:
+            raise ErroCliente('404')
+        return self.objetos[Key]
+
+    def _gravar(self, Key, dados):
+        self.objetos[Key] = {'dados': dados, 'data': datetime.now(timezone.utc)}
+
+    def head_object(self, Bucket, Key):
+        objeto = self._objeto(Key)
+        return {'ContentLength': len(objeto['dados']), 'LastModified': objeto['data']}
+
+    def put_object(self, Bucket, Key, Body, ContentType=None):
+        self.chamadas.append('put_object')
+        self._gravar(Key, Body.read())
+
+    def create_multipart_upload(self, Bucket, Key, ContentType=None):
+        self.envios['u1'] = {}
+        return {'UploadId': 'u1'}
+
+    def upload_part(self, Bucket, Key, PartNumber, UploadId, Body):
+        self.chamadas.append('upload_part')
+        self.envios[UploadId][PartNumber] = Body
+        return {'ETag': f'"{PartNumber}"'}
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload):
+        partes = self.envios.pop(UploadId)
+        self._gravar(Key, b''.join(partes[parte['PartNumber']] for parte in MultipartUpload['Parts']))
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId):
+        self.envios.pop(UploadId, None)
+
+    def copy_object(self, Bucket, Key, CopySource, **kwargs):
+        self.chamadas.append('copy_object')
+        self._gravar(Key, self._objeto(CopySource['Key'])['dados'])
+
+    def get_object(self, Bucket, Key, Range=None):
+        dados = self._objeto(Key)['dados']
+        if Range:
+            inicio, fim = Range[len('bytes='):].split('-')
+            dados = dados[int(inicio):int(fim) + 1 if fim else None]
+        return {'Body': io.BytesIO(dados)}
+
+    def delete_object(self, Bucket, Key):
+        self.objetos.pop(Key, None)
+
+    def list_objects_v2(self, Bucket, Prefix, Delimiter=None, ContinuationToken=None):
+        chaves = sorted(chave for chave in self.objetos
+                        if chave.startswith(Prefix) and not (Delimiter and Delimiter in chave[len(Prefix):]))
+        return {'Contents': [{'Key': chave, 'Size': len(self.objetos[chave]['dados']),
+                              'LastModified': self.objetos[chave]['data']} for chave in chaves]}
+
+    def generate_presigned_url(self, operacao, Params, ExpiresIn):
+        return f"https://bucket.exemplo/{Params['Key']}?expira={ExpiresIn}"
+
+
+class ArmazenamentoS3TestCase(unittest.TestCase):
+    def setUp(self):
+        self.upload_dir = tempfile.mkdtemp()
+        self.cliente = ClienteS3Falso()
+        self.backend = ArmazenamentoS3(self.cliente, 'bucket', prefixo='uploads/', pasta_cache=tempfile.mkdtemp())
+        self.backend.tamanho_parte = 4  # O mínimo real (5MB) deixaria o teste lento
+
+        self.app = Flask(__name__)
+        self.app.config['UPLOAD_FOLDER'] = self.upload_dir
+        self.app.config['UPLOAD_CARENCIA_SEGUNDOS'] = 3600
+        self.app.config['S3_URL_ASSINADA'] = True
+        self.app.config['S3_URL_ASSINADA_SEGUNDOS'] = 300
+        self.app.extensions['armazenamento'] = self.backend
+        self.app.add_url_rule('/uploads/<path:filename>', 'serve_upload', enviar_upload)
+        self.cliente_http = self.app.test_client()
+
+    def _gravar(self, conteudo, filename='medidas.xlsx'):
+        with self.app.app_context():
+            return gravar_stream(io.BytesIO(conteudo), filename, 1024)
+
+    def test_grava_em_partes_e_reaproveita_conteudo(self):
+        nome = self._gravar(b'0123456789')
+        self.assertEqual(self.cliente.objetos['uploads/' + nome]['dados'], b'0123456789')
+        self.assertEqual(self.cliente.chamadas.count('upload_part'), 3)
+        self.assertEqual(os.listdir(self.upload_dir), [])  # Nada fica na pasta local
+
+        # Mesmo conteúdo: só renova a data do objeto
+        self.assertEqual(self._gravar(b'0123456789'), nome)
+        self.assertEqual(self.cliente.chamadas.count('upload_part'), 3)
+        self.assertEqual(self.cliente.chamadas.count('copy_object'), 1)
+
+        self.assertEqual(b''.join(self.backend.ler(nome, 2, 6)), b'2345')
+        self.assertEqual([item[:2] for item in self.backend.listar()], [(nome, 10)])
+
+    def test_copia_local_e_descarte(self):
+        nomes = [self._gravar(conteudo) for conteudo in (b'aaaa', b'bbbb', b'cccc')]
+        for nome in nomes:
+            os.remove(self.backend.caminho(nome))
+
+        caminho = self.backend.caminho_local(nomes[0])
+        with open(caminho, 'rb') as f:
+            self.assertEqual(f.read(), b'aaaa')
+        self.assertIsNone(self.backend.caminho_local('inexistente.pdf'))
+
+        self.backend.max_cache_bytes = 8
+        for nome in nomes[1:]:
+            self.backend.caminho_local(nome)
+        self.assertEqual(sorted(os.listdir(self.backend.pasta_local)),
+                         sorted(os.path.basename(nome) for nome in nomes[1:]))
+
+    def test_copias_locais_sem_percorrer_a_pasta(self):
+        self.backend.max_cache_bytes = 10
+        with mock.patch('storage_backends.os.scandir', wraps=os.scandir) as scandir:
+            nomes = [self._gravar(conteudo) for conteudo in (b'aaaa', b'bbbb')]
+            # Total em memória: só a primeira gravação conta os arquivos da pasta
+            self.assertEqual(scandir.call_count, 1)
+
+            # Acima do orçamento: percorre e descarta a menos usada, nunca a recém-gravada
+            antigo = time.time() - 60
+            os.utime(self.backend.caminho(nomes[0]), (antigo, antigo))
+            novo = self._gravar(b'cccc')
+            self.assertEqual(scandir.call_count, 2)
+        self.assertEqual(sorted(os.listdir(self.backend.pasta_local)),
+                         sorted(os.path.basename(nome) for nome in (nomes[1], novo)))
+
+    def test_download_redireciona_ou_le_faixas(self):
+        nome = self._gravar(b'%PDF conteudo')
+
+        resposta = self.cliente_http.get(f'/uploads/{nome}')
+        self.assertEqual(resposta.status_code, 302)
+        self.assertEqual(resposta.headers['Location'], f'https://bucket.exemplo/uploads/{nome}?expira=300')
+        self.assertIn('max-age=150', resposta.headers['Cache-Control'])
+
+        self.app.config['S3_URL_ASSINADA'] = False
+        resposta = self.cliente_http.get(f'/uploads/{nome}', headers={'Range': 'bytes=5-'})
+        self.assertEqual(resposta.status_code, 206)
+        self.assertEqual(resposta.data, b'conteudo')
+        self.assertEqual(resposta.headers['Content-Range'], 'bytes 5-12/13')
+
+        etag = resposta.headers['ETag']
+        self.assertEqual(self.cliente_http.get(f'/uploads/{nome}', headers={'If-None-Match': etag}).status_code, 304)
+        self.assertEqual(self.cliente_http.get('/uploads/inexistente.pdf').status_code, 404)
+
+
+if __name__ == '__main__':
+    unittest.main()
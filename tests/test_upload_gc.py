@@ -0,0 +1,113 @@
+import unittest
+import sys
+import os
+import io
+import time
+import tempfile
+
+# Add the parent directory to the path so we can import the modules
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from flask import Flask
+from models import db, Relatorio, Referencia, Prova, Foto, ArquivoUpload, Usuario, SessaoUpload
+from upload_store import gravar_stream, registrar_eventos_arquivos
+from upload_gc import coletar_orfaos, PASTA_QUARENTENA
+
+
+class UploadGcTestCase(unittest.TestCase):
+    def setUp(self):
+        self.upload_dir = tempfile.mkdtemp()
+        self.app = Flask(__name__)
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        self.app.config['UPLOAD_FOLDER'] = self.upload_dir
+        self.app.config['UPLOAD_CARENCIA_SEGUNDOS'] = 3600
+        self.app.config['UPLOAD_SESSAO_HORAS'] = 24
+        db.init_app(self.app)
+        registrar_eventos_arquivos()
+
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+        relatorio = Relatorio(descricao_geral='Teste')
+        db.session.add_all([relatorio, Usuario(id=1, username='ana', password_hash='x')])
+        db.session.flush()
+        referencia = Referencia(relatorio_id=relatorio.id, tipo_categoria='baby', numero_ref='B1')
+        db.session.add(referencia)
+        db.session.flush()
+        self.prova = Prova(referencia_id=referencia.id, numero_prova=1)
+        db.session.add(self.prova)
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def _criar(self, relativo, conteudo=b'x' * 10, antigo=True):
+        caminho = os.path.join(self.upload_dir, relativo)
+        os.makedirs(os.path.dirname(caminho), exist_ok=True)
+        with open(caminho, 'wb') as f:
+            f.write(conteudo)
+        if antigo:
+            os.utime(caminho, (time.time() - 7200, time.time() - 7200))
+        return caminho
+
+    def _envelhecer(self, nome):
+        caminho = os.path.join(self.upload_dir, nome)
+        os.utime(caminho, (time.time() - 7200, time.time() - 7200))
+
+    def test_relata_e_move_para_quarentena(self):
+        usado = gravar_stream(io.BytesIO(b'planilha usada'), 'medidas.xlsx', 1024)
+        self.prova.tabela_medidas_path = usado
+        db.session.add(Foto(prova_id=self.prova.id, contexto='desenho', file_path='legado.jpg'))
+        db.session.commit()
+        orfao = gravar_stream(io.BytesIO(b'planilha do rollback'), 'medidas.xlsx', 1024)
+        pendente = gravar_stream(io.BytesIO(b'%PDF enviado em partes'), 'a.pdf', 1024)
+        db.session.add(SessaoUpload(id='s' * 32, usuario_id=1, filename='a.pdf', tamanho=10,
+                                    status='concluida', arquivo=pendente))
+        db.session.commit()
+        for nome in (usado, orfao, pendente):
+            self._envelhecer(nome)
+
+        self._criar('legado.jpg')
+        self._criar('derivados/impressao/legado.jpg')
+        self._criar('derivados/impressao/removida.jpg')
+        self._criar('derivados/miniatura/legado.jpg')  # Variante que não existe mais
+        self._criar('.upload-abc.tmp')
+        self._criar('.sessoes/' + 'f' * 32 + '.parte')
+        self._criar('recente.pdf', antigo=False)
+
+        relatorio = coletar_orfaos()
+        orfaos = sorted(caminho for _, caminho, _ in relatorio['orfaos'])
+        esperados = sorted([orfao, '.upload-abc.tmp', os.path.join('.sessoes', 'f' * 32 + '.parte'),
+                            os.path.join('derivados', 'impressao', 'removida.jpg'),
+                            os.path.join('derivados', 'miniatura', 'legado.jpg')])
+        self.assertEqual(orfaos, esperados)
+        self.assertEqual(relatorio['categorias']['arquivos']['bytes'], len(b'planilha do rollback'))
+        self.assertTrue(os.path.exists(os.path.join(self.upload_dir, orfao)))  # Simulação não altera nada
+
+        relatorio = coletar_orfaos(executar=True)
+        quarentena = relatorio['quarentena']
+        self.assertTrue(quarentena.startswith(os.path.join(self.upload_dir, PASTA_QUARENTENA)))
+        self.assertTrue(os.path.exists(os.path.join(quarentena, orfao)))
+        self.assertFalse(os.path.exists(os.path.join(self.upload_dir, orfao)))
+        self.assertIsNone(db.session.get(ArquivoUpload, orfao))
+        for nome in (usado, pendente, 'legado.jpg', 'recente.pdf', 'derivados/impressao/legado.jpg'):
+            self.assertTrue(os.path.exists(os.path.join(self.upload_dir, nome)), nome)
+
+        # A quarentena não é varrida de novo
+        self.assertEqual(coletar_orfaos()['orfaos'], [])
+
+    def test_apaga_com_carencia_informada(self):
+        self._criar('velho.pdf', antigo=False)
+
+        self.assertEqual(coletar_orfaos(executar=True, apagar=True)['orfaos'], [])
+        relatorio = coletar_orfaos(executar=True, apagar=True, carencia_segundos=-1)
+        self.assertEqual([caminho for _, caminho, _ in relatorio['orfaos']], ['velho.pdf'])
+        self.assertIsNone(relatorio['quarentena'])
+        self.assertEqual(os.listdir(self.upload_dir), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
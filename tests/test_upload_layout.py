@@ -0,0 +1,142 @@
+import unittest
+import sys
+import os
+import io
+import hashlib
+import tempfile
+from datetime import datetime
+
+# Add the parent directory to the path so we can import the modules
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from flask import Flask
+from PIL import Image
+from models import db, Relatorio, Referencia, Prova, Foto, ArquivoUpload
+from upload_store import gravar_stream, registrar_eventos_arquivos, recontar_referencias, remover_blob, enviar_upload
+from upload_layout import migrar_layout
+from report_tree import carregar_arvore_relatorio, arvore_cache
+from storage_backends import armazenamento, nome_particionado, nome_alternativo
+
+
+class UploadLayoutTestCase(unittest.TestCase):
+    def setUp(self):
+        self.upload_dir = tempfile.mkdtemp()
+        self.app = Flask(__name__)
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        self.app.config['UPLOAD_FOLDER'] = self.upload_dir
+        self.app.config['UPLOAD_CARENCIA_SEGUNDOS'] = 0
+        self.app.config['UPLOAD_X_ACCEL_REDIRECT'] = False
+        self.app.add_url_rule('/uploads/<path:filename>', 'serve_upload', enviar_upload)
+        db.init_app(self.app)
+        arvore_cache.init_app(self.app)
+        arvore_cache.limpar()
+        registrar_eventos_arquivos()
+
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+        self.relatorio = Relatorio(descricao_geral='Teste')
+        db.session.add(self.relatorio)
+        db.session.flush()
+        referencia = Referencia(relatorio_id=self.relatorio.id, tipo_categoria='baby', numero_ref='B1')
+        db.session.add(referencia)
+        db.session.flush()
+        self.prova = Prova(referencia_id=referencia.id, numero_prova=1)
+        db.session.add(self.prova)
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def _criar_plano(self, conteudo, extensao='.pdf', nome=None):
+        """Arquivo gravado como antes do layout particionado (na raiz)"""
+        nome = nome or hashlib.sha256(conteudo).hexdigest() + extensao
+        with open(os.path.join(self.upload_dir, nome), 'wb') as f:
+            f.write(conteudo)
+        return nome
+
+    def test_nomes_e_leitura_nos_dois_layouts(self):
+        nome = self._criar_plano(b'%PDF antigo')
+        particionado = nome_particionado(nome)
+        self.assertEqual(particionado, f'{nome[:2]}/{nome[2:4]}/{nome}')
+        self.assertEqual(nome_alternativo(particionado), nome)
+        self.assertIsNone(nome_alternativo('derivados/impressao/x.jpg'))
+        self.assertIsNone(nome_alternativo(f'zz/zz/{nome}'))
+
+        backend = armazenamento()
+        self.assertEqual(backend.info(particionado)['nome'], nome)
+        # Conteúdo repetido após o deploy reaproveita o arquivo do layout plano
+        self.assertEqual(gravar_stream(io.BytesIO(b'%PDF antigo'), 'a.pdf', 1024), particionado)
+        self.assertEqual(os.listdir(self.upload_dir), [nome])
+
+        with self.app.test_client() as cliente:
+            self.assertEqual(cliente.get(f'/uploads/{particionado}').data, b'%PDF antigo')
+
+        # Uma linha ainda no layout plano mantém o arquivo
+        self.prova.tabela_medidas_path = nome
+        db.session.commit()
+        self.assertFalse(remover_blob(particionado))
+        self.assertTrue(os.path.exists(os.path.join(self.upload_dir, nome)))
+
+    def test_migra_em_lotes_e_reescreve_referencias(self):
+        conteudo_foto = io.BytesIO()
+        Image.new('RGB', (10, 10), 'red').save(conteudo_foto, 'PNG')
+        foto = self._criar_plano(conteudo_foto.getvalue(), '.png')
+        tabela = self._criar_plano(b'planilha', '.xlsx')
+        legado = self._criar_plano(b'ppt antigo', nome='20240101_apresentacao.pptx')
+        solto = self._criar_plano(b'%PDF sem referencia')
+        os.makedirs(os.path.join(self.upload_dir, 'derivados', 'impressao'))
+        derivado = os.path.join('derivados', 'impressao', foto[:-4] + '.jpg')
+        self._criar_plano(b'jpeg', nome=derivado)
+
+        editado = datetime(2024, 1, 1)
+        db.session.add(Foto(prova_id=self.prova.id, contexto='desenho', file_path=foto))
+        self.prova.tabela_medidas_path = tabela
+        self.relatorio.ppt_path = legado
+        db.session.commit()
+        recontar_referencias(db.session)
+        db.session.commit()
+        db.session.execute(Relatorio.__table__.update().values(updated_at=editado))
+        db.session.commit()
+        # Mesmo conteúdo enviado de novo após o deploy: linha já no layout particionado
+        db.session.add(Foto(prova_id=self.prova.id, contexto='estilo',
+                            file_path=gravar_stream(io.BytesIO(conteudo_foto.getvalue()), 'f.png', 1024)))
+        db.session.commit()
+
+        # Árvore em cache com os nomes do layout plano
+        _, referencias = carregar_arvore_relatorio(self.relatorio.id)
+        versao = self.relatorio.versao
+
+        totais = migrar_layout(lote=2)
+
+        self.assertEqual(totais['arquivos'], 4)
+        arquivos = sorted(os.path.relpath(os.path.join(raiz, nome), self.upload_dir)
+                          for raiz, _, nomes in os.walk(self.upload_dir) for nome in nomes)
+        esperados = [nome_particionado(nome) for nome in (foto, tabela, legado, solto)]
+        esperados.append(f"derivados/impressao/{nome_particionado(foto)[:-4]}.jpg")
+        self.assertEqual(arquivos, sorted(esperados))
+
+        db.session.expire_all()
+        self.assertEqual({f.file_path for f in Foto.query.all()}, {nome_particionado(foto)})
+        self.assertEqual(self.prova.tabela_medidas_path, nome_particionado(tabela))
+        self.assertEqual(self.relatorio.ppt_path, nome_particionado(legado))
+        self.assertEqual(self.relatorio.updated_at, editado)
+        self.assertGreater(self.relatorio.versao, versao)
+        _, referencias = carregar_arvore_relatorio(self.relatorio.id)
+        self.assertEqual({f['file_path'] for lista in referencias[0]['provas'][0]['fotos'].values() for f in lista},
+                         {nome_particionado(foto)})
+        contagens = dict(db.session.query(ArquivoUpload.nome, ArquivoUpload.referencias).all())
+        self.assertEqual(contagens, {nome_particionado(foto): 2, nome_particionado(tabela): 1,
+                                     nome_particionado(legado): 1})
+
+        # URLs antigas continuam válidas; repetir a migração não altera nada
+        with self.app.test_client() as cliente:
+            self.assertEqual(cliente.get(f'/uploads/{tabela}').data, b'planilha')
+        self.assertEqual(migrar_layout(), {'lotes': 0, 'arquivos': 0, 'linhas': 0})
+
+
+if __name__ == '__main__':
+    unittest.main()
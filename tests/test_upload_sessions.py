@@ -0,0 +1,111 @@
+import unittest
+import sys
+import os
+import hashlib
+import tempfile
+
+# Add the parent directory to the path so we can import the modules
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from flask import Flask
+from flask_login import LoginManager
+from models import db, Usuario
+from upload_store import UploadInvalido
+from upload_sessions import uploads_bp, arquivo_da_sessao, caminho_parcial
+
+
+class UploadSessionsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.upload_dir = tempfile.mkdtemp()
+        self.app = Flask(__name__)
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        self.app.config['UPLOAD_FOLDER'] = self.upload_dir
+        self.app.config['UPLOAD_MAX_MB'] = 1
+        self.app.config['UPLOAD_SESSAO_HORAS'] = 24
+        self.app.secret_key = 'teste'
+        db.init_app(self.app)
+        self.app.register_blueprint(uploads_bp)
+
+        login_manager = LoginManager(self.app)
+
+        @login_manager.request_loader
+        def carregar_usuario(req):
+            usuario_id = req.headers.get('X-Usuario')
+            return db.session.get(Usuario, int(usuario_id)) if usuario_id else None
+
+        # Sem app context permanente: cada requisição carrega o usuário do header
+        with self.app.app_context():
+            db.create_all()
+            db.session.add_all([Usuario(id=1, username='ana', password_hash='x'),
+                                Usuario(id=2, username='bia', password_hash='x')])
+            db.session.commit()
+        self.cliente = self.app.test_client()
+
+    def tearDown(self):
+        with self.app.app_context():
+            db.drop_all()
+
+    def _criar(self, conteudo, filename='apresentacao.pdf', usuario=1, sha256=None):
+        resposta = self.cliente.post('/api/uploads', headers={'X-Usuario': str(usuario)}, json={
+            'filename': filename, 'tamanho': len(conteudo), 'sha256': sha256,
+        })
+        self.assertEqual(resposta.status_code, 201)
+        return resposta.get_json()
+
+    def _enviar(self, sessao, dados, offset, usuario=1):
+        return self.cliente.put(sessao['url'], data=dados,
+                                headers={'Upload-Offset': str(offset), 'X-Usuario': str(usuario)})
+
+    def test_envio_em_partes_e_retomada(self):
+        conteudo = b'%PDF' + os.urandom(200 * 1024)
+        sessao = self._criar(conteudo, sha256=hashlib.sha256(conteudo).hexdigest())
+
+        resposta = self._enviar(sessao, conteudo[:100000], 0)
+        self.assertEqual(resposta.get_json()['offset'], 100000)
+
+        # Parte repetida (resposta perdida pelo cliente): 409 com o offset correto
+        resposta = self._enviar(sessao, conteudo[:100000], 0)
+        self.assertEqual(resposta.status_code, 409)
+        self.assertEqual(resposta.headers['Upload-Offset'], '100000')
+
+        resposta = self._enviar(sessao, conteudo[100000:], 100000)
+        dados = resposta.get_json()
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(dados['status'], 'concluida')
+
+        raiz = hashlib.sha256(conteudo).hexdigest()
+        nome = f'{raiz[:2]}/{raiz[2:4]}/{raiz}.pdf'
+        with self.app.test_request_context(headers={'X-Usuario': '1'}):
+            self.assertEqual(arquivo_da_sessao(sessao['id']), nome)
+            self.assertFalse(os.path.exists(caminho_parcial(sessao['id'])))
+        with open(os.path.join(self.upload_dir, nome), 'rb') as f:
+            self.assertEqual(f.read(), conteudo)
+
+    def test_checksum_divergente_reinicia_a_sessao(self):
+        conteudo = b'%PDF' + b'0' * 1000
+        sessao = self._criar(conteudo, sha256='0' * 64)
+
+        resposta = self._enviar(sessao, conteudo, 0)
+        self.assertEqual(resposta.status_code, 422)
+        self.assertEqual(resposta.get_json()['offset'], 0)
+        self.assertEqual(os.listdir(os.path.join(self.upload_dir, '.sessoes')), [])
+
+    def test_sessao_restrita_ao_usuario(self):
+        conteudo = b'planilha'
+        sessao = self._criar(conteudo, filename='medidas.xlsx')
+
+        self.assertEqual(self._enviar(sessao, conteudo, 0, usuario=2).status_code, 404)
+        self.assertEqual(self._enviar(sessao, conteudo, 0).status_code, 200)
+        with self.app.test_request_context(headers={'X-Usuario': '2'}):
+            with self.assertRaises(UploadInvalido):
+                arquivo_da_sessao(sessao['id'])
+
+    def test_recusa_tipo_e_tamanho(self):
+        for filename, tamanho in (('script.exe', 10), ('grande.pdf', 2 * 1024 * 1024), ('vazio.pdf', 0)):
+            resposta = self.cliente.post('/api/uploads', headers={'X-Usuario': '1'},
+                                         json={'filename': filename, 'tamanho': tamanho})
+            self.assertEqual(resposta.status_code, 400)
+
+
+if __name__ == '__main__':
+    unittest.main()
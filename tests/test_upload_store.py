@@ -0,0 +1,205 @@
+import unittest
+import sys
+import os
+import io
+import hashlib
+import tempfile
+
+# Add the parent directory to the path so we can import the modules
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from flask import Flask, request, get_flashed_messages
+from werkzeug.datastructures import FileStorage
+from PIL import Image
+from models import db, Relatorio, Referencia, Prova, Foto, ArquivoUpload
+from upload_store import (
+    gravar_stream, registrar_eventos_arquivos, recontar_referencias, remover_blob, UploadInvalido,
+    GravadorBlob, RequestUploads, enviar_upload
+)
+from utils import LoteUploads, save_file
+
+
+def _png(cor):
+    saida = io.BytesIO()
+    Image.new('RGB', (10, 10), cor).save(saida, 'PNG')
+    return saida.getvalue()
+
+
+class UploadStoreTestCase(unittest.TestCase):
+    def setUp(self):
+        self.upload_dir = tempfile.mkdtemp()
+        self.app = Flask(__name__)
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        self.app.config['UPLOAD_FOLDER'] = self.upload_dir
+        self.app.config['UPLOAD_CARENCIA_SEGUNDOS'] = 0
+        self.app.config['UPLOAD_THREADS'] = 4
+        self.app.config['UPLOAD_MAX_MB'] = 1
+        self.app.config['UPLOAD_X_ACCEL_REDIRECT'] = False
+        self.app.config['UPLOAD_X_ACCEL_PREFIX'] = '/uploads_protegidos/'
+        self.app.secret_key = 'teste'
+        db.init_app(self.app)
+        registrar_eventos_arquivos()
+
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+        relatorio = Relatorio(descricao_geral='Teste')
+        db.session.add(relatorio)
+        db.session.flush()
+        referencia = Referencia(relatorio_id=relatorio.id, tipo_categoria='baby', numero_ref='B1')
+        db.session.add(referencia)
+        db.session.flush()
+        self.prova = Prova(referencia_id=referencia.id, numero_prova=1)
+        db.session.add(self.prova)
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def _referencias(self, nome):
+        linha = db.session.get(ArquivoUpload, nome)
+        db.session.expire_all()
+        return linha.referencias if linha else None
+
+    def test_nome_pelo_hash_e_deduplicacao(self):
+        conteudo = _png('red')
+        nome = gravar_stream(io.BytesIO(conteudo), 'IMG_0001.PNG', 1024 * 1024)
+
+        raiz = hashlib.sha256(conteudo).hexdigest()
+        self.assertEqual(nome, f'{raiz[:2]}/{raiz[2:4]}/{raiz}.png')
+        self.assertEqual(gravar_stream(io.BytesIO(conteudo), 'outra.png', 1024 * 1024), nome)
+        self.assertEqual(os.listdir(self.upload_dir), [raiz[:2]])
+        self.assertEqual(os.listdir(os.path.join(self.upload_dir, raiz[:2], raiz[2:4])), [f'{raiz}.png'])
+
+    def test_recusa_arquivo_grande_e_imagem_invalida(self):
+        with self.assertRaises(UploadInvalido):
+            gravar_stream(io.BytesIO(b'x' * 2048), 'grande.pdf', 1024)
+        with self.assertRaises(UploadInvalido):
+            gravar_stream(io.BytesIO(b'nao e imagem'), 'foto.jpg', 1024)
+
+        # JPEG truncado: cabeçalho válido, dados incompletos
+        saida = io.BytesIO()
+        Image.effect_noise((64, 64), 50).convert('RGB').save(saida, 'JPEG')
+        truncado = FileStorage(io.BytesIO(saida.getvalue()[:300]), 'truncada.jpg')
+        with self.app.test_request_context():
+            self.assertIsNone(save_file(truncado, 1))
+            self.assertIn('Imagem inválida ou incompleta: truncada.jpg', get_flashed_messages())
+        self.assertEqual(os.listdir(self.upload_dir), [])
+
+    def test_remove_somente_sem_referencias(self):
+        nome = gravar_stream(io.BytesIO(_png('blue')), 'foto.png', 1024 * 1024)
+        f1 = Foto(prova_id=self.prova.id, contexto='desenho', file_path=nome)
+        f2 = Foto(prova_id=self.prova.id, contexto='estilo', file_path=nome)
+        db.session.add_all([f1, f2])
+        db.session.commit()
+        self.assertEqual(self._referencias(nome), 2)
+
+        db.session.delete(f1)
+        db.session.commit()
+        self.assertEqual(self._referencias(nome), 1)
+        self.assertFalse(remover_blob(nome))
+        self.assertTrue(os.path.exists(os.path.join(self.upload_dir, nome)))
+
+        db.session.delete(f2)
+        db.session.commit()
+        self.assertTrue(remover_blob(nome))
+        self.assertFalse(os.path.exists(os.path.join(self.upload_dir, nome)))
+        self.assertIsNone(self._referencias(nome))
+
+    def test_troca_de_arquivo_e_recontagem(self):
+        antigo = gravar_stream(io.BytesIO(b'planilha 1'), 'medidas.xlsx', 1024)
+        novo = gravar_stream(io.BytesIO(b'planilha 2'), 'medidas.xlsx', 1024)
+        self.prova.tabela_medidas_path = antigo
+        db.session.commit()
+        self.prova.tabela_medidas_path = novo
+        db.session.commit()
+
+        self.assertEqual(self._referencias(antigo), 0)
+        self.assertEqual(self._referencias(novo), 1)
+
+        db.session.query(ArquivoUpload).delete()
+        db.session.commit()
+        self.assertEqual(recontar_referencias(db.session), 1)
+        db.session.commit()
+        self.assertEqual(self._referencias(novo), 1)
+
+    def test_lote_aplica_resultados_na_ordem_antes_do_commit(self):
+        arquivos = [FileStorage(io.BytesIO(_png((i, 0, 0))), f'foto{i}.png') for i in range(6)]
+        arquivos.insert(3, FileStorage(io.BytesIO(b'nao e imagem'), 'quebrada.jpg'))
+
+        with self.app.test_request_context():
+            lote = LoteUploads()
+            fotos = []
+            for arquivo in arquivos:
+                foto = Foto(prova_id=self.prova.id, contexto='desenho')
+                lote.adicionar(arquivo, foto, 'file_path')
+                fotos.append(foto)
+            lote.adicionar(FileStorage(io.BytesIO(b'planilha'), 'medidas.xlsx'), self.prova, 'tabela_medidas_path')
+            lote.adicionar(FileStorage(io.BytesIO(b''), ''), self.prova, 'tabela_medidas_path')
+
+            self.assertEqual(lote.concluir(), 7)
+            db.session.commit()
+            self.assertEqual(len(get_flashed_messages()), 1)
+
+        self.assertIsNone(fotos[3].id)
+        salvas = Foto.query.order_by(Foto.id).all()
+        self.assertEqual([f.file_path for f in salvas], [f.file_path for f in fotos if f.id])
+        self.assertEqual(self._referencias(self.prova.tabela_medidas_path), 1)
+
+    def test_parser_multipart_grava_direto_no_armazenamento(self):
+        self.app.request_class = RequestUploads
+        resultados = {}
+
+        @self.app.route('/upload', methods=['POST'])
+        def upload():
+            for campo, arquivo in request.files.items():
+                resultados[campo] = (isinstance(arquivo.stream, GravadorBlob), save_file(arquivo))
+            return ''
+
+        conteudo = _png('green')
+        with self.app.test_client() as cliente:
+            cliente.post('/upload', content_type='multipart/form-data', data={
+                'foto': (io.BytesIO(conteudo), 'foto.png'),
+                'falsa': (io.BytesIO(b'GIF89a' + b'0' * 100), 'falsa.jpg'),
+                'grande': (io.BytesIO(b'%PDF' + b'0' * (2 * 1024 * 1024)), 'grande.pdf'),
+            })
+
+        raiz = hashlib.sha256(conteudo).hexdigest()
+        self.assertEqual(resultados['foto'], (True, f'{raiz[:2]}/{raiz[2:4]}/{raiz}.png'))
+        self.assertEqual(resultados['falsa'], (True, None))
+        self.assertEqual(resultados['grande'], (True, None))
+        self.assertEqual(sorted(os.listdir(self.upload_dir)), sorted(['derivados', raiz[:2]]))
+
+    def test_entrega_com_etag_range_e_cache_imutavel(self):
+        self.app.add_url_rule('/uploads/<path:filename>', 'serve_upload', enviar_upload)
+        conteudo = b'%PDF' + b'0' * 1000
+        nome = gravar_stream(io.BytesIO(conteudo), 'apresentacao.pdf', 1024 * 1024)
+        etag = f'"{os.path.basename(nome)[:-4]}"'
+
+        with self.app.test_client() as cliente:
+            resposta = cliente.get(f'/uploads/{nome}')
+            self.assertEqual(resposta.headers['ETag'], etag)
+            self.assertIn('immutable', resposta.headers['Cache-Control'])
+            self.assertIn('private', resposta.headers['Cache-Control'])
+
+            self.assertEqual(cliente.get(f'/uploads/{nome}', headers={'If-None-Match': etag}).status_code, 304)
+            parcial = cliente.get(f'/uploads/{nome}', headers={'Range': 'bytes=0-3'})
+            self.assertEqual((parcial.status_code, parcial.data), (206, b'%PDF'))
+            self.assertEqual(cliente.get('/uploads/.sessoes/x.parte').status_code, 404)
+            self.assertEqual(cliente.get('/uploads/nao_existe.pdf').status_code, 404)
+            # URL do layout plano (anterior à migração) continua válida
+            self.assertEqual(cliente.get(f'/uploads/{os.path.basename(nome)}').headers['ETag'], etag)
+
+            self.app.config['UPLOAD_X_ACCEL_REDIRECT'] = True
+            resposta = cliente.get(f'/uploads/{nome}')
+            self.assertEqual(resposta.headers['X-Accel-Redirect'], f'/uploads_protegidos/{nome}')
+            self.assertEqual(resposta.headers['Content-Type'], 'application/pdf')
+            self.assertEqual(resposta.data, b'')
+            self.assertEqual(cliente.get(f'/uploads/{nome}', headers={'If-None-Match': etag}).status_code, 304)
+
+
+if __name__ == '__main__':
+    unittest.main()
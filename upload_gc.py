@@ -0,0 +1,243 @@
+"""
+Coleta de lixo dos uploads: arquivos em UPLOAD_FOLDER que nada referencia
+Executada por scripts/database/limpar_uploads_orfaos.py (manual ou cron)
+
+Sobras possíveis: uploads gravados antes de um commit que falhou (rollback),
+arquivos cuja remoção após excluir_relatorio/editar_relatorio falhou,
+temporários (.upload-*.tmp) de gravações interrompidas, partes de sessões de
+upload em partes abandonadas (.sessoes/) e derivados de fotos removidas ou de
+variantes que não existem mais.
+
+As colunas de arquivo (fotos, tabelas de medidas e PPTs) são lidas em
+streaming para um conjunto compacto (hash em bytes para nomes por conteúdo) e
+a pasta é percorrida com os.scandir. Só são candidatos arquivos com mtime mais
+antigo que a carência (UPLOAD_CARENCIA_SEGUNDOS por padrão): um upload recém
+gravado ou reaproveitado (o mtime é atualizado na deduplicação) pode ainda não
+estar no banco. Antes de mover ou remover, o arquivo é conferido de novo.
+
+Os uploads vêm da listagem do backend (storage_backends), nos dois layouts
+(plano e particionado); um nome é considerado em uso se qualquer das duas
+formas estiver no banco, o que mantém a coleta segura durante a migração.
+
+Por padrão os órfãos vão para UPLOAD_FOLDER/.quarentena/<data-hora>/ (não
+servida pela rota /uploads), de onde podem ser restaurados ou apagados. Com o
+armazenamento S3 os uploads são listados no bucket e vão para o prefixo
+.quarentena/<data-hora>/ dele; o restante (temporários, partes e derivados)
+continua na UPLOAD_FOLDER local.
+"""
+import os
+import time
+import logging
+from datetime import datetime
+from flask import current_app
+from sqlalchemy import select, delete
+from models import db, ArquivoUpload, SessaoUpload
+from upload_store import COLUNAS_ARQUIVO, nome_por_conteudo, arquivo_referenciado
+from upload_sessions import PASTA_SESSOES, STATUS_ATIVA, STATUS_CONCLUIDA, limpar_sessoes_expiradas
+from image_derivatives import PASTA_DERIVADOS, VARIANTES
+from storage_backends import armazenamento, nome_alternativo
+
+logger = logging.getLogger(__name__)
+
+# Pasta da quarentena dentro de UPLOAD_FOLDER (começa com '.': não é servida)
+PASTA_QUARENTENA = '.quarentena'
+
+# Linhas lidas por vez das colunas de arquivo
+LOTE_LEITURA = 1000
+
+# Categorias do relatório
+CATEGORIAS = ('arquivos', 'temporarios', 'parciais', 'derivados')
+
+
+def _chave(nome):
+    """
+    Forma compacta de um nome: raiz sha256 em bytes (32) ou o nome base
+
+    As subpastas do layout particionado são descartadas: as duas formas de um
+    nome têm a mesma chave.
+    """
+    base = os.path.basename(nome)
+    if nome_por_conteudo(base):
+        raiz, extensao = os.path.splitext(base)
+        return bytes.fromhex(raiz) + extensao.encode('ascii', 'replace')
+    return base
+
+
+def _raiz(nome):
+    """Forma compacta da raiz do nome (derivados trocam a extensão por .jpg)"""
+    base = os.path.basename(nome)
+    raiz = os.path.splitext(base)[0]
+    return bytes.fromhex(raiz) if nome_por_conteudo(base) else raiz
+
+
+def nomes_referenciados():
+    """
+    Nomes em uso: colunas de arquivo, arquivos_upload com referências e
+    arquivos de sessões de upload concluídas (formulário ainda não enviado)
+
+    Returns:
+        tuple: (conjunto de chaves dos nomes, conjunto de raízes para os derivados)
+    """
+    consultas = [select(getattr(modelo, atributo)).where(getattr(modelo, atributo).isnot(None))
+                 for modelo, atributo in COLUNAS_ARQUIVO]
+    consultas.append(select(ArquivoUpload.nome).where(ArquivoUpload.referencias > 0))
+    consultas.append(select(SessaoUpload.arquivo).where(SessaoUpload.status == STATUS_CONCLUIDA,
+                                                        SessaoUpload.arquivo.isnot(None)))
+
+    chaves = set()
+    raizes = set()
+    for consulta in consultas:
+        resultado = db.session.execute(consulta.execution_options(yield_per=LOTE_LEITURA)).scalars()
+        for nome in resultado:
+            chaves.add(_chave(nome))
+            raizes.add(_raiz(nome))
+    return chaves, raizes
+
+
+def _sessoes_ativas():
+    return set(db.session.execute(select(SessaoUpload.id).where(SessaoUpload.status == STATUS_ATIVA)).scalars())
+
+
+def _arquivos_na_pasta(caminho, relativo):
+    """Gera (caminho relativo, DirEntry) dos arquivos da pasta e das subpastas"""
+    with os.scandir(caminho) as entradas:
+        for entrada in entradas:
+            if entrada.is_file(follow_symlinks=False):
+                yield os.path.join(relativo, entrada.name), entrada
+            elif entrada.is_dir(follow_symlinks=False):
+                yield from _arquivos_na_pasta(entrada.path, os.path.join(relativo, entrada.name))
+
+
+def _candidatos(pasta, backend, referenciados, raizes, sessoes, limite):
+    """
+    Gera (categoria, caminho relativo, tamanho) dos órfãos
+
+    Os uploads vêm da listagem do backend; em UPLOAD_FOLDER só olha o que o
+    armazenamento cria: temporários da raiz, derivados/<variante>/ e .sessoes/.
+    Outras pastas (e a quarentena) não são tocadas.
+    """
+    for nome, tamanho, mtime in backend.listar():
+        if mtime < limite and _chave(nome) not in referenciados:
+            yield 'arquivos', nome, tamanho
+
+    with os.scandir(pasta) as entradas:
+        for entrada in entradas:
+            if entrada.is_file(follow_symlinks=False):
+                if entrada.name.startswith('.upload-') and entrada.name.endswith('.tmp'):
+                    st = entrada.stat(follow_symlinks=False)
+                    if st.st_mtime < limite:
+                        yield 'temporarios', entrada.name, st.st_size
+
+            elif entrada.name == PASTA_DERIVADOS and entrada.is_dir(follow_symlinks=False):
+                with os.scandir(entrada.path) as variantes:
+                    for variante in variantes:
+                        if not variante.is_dir(follow_symlinks=False):
+                            continue
+                        # Variantes removidas de VARIANTES: tudo é órfão
+                        ativa = variante.name in VARIANTES
+                        relativo_variante = os.path.join(PASTA_DERIVADOS, variante.name)
+                        for relativo, derivado in _arquivos_na_pasta(variante.path, relativo_variante):
+                            st = derivado.stat(follow_symlinks=False)
+                            if st.st_mtime >= limite:
+                                continue
+                            if not ativa or _raiz(derivado.name) not in raizes:
+                                yield 'derivados', relativo, st.st_size
+
+            elif entrada.name == PASTA_SESSOES and entrada.is_dir(follow_symlinks=False):
+                with os.scandir(entrada.path) as parciais:
+                    for parcial in parciais:
+                        if not parcial.is_file(follow_symlinks=False):
+                            continue
+                        st = parcial.stat(follow_symlinks=False)
+                        sessao_id = os.path.splitext(parcial.name)[0]
+                        if st.st_mtime < limite and sessao_id not in sessoes:
+                            yield 'parciais', os.path.join(PASTA_SESSOES, parcial.name), st.st_size
+
+
+def _ainda_orfao(backend, caminho, categoria, relativo, limite):
+    """Confere de novo imediatamente antes de mover/remover (corrida com uploads)"""
+    if categoria == 'arquivos':
+        info = backend.info(relativo)
+        if info is None or info['mtime'] >= limite:
+            return False
+        nomes = [relativo, nome_alternativo(relativo) or relativo]
+        return not arquivo_referenciado(relativo) and not db.session.execute(
+            select(ArquivoUpload.nome).where(ArquivoUpload.nome.in_(nomes), ArquivoUpload.referencias > 0)
+        ).first()
+    try:
+        return os.stat(caminho).st_mtime < limite
+    except FileNotFoundError:
+        return False
+
+
+def coletar_orfaos(executar=False, apagar=False, carencia_segundos=None):
+    """
+    Encontra (e opcionalmente move para a quarentena ou remove) os uploads órfãos
+
+    Args:
+        executar: False apenas relata (dry-run)
+        apagar: Remove em vez de mover para a quarentena
+        carencia_segundos: Idade mínima do arquivo (padrão: UPLOAD_CARENCIA_SEGUNDOS)
+
+    Returns:
+        dict: {'categorias': {categoria: {'arquivos': n, 'bytes': n}}, 'orfaos': [(categoria, caminho, bytes)],
+               'quarentena': pasta ou None, 'falhas': [(caminho, erro)]}
+    """
+    pasta = current_app.config['UPLOAD_FOLDER']
+    if carencia_segundos is None:
+        carencia_segundos = current_app.config['UPLOAD_CARENCIA_SEGUNDOS']
+    limite = time.time() - carencia_segundos
+
+    if executar:
+        # Sessões expiradas saem do banco (e suas partes do disco) antes da varredura
+        limpar_sessoes_expiradas()
+
+    backend = armazenamento()
+    referenciados, raizes = nomes_referenciados()
+    sessoes = _sessoes_ativas()
+
+    quarentena = None
+    lote_quarentena = datetime.now().strftime('%Y%m%d-%H%M%S')
+    if executar and not apagar:
+        quarentena = os.path.join(pasta, PASTA_QUARENTENA, lote_quarentena)
+
+    relatorio = {
+        'categorias': {categoria: {'arquivos': 0, 'bytes': 0} for categoria in CATEGORIAS},
+        'orfaos': [],
+        'quarentena': quarentena,
+        'falhas': [],
+    }
+
+    # Lista completa antes de mexer nas pastas que estão sendo percorridas
+    candidatos = list(_candidatos(pasta, backend, referenciados, raizes, sessoes, limite))
+    for categoria, relativo, tamanho in candidatos:
+        caminho = os.path.join(pasta, relativo)
+        if executar:
+            if not _ainda_orfao(backend, caminho, categoria, relativo, limite):
+                continue
+            try:
+                if categoria == 'arquivos' and apagar:
+                    backend.remover(relativo)
+                elif categoria == 'arquivos':
+                    backend.mover(relativo, f"{PASTA_QUARENTENA}/{lote_quarentena}/{relativo}")
+                elif apagar:
+                    os.remove(caminho)
+                else:
+                    destino = os.path.join(quarentena, relativo)
+                    os.makedirs(os.path.dirname(destino), exist_ok=True)
+                    os.replace(caminho, destino)
+            except Exception as e:
+                logger.warning(f"Erro ao recolher upload órfão {relativo}: {e}")
+                relatorio['falhas'].append((relativo, str(e)))
+                continue
+            if categoria == 'arquivos':
+                db.session.execute(delete(ArquivoUpload).where(ArquivoUpload.nome == relativo,
+                                                                ArquivoUpload.referencias <= 0))
+
+        relatorio['categorias'][categoria]['arquivos'] += 1
+        relatorio['categorias'][categoria]['bytes'] += tamanho
+        relatorio['orfaos'].append((categoria, relativo, tamanho))
+
+    if executar:
+        db.session.commit()
+    return relatorio
@@ -0,0 +1,181 @@
+"""
+Migração dos uploads do layout plano (<nome> na raiz) para o particionado (ab/cd/<nome>)
+Executada por scripts/database/migrar_layout_uploads.py, com a aplicação no ar
+
+Pastas com centenas de milhares de arquivos tornam lentas as buscas de nomes,
+os backups (tar) e qualquer listagem; no layout particionado cada pasta tem
+uma fração deles (ver storage_backends).
+
+A migração anda em lotes: os arquivos do lote são movidos (com os derivados) e
+só então as colunas que os referenciam (fotos, tabelas de medidas, PPTs,
+sessões de upload concluídas) e a contagem de arquivos_upload são reescritas,
+em uma transação por lote, que também incrementa Relatorio.versao dos
+relatórios afetados (as árvores em cache guardam o file_path e o caminho
+absoluto antigos). Em nenhum momento um arquivo fica ilegível: os
+backends procuram no outro layout o nome que não encontram. Interrompida, a
+migração pode ser repetida; lotes já migrados não são tocados de novo.
+"""
+import time
+import logging
+from sqlalchemy import select, update, delete, union, case
+from models import db, ArquivoUpload, SessaoUpload, Relatorio, Referencia, ProvaModelagem, FotoProva
+from upload_store import COLUNAS_ARQUIVO
+from image_derivatives import particionar_derivados
+from storage_backends import armazenamento, nome_particionado
+
+logger = logging.getLogger(__name__)
+
+# Arquivos movidos por transação
+LOTE_PADRAO = 500
+
+# Colunas reescritas: as de arquivo e o arquivo das sessões de upload em partes
+COLUNAS_MIGRADAS = COLUNAS_ARQUIVO + ((SessaoUpload, 'arquivo'),)
+
+
+def _nomes_planos_no_banco(ultimo, lote):
+    """Próximos nomes do layout plano referenciados no banco (paginação por nome)"""
+    colunas = [getattr(modelo, atributo) for modelo, atributo in COLUNAS_MIGRADAS] + [ArquivoUpload.nome]
+    nomes = union(*[
+        select(coluna.label('nome')).where(coluna.isnot(None), coluna != '', ~coluna.contains('/'))
+        for coluna in colunas
+    ]).subquery()
+    consulta = select(nomes.c.nome).where(nomes.c.nome > ultimo).order_by(nomes.c.nome).limit(lote)
+    return db.session.execute(consulta).scalars().all()
+
+
+def _relatorios_afetados(mapa):
+    """IDs dos relatórios com PPT, tabela de medidas ou foto entre os nomes do lote"""
+    nomes = list(mapa)
+    consulta = union(
+        select(Relatorio.id).where(Relatorio.ppt_path.in_(nomes)),
+        select(Referencia.relatorio_id).join(ProvaModelagem, ProvaModelagem.referencia_id == Referencia.id)
+        .where(ProvaModelagem.tabela_medidas_path.in_(nomes)),
+        select(Referencia.relatorio_id).join(ProvaModelagem, ProvaModelagem.referencia_id == Referencia.id)
+        .join(FotoProva, FotoProva.prova_id == ProvaModelagem.id)
+        .where(FotoProva.file_path.in_(nomes)),
+    )
+    return db.session.execute(consulta).scalars().all()
+
+
+def _incrementar_versoes(relatorio_ids):
+    """Invalida as árvores em cache (report_tree) dos relatórios, mantendo updated_at"""
+    if relatorio_ids:
+        db.session.execute(
+            update(Relatorio).where(Relatorio.id.in_(relatorio_ids))
+            .values(versao=Relatorio.versao + 1, updated_at=Relatorio.updated_at)
+            .execution_options(synchronize_session=False)
+        )
+
+
+def _reescrever_colunas(mapa):
+    """Troca os nomes planos pelos particionados nas colunas; retorna as linhas alteradas"""
+    linhas = 0
+    for modelo, atributo in COLUNAS_MIGRADAS:
+        coluna = getattr(modelo, atributo)
+        valores = {atributo: case(mapa, value=coluna)}
+        if hasattr(modelo, 'updated_at'):
+            # Mudança de armazenamento, não do conteúdo: a data de edição é mantida
+            valores['updated_at'] = modelo.updated_at
+        resultado = db.session.execute(
+            update(modelo).where(coluna.in_(list(mapa))).values(valores)
+            .execution_options(synchronize_session=False)
+        )
+        linhas += resultado.rowcount
+    return linhas
+
+
+def _renomear_contagens(mapa):
+    """
+    Renomeia as linhas de arquivos_upload; se o nome particionado já tem
+    linha (upload repetido após o deploy), as contagens são somadas
+    """
+    existentes = dict(db.session.execute(
+        select(ArquivoUpload.nome, ArquivoUpload.referencias)
+        .where(ArquivoUpload.nome.in_(list(mapa) + list(mapa.values())))
+    ).all())
+
+    renomear = {}
+    for antigo, novo in mapa.items():
+        if antigo not in existentes:
+            continue
+        if novo not in existentes:
+            renomear[antigo] = novo
+            continue
+        db.session.execute(update(ArquivoUpload).where(ArquivoUpload.nome == novo)
+                           .values(referencias=ArquivoUpload.referencias + existentes[antigo]))
+        db.session.execute(delete(ArquivoUpload).where(ArquivoUpload.nome == antigo))
+
+    if renomear:
+        db.session.execute(
+            update(ArquivoUpload).where(ArquivoUpload.nome.in_(list(renomear)))
+            .values(nome=case(renomear, value=ArquivoUpload.nome))
+            .execution_options(synchronize_session=False)
+        )
+
+
+def _migrar_lote(backend, nomes):
+    """
+    Move os arquivos do lote e reescreve as referências (commit ao final)
+
+    Returns:
+        tuple: (arquivos movidos, linhas reescritas)
+    """
+    movidos = 0
+    for nome in nomes:
+        # Os arquivos vão primeiro: até o commit o banco aponta para o nome
+        # plano, que a leitura ainda encontra pelo nome alternativo
+        if backend.particionar(nome):
+            movidos += 1
+        particionar_derivados(nome)
+
+    mapa = {nome: nome_particionado(nome) for nome in nomes}
+    relatorios = _relatorios_afetados(mapa)
+    linhas = _reescrever_colunas(mapa)
+    _incrementar_versoes(relatorios)
+    _renomear_contagens(mapa)
+    db.session.commit()
+    return movidos, linhas
+
+
+def migrar_layout(lote=LOTE_PADRAO, pausa=0, progresso=None):
+    """
+    Migra todos os uploads para o layout particionado
+
+    Primeiro os nomes referenciados no banco, depois os arquivos restantes do
+    layout plano (uploads ainda não salvos ou órfãos).
+
+    Args:
+        lote: Arquivos movidos por transação
+        pausa: Segundos de espera entre lotes (alivia o disco e o banco em produção)
+        progresso: Função chamada com o dicionário de totais após cada lote
+
+    Returns:
+        dict: {'lotes': n, 'arquivos': movidos, 'linhas': linhas reescritas}
+    """
+    backend = armazenamento()
+    totais = {'lotes': 0, 'arquivos': 0, 'linhas': 0}
+
+    def executar(nomes):
+        movidos, linhas = _migrar_lote(backend, nomes)
+        totais['lotes'] += 1
+        totais['arquivos'] += movidos
+        totais['linhas'] += linhas
+        if progresso:
+            progresso(totais)
+        if pausa:
+            time.sleep(pausa)
+
+    ultimo = ''
+    while True:
+        nomes = _nomes_planos_no_banco(ultimo, lote)
+        if not nomes:
+            break
+        executar(nomes)
+        ultimo = nomes[-1]
+
+    # Lista completa antes de mover: a pasta percorrida é a que está mudando
+    restantes = [nome for nome, _, _ in backend.listar(apenas_planos=True)]
+    for inicio in range(0, len(restantes), lote):
+        executar(restantes[inicio:inicio + lote])
+
+    return totais
@@ -0,0 +1,249 @@
+"""
+Upload em partes (retomável) de PPTs e tabelas de medidas
+API usada pelos formulários de relatório antes do envio do formulário
+
+Fluxo:
+    POST   /api/uploads         {filename, tamanho, sha256?} -> sessão (201)
+    GET    /api/uploads/<id>    offset atual (também no header Upload-Offset)
+    PUT    /api/uploads/<id>    parte do arquivo a partir do header Upload-Offset
+    DELETE /api/uploads/<id>    cancela a sessão
+
+As partes são gravadas na posição informada de UPLOAD_FOLDER/.sessoes/<id>.parte;
+reenviar uma parte é idempotente e uma conexão interrompida conserva os bytes
+já recebidos. Ao completar o tamanho declarado o arquivo é conferido (magic
+number e checksum) e movido para o armazenamento por conteúdo. Os formulários
+enviam apenas o id da sessão no campo <campo>_upload_id.
+"""
+import os
+import uuid
+import logging
+from datetime import datetime, timedelta
+from flask import Blueprint, current_app, request, jsonify, url_for
+from flask_login import login_required, current_user
+from sqlalchemy import update
+from werkzeug.exceptions import ClientDisconnected
+from models import db, SessaoUpload
+from config import allowed_file, Config
+from upload_store import armazenar_arquivo, UploadInvalido, TAMANHO_BLOCO
+
+logger = logging.getLogger(__name__)
+
+uploads_bp = Blueprint('uploads', __name__, url_prefix='/api/uploads')
+
+# Pasta das partes em montagem dentro de UPLOAD_FOLDER (mesmo sistema de arquivos)
+PASTA_SESSOES = '.sessoes'
+
+# Status das sessões
+STATUS_ATIVA = 'ativa'
+STATUS_CONCLUIDA = 'concluida'
+
+
+def caminho_parcial(sessao_id):
+    """Caminho do arquivo em montagem de uma sessão"""
+    return os.path.join(current_app.config['UPLOAD_FOLDER'], PASTA_SESSOES, f"{sessao_id}.parte")
+
+
+def _remover_parcial(sessao_id):
+    try:
+        os.remove(caminho_parcial(sessao_id))
+    except FileNotFoundError:
+        pass
+
+
+def sessao_para_dict(sessao):
+    """Serializa a sessão para a API"""
+    return {
+        'id': sessao.id,
+        'filename': sessao.filename,
+        'tamanho': sessao.tamanho,
+        'offset': sessao.recebido,
+        'status': sessao.status,
+        'url': url_for('uploads.enviar_parte', sessao_id=sessao.id),
+    }
+
+
+def _resposta(sessao, status=200):
+    response = jsonify(sessao_para_dict(sessao))
+    response.status_code = status
+    response.headers['Upload-Offset'] = str(sessao.recebido)
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+
+def _obter_sessao(sessao_id):
+    """Sessão do usuário atual ou None"""
+    sessao = db.session.get(SessaoUpload, sessao_id)
+    if sessao is None or sessao.usuario_id != current_user.id:
+        return None
+    return sessao
+
+
+def limpar_sessoes_expiradas():
+    """
+    Remove sessões sem atividade há mais de UPLOAD_SESSAO_HORAS e suas partes
+
+    Arquivos de sessões concluídas e nunca usadas ficam para a limpeza de órfãos.
+
+    Returns:
+        int: Quantidade de sessões removidas
+    """
+    limite = datetime.utcnow() - timedelta(hours=current_app.config['UPLOAD_SESSAO_HORAS'])
+    expiradas = SessaoUpload.query.filter(SessaoUpload.atualizado_em < limite).all()
+    for sessao in expiradas:
+        if sessao.status == STATUS_ATIVA:
+            _remover_parcial(sessao.id)
+        db.session.delete(sessao)
+    db.session.commit()
+    return len(expiradas)
+
+
+def arquivo_da_sessao(sessao_id):
+    """
+    Nome no armazenamento do arquivo de uma sessão concluída do usuário atual
+
+    Raises:
+        UploadInvalido: Sessão inexistente, de outro usuário ou incompleta
+    """
+    sessao = _obter_sessao(sessao_id)
+    if sessao is None or sessao.status != STATUS_CONCLUIDA:
+        raise UploadInvalido('Arquivo enviado não encontrado ou incompleto; selecione-o novamente')
+    return sessao.arquivo
+
+
+def _concluir(sessao):
+    """Confere o arquivo montado e o move para o armazenamento"""
+    try:
+        sessao.arquivo = armazenar_arquivo(caminho_parcial(sessao.id), sessao.filename, sessao.sha256)
+    except UploadInvalido:
+        # Conteúdo recusado: a sessão recomeça do zero
+        _remover_parcial(sessao.id)
+        sessao.recebido = 0
+        db.session.commit()
+        raise
+
+    sessao.status = STATUS_CONCLUIDA
+    db.session.commit()
+
+
+# ============================================================================
+# ROTAS
+# ============================================================================
+
+@uploads_bp.route('', methods=['POST'])
+@login_required
+def criar_sessao():
+    """Inicia uma sessão de upload em partes"""
+    dados = request.get_json(silent=True) or {}
+    filename = os.path.basename(str(dados.get('filename') or ''))
+    sha256 = dados.get('sha256') or None
+
+    if not allowed_file(filename):
+        return jsonify(error=f"Tipo de arquivo não permitido. Use apenas: {', '.join(sorted(Config.ALLOWED_EXTENSIONS))}"), 400
+    try:
+        tamanho = int(dados.get('tamanho'))
+    except (TypeError, ValueError):
+        return jsonify(error="Tamanho do arquivo inválido"), 400
+    max_mb = current_app.config['UPLOAD_MAX_MB']
+    if tamanho <= 0 or tamanho > max_mb * 1024 * 1024:
+        return jsonify(error=f"Arquivo muito grande: {filename}. Máximo: {max_mb}MB"), 400
+    if sha256 is not None and (len(str(sha256)) != 64 or any(c not in '0123456789abcdefABCDEF' for c in str(sha256))):
+        return jsonify(error="Checksum SHA-256 inválido"), 400
+
+    limpar_sessoes_expiradas()
+
+    sessao = SessaoUpload(id=uuid.uuid4().hex, usuario_id=current_user.id, filename=filename,
+                          tamanho=tamanho, sha256=sha256)
+    db.session.add(sessao)
+    db.session.commit()
+
+    response = _resposta(sessao, 201)
+    response.headers['Location'] = sessao_para_dict(sessao)['url']
+    return response
+
+
+@uploads_bp.route('/<sessao_id>', methods=['GET'])
+@login_required
+def status_sessao(sessao_id):
+    """Offset atual da sessão (para retomar o envio)"""
+    sessao = _obter_sessao(sessao_id)
+    if sessao is None:
+        return jsonify(error="Sessão de upload não encontrada"), 404
+    return _resposta(sessao)
+
+
+@uploads_bp.route('/<sessao_id>', methods=['PUT'])
+@login_required
+def enviar_parte(sessao_id):
+    """
+    Grava uma parte do arquivo a partir do offset do header Upload-Offset
+
+    Returns:
+        200 com o novo offset; 409 (com o offset atual) se o offset informado
+        não for o esperado; 422 se o arquivo completo for recusado
+    """
+    sessao = _obter_sessao(sessao_id)
+    if sessao is None:
+        return jsonify(error="Sessão de upload não encontrada"), 404
+    if sessao.status == STATUS_CONCLUIDA:
+        return _resposta(sessao)
+
+    try:
+        offset = int(request.headers.get('Upload-Offset', ''))
+    except ValueError:
+        return jsonify(error="Header Upload-Offset ausente ou inválido"), 400
+    if offset != sessao.recebido:
+        return _resposta(sessao, 409)
+
+    restante = sessao.tamanho - offset
+    if request.content_length is not None and request.content_length > restante:
+        return jsonify(error="A parte excede o tamanho declarado do arquivo"), 400
+
+    gravados = 0
+    interrompido = False
+    caminho = caminho_parcial(sessao.id)
+    os.makedirs(os.path.dirname(caminho), exist_ok=True)
+    with os.fdopen(os.open(caminho, os.O_RDWR | os.O_CREAT, 0o600), 'r+b') as parcial:
+        parcial.seek(offset)
+        try:
+            while gravados < restante:
+                bloco = request.stream.read(min(TAMANHO_BLOCO, restante - gravados))
+                if not bloco:
+                    break
+                parcial.write(bloco)
+                gravados += len(bloco)
+        except ClientDisconnected:
+            # Mantém o que chegou: o cliente retoma a partir do novo offset
+            interrompido = True
+
+    # Só avança se nenhuma outra requisição avançou a sessão no meio tempo
+    avancou = db.session.execute(
+        update(SessaoUpload)
+        .where(SessaoUpload.id == sessao.id, SessaoUpload.recebido == offset)
+        .values(recebido=offset + gravados, atualizado_em=datetime.utcnow())
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    db.session.commit()
+    db.session.refresh(sessao)
+    if not avancou or interrompido:
+        return _resposta(sessao, 409 if not avancou else 200)
+
+    if sessao.recebido == sessao.tamanho:
+        try:
+            _concluir(sessao)
+        except UploadInvalido as e:
+            return jsonify(error=str(e), **sessao_para_dict(sessao)), 422
+    return _resposta(sessao)
+
+
+@uploads_bp.route('/<sessao_id>', methods=['DELETE'])
+@login_required
+def cancelar_sessao(sessao_id):
+    """Cancela a sessão e descarta as partes recebidas"""
+    sessao = _obter_sessao(sessao_id)
+    if sessao is None:
+        return jsonify(error="Sessão de upload não encontrada"), 404
+    if sessao.status == STATUS_ATIVA:
+        _remover_parcial(sessao.id)
+    db.session.delete(sessao)
+    db.session.commit()
+    return '', 204
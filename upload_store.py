@@ -0,0 +1,634 @@
+"""
+Armazenamento de uploads endereçado por conteúdo
+Cada arquivo é gravado com o nome ab/cd/<sha256>.<extensão> (layout
+particionado pelos quatro primeiros dígitos do hash, ver storage_backends)
+
+O hash, o tamanho e o magic number são verificados durante a gravação em um
+arquivo temporário; imagens são decodificadas por inteiro antes de aceitas
+(arquivos truncados ou corrompidos são recusados). O temporário é então
+renomeado (os.replace) para o nome definitivo:
+não há sondagem de nomes livres nem colisão entre workers. Conteúdo repetido
+resolve para o arquivo já existente. Com RequestUploads, o próprio parser
+multipart grava as partes nesse temporário, sem cópia intermediária.
+
+A tabela arquivos_upload conta quantas colunas (Relatorio.ppt_path,
+ProvaModelagem.tabela_medidas_path, FotoProva.file_path) apontam para cada
+arquivo. A contagem é mantida em after_flush, na transação da própria escrita;
+um arquivo só é removido do disco quando nenhuma linha o referencia.
+
+Os arquivos ficam no backend de storage_backends (pasta local ou bucket S3);
+UPLOAD_FOLDER é sempre a área local dos temporários.
+
+Como o nome identifica o conteúdo, esses arquivos são entregues com ETag forte
+(o próprio hash) e cache imutável; com UPLOAD_X_ACCEL_REDIRECT a app só confere
+o login e o Nginx envia o arquivo (location internal).
+"""
+import io
+import os
+import time
+import hashlib
+import logging
+import tempfile
+import mimetypes
+from datetime import datetime
+from urllib.parse import quote
+from flask import current_app, request, Request, send_from_directory, abort, redirect
+from werkzeug.datastructures import ContentRange
+from werkzeug.security import safe_join
+from sqlalchemy import select, update, delete, event, inspect, union_all, func
+from sqlalchemy.orm import Session
+from PIL import Image
+from models import db, Relatorio, ProvaModelagem, FotoProva, ArquivoUpload
+from image_derivatives import PASTA_DERIVADOS, EXTENSOES_IMAGEM, remover_derivados
+from config import allowed_file
+from security import FileUploadValidator
+from storage_backends import armazenamento, nome_particionado, nome_alternativo, HEXADECIMAIS
+
+logger = logging.getLogger(__name__)
+
+# Tamanho dos blocos lidos do upload
+TAMANHO_BLOCO = 64 * 1024
+
+# Lado da decodificação reduzida (JPEG) usada para validar imagens
+LADO_VERIFICACAO = 256
+
+# Colunas que referenciam arquivos do armazenamento: (modelo, atributo)
+COLUNAS_ARQUIVO = (
+    (Relatorio, 'ppt_path'),
+    (ProvaModelagem, 'tabela_medidas_path'),
+    (FotoProva, 'file_path'),
+)
+
+# Validade no navegador de arquivos servidos (segundos)
+MAX_AGE_IMUTAVEL = 365 * 24 * 3600  # Nome = hash do conteúdo: nunca muda
+MAX_AGE_DERIVADOS = 24 * 3600  # Derivados mudam apenas se as variantes forem alteradas
+
+
+class UploadInvalido(ValueError):
+    """Upload recusado (tamanho, tipo ou conteúdo); a mensagem é exibida ao usuário"""
+
+
+def extensao_normalizada(filename):
+    """Extensão em minúsculas (com o ponto) usada no nome do arquivo"""
+    return os.path.splitext(filename)[1].lower()
+
+
+# ============================================================================
+# GRAVAÇÃO
+# ============================================================================
+
+def verificar_imagem(caminho, filename):
+    """
+    Decodifica a imagem para recusar arquivos corrompidos ou incompletos
+
+    verify() confere a estrutura (blocos e CRC do PNG), mas não lê os dados de
+    um JPEG; load() decodifica todos os dados, em escala reduzida (draft) no JPEG.
+
+    Raises:
+        UploadInvalido: Imagem inválida ou truncada
+    """
+    try:
+        with Image.open(caminho) as imagem:
+            imagem.verify()
+        with Image.open(caminho) as imagem:
+            imagem.draft('RGB', (LADO_VERIFICACAO, LADO_VERIFICACAO))
+            imagem.load()
+    except Exception as e:
+        logger.warning(f"Imagem recusada ({filename}): {e}")
+        raise UploadInvalido(f'Imagem inválida ou incompleta: {filename}')
+
+
+def _mover_para_armazenamento(origem, nome):
+    """Entrega um arquivo completo ao backend com o nome definitivo (ou o descarta, se repetido)"""
+    armazenamento().guardar(origem, nome)
+
+
+class GravadorBlob(io.RawIOBase):
+    """
+    Arquivo temporário em UPLOAD_FOLDER que valida o upload enquanto recebe os bytes
+
+    A cada write() atualiza o SHA-256 e o tamanho e confere o início do arquivo
+    com FileUploadValidator.MAGIC_NUMBERS; imagens são decodificadas em
+    finalizar(), antes de entrarem no armazenamento. Um upload recusado tem o temporário
+    removido e o restante dos bytes é descartado sem gravação. finalizar()
+    renomeia o temporário para ab/cd/<sha256>.<extensão>; close() remove temporários
+    que nunca foram finalizados.
+
+    Também é o stream dos FileStorage criados por RequestUploads: depois de
+    finalizado continua legível (read/seek) como um arquivo comum.
+    """
+
+    def __init__(self, filename, max_bytes):
+        super().__init__()
+        self.filename = filename
+        self.extensao = extensao_normalizada(filename)
+        self.max_bytes = max_bytes
+        self.assinatura = FileUploadValidator.MAGIC_NUMBERS.get(self.extensao.lstrip('.'))
+        self.tamanho = 0
+        self.erro = None
+        self.nome = None
+        self._cabecalho = b''
+        self._digest = hashlib.sha256()
+
+        descritor, self._temporario = tempfile.mkstemp(
+            dir=current_app.config['UPLOAD_FOLDER'], prefix='.upload-', suffix='.tmp'
+        )
+        self._arquivo = os.fdopen(descritor, 'w+b')
+
+    def readable(self):
+        return True
+
+    def writable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def write(self, dados):
+        if self.erro is None:
+            try:
+                self._receber(dados)
+            except UploadInvalido as e:
+                self._recusar(e)
+        return len(dados)
+
+    def _receber(self, dados):
+        self.tamanho += len(dados)
+        if self.tamanho > self.max_bytes:
+            raise UploadInvalido(
+                f'Arquivo muito grande: {self.filename}. Máximo: {self.max_bytes // (1024 * 1024)}MB'
+            )
+
+        if self.assinatura and len(self._cabecalho) < len(self.assinatura):
+            self._cabecalho += bytes(dados[:len(self.assinatura) - len(self._cabecalho)])
+            if not self.assinatura.startswith(self._cabecalho):
+                raise UploadInvalido(f'Conteúdo não corresponde ao tipo do arquivo: {self.filename}')
+
+        self._digest.update(dados)
+        self._arquivo.write(dados)
+
+    def _recusar(self, erro):
+        self.erro = erro
+        self._arquivo.close()
+        self._remover_temporario()
+
+    def _remover_temporario(self):
+        if self._temporario and os.path.exists(self._temporario):
+            os.remove(self._temporario)
+        self._temporario = None
+
+    def readinto(self, buffer):
+        if self.erro is not None:
+            return 0
+        return self._arquivo.readinto(buffer)
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if self.erro is not None:
+            return 0
+        return self._arquivo.seek(offset, whence)
+
+    def tell(self):
+        if self.erro is not None:
+            return 0
+        return self._arquivo.tell()
+
+    def finalizar(self, max_bytes=None):
+        """
+        Move o arquivo recebido para o nome definitivo
+
+        Args:
+            max_bytes: Limite adicional do chamador (menor que o da gravação)
+
+        Returns:
+            str: Nome do arquivo no armazenamento (ab/cd/<sha256>.<extensão>)
+
+        Raises:
+            UploadInvalido: Upload recusado durante a gravação, acima de max_bytes
+                ou imagem inválida
+        """
+        if self.nome is not None:
+            return self.nome
+        if self.erro is None and max_bytes is not None and self.tamanho > max_bytes:
+            self._recusar(UploadInvalido(
+                f'Arquivo muito grande: {self.filename}. Máximo: {max_bytes // (1024 * 1024)}MB'
+            ))
+        if self.erro is None and self.assinatura and self._cabecalho != self.assinatura:
+            self._recusar(UploadInvalido(f'Conteúdo não corresponde ao tipo do arquivo: {self.filename}'))
+        if self.erro is None and self.extensao in EXTENSOES_IMAGEM:
+            self._arquivo.flush()
+            try:
+                verificar_imagem(self._temporario, self.filename)
+            except UploadInvalido as e:
+                self._recusar(e)
+        if self.erro is not None:
+            raise self.erro
+
+        self._arquivo.flush()
+        nome = nome_particionado(f"{self._digest.hexdigest()}{self.extensao}")
+        _mover_para_armazenamento(self._temporario, nome)
+        self._temporario = None
+        self.nome = nome
+        return nome
+
+    def close(self):
+        if not self.closed:
+            self._arquivo.close()
+            self._remover_temporario()
+        super().close()
+
+
+def gravar_stream(stream, filename, max_bytes):
+    """
+    Grava o stream no armazenamento, calculando o SHA-256 durante a escrita
+
+    Args:
+        stream: Objeto com read() (FileStorage.stream, arquivo, ...)
+        filename: Nome original (define a extensão e aparece nas mensagens)
+        max_bytes: Tamanho máximo aceito
+
+    Returns:
+        str: Nome do arquivo no armazenamento (ab/cd/<sha256>.<extensão>)
+
+    Raises:
+        UploadInvalido: Arquivo acima do limite, com conteúdo de outro tipo ou imagem inválida
+    """
+    with GravadorBlob(filename, max_bytes) as gravador:
+        while gravador.erro is None:
+            bloco = stream.read(TAMANHO_BLOCO)
+            if not bloco:
+                break
+            gravador.write(bloco)
+        return gravador.finalizar()
+
+
+def armazenar_arquivo(caminho, filename, sha256=None):
+    """
+    Move para o armazenamento um arquivo já montado em UPLOAD_FOLDER (upload em partes)
+
+    O arquivo é lido uma vez para o hash e o magic number; não há cópia.
+
+    Args:
+        caminho: Arquivo completo, no mesmo sistema de arquivos de UPLOAD_FOLDER
+        filename: Nome original (define a extensão)
+        sha256: Checksum esperado (hex); divergência recusa o arquivo
+
+    Returns:
+        str: Nome do arquivo no armazenamento (ab/cd/<sha256>.<extensão>)
+
+    Raises:
+        UploadInvalido: Conteúdo de outro tipo, imagem inválida ou checksum divergente
+            (o arquivo é mantido)
+    """
+    extensao = extensao_normalizada(filename)
+    assinatura = FileUploadValidator.MAGIC_NUMBERS.get(extensao.lstrip('.'))
+    digest = hashlib.sha256()
+    with open(caminho, 'rb') as origem:
+        cabecalho = origem.read(TAMANHO_BLOCO)
+        if assinatura and not cabecalho.startswith(assinatura):
+            raise UploadInvalido(f'Conteúdo não corresponde ao tipo do arquivo: {filename}')
+        while cabecalho:
+            digest.update(cabecalho)
+            cabecalho = origem.read(TAMANHO_BLOCO)
+
+    if sha256 and digest.hexdigest() != sha256.lower():
+        raise UploadInvalido(f'Checksum divergente: {filename}')
+    if extensao in EXTENSOES_IMAGEM:
+        verificar_imagem(caminho, filename)
+
+    nome = nome_particionado(f"{digest.hexdigest()}{extensao}")
+    _mover_para_armazenamento(caminho, nome)
+    return nome
+
+
+class RequestUploads(Request):
+    """
+    Request que grava os arquivos de formulários multipart direto no armazenamento
+
+    Cada parte com extensão permitida é escrita pelo parser do Werkzeug em um
+    GravadorBlob (hash, tamanho e magic number calculados durante o recebimento),
+    em vez de ir para um arquivo temporário e depois ser copiada por save_file.
+    Partes recusadas são descartadas à medida que chegam.
+    """
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        if filename and allowed_file(filename):
+            return GravadorBlob(filename, current_app.config['UPLOAD_MAX_MB'] * 1024 * 1024)
+        return super()._get_file_stream(total_content_length, content_type, filename, content_length)
+
+
+# ============================================================================
+# CONTAGEM DE REFERÊNCIAS
+# ============================================================================
+
+def _valor_carregado(estado, atributo):
+    valor = estado.attrs[atributo].loaded_value
+    return valor if isinstance(valor, str) and valor else None
+
+
+def _coletar_deltas(session):
+    """
+    Variação da contagem de referências de cada arquivo no flush
+
+    Returns:
+        dict: nome -> delta (somente deltas diferentes de zero)
+    """
+    deltas = {}
+
+    def somar(nome, valor):
+        if nome:
+            deltas[nome] = deltas.get(nome, 0) + valor
+
+    for obj in session.new:
+        for modelo, atributo in COLUNAS_ARQUIVO:
+            if isinstance(obj, modelo):
+                somar(getattr(obj, atributo), 1)
+
+    for obj in session.deleted:
+        for modelo, atributo in COLUNAS_ARQUIVO:
+            if isinstance(obj, modelo):
+                somar(_valor_carregado(inspect(obj), atributo), -1)
+
+    for obj in session.dirty:
+        for modelo, atributo in COLUNAS_ARQUIVO:
+            if not isinstance(obj, modelo):
+                continue
+            historico = inspect(obj).attrs[atributo].history
+            if historico.has_changes():
+                for nome in historico.added:
+                    somar(nome, 1)
+                for nome in historico.deleted:
+                    somar(nome, -1)
+
+    return {nome: delta for nome, delta in deltas.items() if delta}
+
+
+def _incrementar(conn, nome, delta):
+    """Soma delta à contagem do arquivo, criando a linha se necessário"""
+    tabela = ArquivoUpload.__table__
+    dialeto = conn.dialect.name
+    if delta > 0 and dialeto in ('postgresql', 'sqlite'):
+        if dialeto == 'postgresql':
+            from sqlalchemy.dialects.postgresql import insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert
+        conn.execute(
+            insert(tabela)
+            .values(nome=nome, referencias=delta, created_at=datetime.utcnow())
+            .on_conflict_do_update(index_elements=[tabela.c.nome],
+                                   set_={'referencias': tabela.c.referencias + delta})
+        )
+        return
+
+    resultado = conn.execute(
+        update(tabela).where(tabela.c.nome == nome).values(referencias=tabela.c.referencias + delta)
+    )
+    if resultado.rowcount == 0 and delta > 0:
+        conn.execute(tabela.insert().values(nome=nome, referencias=delta, created_at=datetime.utcnow()))
+
+
+def _ao_alterar_arquivo(target, value, oldvalue, initiator):
+    """Sem efeito: existe para ativar active_history nas colunas de arquivo"""
+
+
+def registrar_eventos_arquivos():
+    """
+    Registra o evento de sessão que mantém arquivos_upload.referencias
+
+    Os incrementos rodam na conexão da transação do flush: um rollback desfaz
+    a contagem junto com as linhas que a originaram.
+    """
+    if getattr(registrar_eventos_arquivos, '_registrado', False):
+        return
+    registrar_eventos_arquivos._registrado = True
+
+    # active_history carrega o valor anterior de uma coluna expirada (após um
+    # commit) antes da atribuição; sem ele o arquivo antigo não seria decrementado
+    for modelo, atributo in COLUNAS_ARQUIVO:
+        event.listen(getattr(modelo, atributo), 'set', _ao_alterar_arquivo, active_history=True)
+
+    @event.listens_for(Session, 'after_flush')
+    def contar_referencias(session, flush_context):
+        deltas = _coletar_deltas(session)
+        if not deltas:
+            return
+
+        conn = session.connection()
+        for nome in sorted(deltas):
+            _incrementar(conn, nome, deltas[nome])
+
+
+def _referencias_nas_colunas():
+    """Consulta (nome, total) das referências existentes nas colunas de arquivo"""
+    colunas = union_all(*[
+        select(getattr(modelo, atributo).label('nome')).where(getattr(modelo, atributo).isnot(None))
+        for modelo, atributo in COLUNAS_ARQUIVO
+    ]).subquery()
+    return select(colunas.c.nome, func.count()).group_by(colunas.c.nome)
+
+
+def recontar_referencias(session):
+    """
+    Recalcula (backfill/reparo) a contagem de referências de todos os arquivos
+
+    Args:
+        session: Sessão SQLAlchemy; o commit fica a cargo de quem chama
+
+    Returns:
+        int: Quantidade de arquivos referenciados
+    """
+    contagem = dict(session.execute(_referencias_nas_colunas()).all())
+    existentes = dict(session.execute(select(ArquivoUpload.nome, ArquivoUpload.referencias)).all())
+
+    for nome, atual in existentes.items():
+        total = contagem.get(nome, 0)
+        if atual != total:
+            session.execute(update(ArquivoUpload).where(ArquivoUpload.nome == nome).values(referencias=total))
+
+    novos = [{'nome': nome, 'referencias': total, 'created_at': datetime.utcnow()}
+             for nome, total in contagem.items() if nome not in existentes]
+    if novos:
+        session.execute(ArquivoUpload.__table__.insert(), novos)
+    return len(contagem)
+
+
+# ============================================================================
+# REMOÇÃO
+# ============================================================================
+
+def arquivo_referenciado(nome):
+    """True se alguma coluna de arquivo ainda aponta para o nome (em qualquer layout)"""
+    nomes = [candidato for candidato in (nome, nome_alternativo(nome)) if candidato]
+    for modelo, atributo in COLUNAS_ARQUIVO:
+        coluna = getattr(modelo, atributo)
+        if db.session.execute(select(coluna).where(coluna.in_(nomes)).limit(1)).first():
+            return True
+    return False
+
+
+def remover_blob(nome):
+    """
+    Remove o arquivo se nenhuma linha o referencia mais
+
+    Deve ser chamada após o commit que retirou a referência. Arquivos gravados
+    há menos de UPLOAD_CARENCIA_SEGUNDOS são mantidos: podem ter acabado de ser
+    reaproveitados por um upload ainda não salvo no banco (a limpeza de órfãos
+    os remove depois).
+
+    Returns:
+        bool: True se o arquivo foi removido do armazenamento
+    """
+    alternativo = nome_alternativo(nome)
+    if alternativo is None:
+        return False
+
+    linha = db.session.get(ArquivoUpload, nome)
+    if linha is not None:
+        resultado = db.session.execute(
+            delete(ArquivoUpload).where(ArquivoUpload.nome == nome, ArquivoUpload.referencias <= 0)
+        )
+        db.session.commit()
+        if resultado.rowcount == 0:
+            return False
+    elif arquivo_referenciado(nome):
+        # Arquivo anterior à contagem (sem linha) ainda em uso
+        return False
+
+    # Linhas ainda não migradas para o layout particionado apontam para o mesmo arquivo
+    if db.session.execute(
+        select(ArquivoUpload.nome).where(ArquivoUpload.nome == alternativo, ArquivoUpload.referencias > 0)
+    ).first():
+        return False
+
+    backend = armazenamento()
+    info = backend.info(nome)
+    if info is None or time.time() - info['mtime'] < current_app.config['UPLOAD_CARENCIA_SEGUNDOS']:
+        return False
+    if not backend.remover(nome):
+        return False
+
+    remover_derivados(nome)
+    return True
+
+
+# ============================================================================
+# ENTREGA
+# ============================================================================
+
+def nome_por_conteudo(nome):
+    """True se o nome é [ab/cd/]<sha256>.<extensão> (conteúdo imutável)"""
+    base = os.path.basename(nome)
+    raiz = os.path.splitext(base)[0]
+    if len(raiz) != 64 or not HEXADECIMAIS.issuperset(raiz):
+        return False
+    return nome == base or nome == nome_particionado(base)
+
+
+def _imutavel(filename):
+    # Derivados (derivados/<variante>/ab/cd/<hash>.jpg) mudam se as variantes mudarem
+    return nome_por_conteudo(filename)
+
+
+def _etag_arquivo(filename, tamanho, mtime):
+    """ETag forte: o hash para nomes por conteúdo, mtime e tamanho para os demais"""
+    if _imutavel(filename):
+        return os.path.splitext(os.path.basename(filename))[0]
+    return f"{int(mtime):x}-{tamanho:x}"
+
+
+def _cabecalhos_cache(response, filename):
+    response.cache_control.private = True  # Exige login: não pode ficar em caches compartilhados
+    response.cache_control.no_cache = None
+    if _imutavel(filename):
+        response.cache_control.max_age = MAX_AGE_IMUTAVEL
+        response.cache_control.immutable = True
+    elif filename.startswith(f"{PASTA_DERIVADOS}/"):
+        response.cache_control.max_age = MAX_AGE_DERIVADOS
+    else:
+        response.cache_control.no_cache = True
+    return response
+
+
+def _enviar_remoto(backend, filename):
+    """
+    Resposta com um objeto do bucket: redirecionamento para URL pré-assinada
+    (S3_URL_ASSINADA) ou leitura em faixas repassada pela app
+    """
+    info = backend.info(filename)
+    if info is None:
+        abort(404)
+    etag = _etag_arquivo(filename, info['tamanho'], info['mtime'])
+    mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+
+    if etag in request.if_none_match:
+        response = current_app.response_class(status=304)
+        response.set_etag(etag)
+        return _cabecalhos_cache(response, filename)
+
+    if current_app.config['S3_URL_ASSINADA']:
+        expira = current_app.config['S3_URL_ASSINADA_SEGUNDOS']
+        response = redirect(backend.url_assinada(info['nome'], expira, mimetype))
+        # O redirecionamento só pode ser reaproveitado enquanto a URL vale
+        response.cache_control.private = True
+        response.cache_control.max_age = expira // 2
+        return response
+
+    inicio, fim, status = 0, info['tamanho'], 200
+    faixa = request.range.range_for_length(info['tamanho']) if request.range else None
+    if faixa is not None and request.if_range.etag in (None, etag):
+        (inicio, fim), status = faixa, 206
+    response = current_app.response_class(backend.ler(info['nome'], inicio, fim), status=status,
+                                          mimetype=mimetype, direct_passthrough=True)
+    response.content_length = fim - inicio
+    response.accept_ranges = 'bytes'
+    if status == 206:
+        response.content_range = ContentRange('bytes', inicio, fim, info['tamanho'])
+    response.set_etag(etag)
+    return _cabecalhos_cache(response, filename)
+
+
+def enviar_upload(filename):
+    """
+    Resposta com um arquivo enviado (rota /uploads, já autenticada)
+
+    Com UPLOAD_X_ACCEL_REDIRECT a resposta não tem corpo: o header
+    X-Accel-Redirect aponta para a location internal do Nginx
+    (UPLOAD_X_ACCEL_PREFIX), que envia o arquivo com sendfile e atende Range.
+    Sem Nginx, o Werkzeug envia o arquivo e também atende Range e
+    If-None-Match. Em ambos os casos a ETag e o Cache-Control são definidos
+    aqui, e um If-None-Match válido é respondido com 304 pela própria app.
+    Com o armazenamento S3 os arquivos (exceto os derivados, que são locais)
+    vêm do bucket. Um nome que não existe é procurado no outro layout (URLs
+    anteriores à migração para o layout particionado, ou arquivos ainda não
+    migrados).
+    """
+    # Temporários e partes de uploads em andamento (.upload-*, .sessoes/) não são públicos
+    if any(parte.startswith('.') for parte in filename.split('/')):
+        abort(404)
+    if not filename.startswith(f"{PASTA_DERIVADOS}/"):
+        backend = armazenamento()
+        if not backend.local:
+            return _enviar_remoto(backend, filename)
+        filename = backend.localizar(filename) or filename
+
+    caminho = safe_join(current_app.config['UPLOAD_FOLDER'], filename)
+    try:
+        estado = os.stat(caminho) if caminho else None
+    except OSError:
+        estado = None
+    if estado is None or not os.path.isfile(caminho):
+        abort(404)
+    etag = _etag_arquivo(filename, estado.st_size, estado.st_mtime)
+
+    if not current_app.config['UPLOAD_X_ACCEL_REDIRECT']:
+        response = send_from_directory(current_app.config['UPLOAD_FOLDER'], filename,
+                                       etag=etag, conditional=True)
+        return _cabecalhos_cache(response, filename)
+
+    response = current_app.response_class(status=200)
+    response.set_etag(etag)
+    if etag in request.if_none_match:
+        response.status_code = 304
+    else:
+        response.headers['X-Accel-Redirect'] = current_app.config['UPLOAD_X_ACCEL_PREFIX'].rstrip('/') + '/' + quote(filename)
+        response.headers['Content-Type'] = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    return _cabecalhos_cache(response, filename)
@@ -1,8 +1,41 @@
 import os
-from werkzeug.utils import secure_filename
+import threading
+from concurrent.futures import ThreadPoolExecutor, Future
 from flask import current_app, flash
 from config import allowed_file, Config
-from PIL import Image
+from models import db
+from upload_store import gravar_stream, remover_blob, GravadorBlob, UploadInvalido
+from image_derivatives import gerar_derivados, EXTENSOES_IMAGEM
+from upload_sessions import arquivo_da_sessao
+from storage_backends import armazenamento
+
+def _gravar_upload(file_storage, max_size_mb):
+    """
+    Valida e grava um upload no armazenamento, gerando os derivados das imagens
+    
+    Raises:
+        UploadInvalido: Extensão não permitida, arquivo grande demais ou imagem inválida
+    """
+    filename = file_storage.filename
+    
+    # Validar extensão
+    if not allowed_file(filename):
+        raise UploadInvalido(f'Tipo de arquivo não permitido: {filename}. Use apenas: {", ".join(Config.ALLOWED_EXTENSIONS)}')
+    
+    # Gravar no armazenamento por conteúdo: o nome passa a ser o hash, o
+    # original só define a extensão (tamanho e tipo validados na gravação)
+    max_bytes = max_size_mb * 1024 * 1024
+    if isinstance(file_storage.stream, GravadorBlob):
+        # Recebido pelo parser multipart direto no armazenamento (RequestUploads)
+        nome = file_storage.stream.finalizar(max_bytes)
+    else:
+        file_storage.stream.seek(0)
+        nome = gravar_stream(file_storage.stream, filename, max_bytes)
+    
+    # Versão de impressão das imagens para o PDF (falhas ficam para o backfill)
+    if nome.endswith(EXTENSOES_IMAGEM):
+        gerar_derivados(nome)
+    return nome
 
 def save_file(file_storage, max_size_mb=16):
     """
@@ -18,58 +51,144 @@ def save_file(file_storage, max_size_mb=16):
     if not file_storage or file_storage.filename == '':
         return None
     
-    filename = file_storage.filename
-    
-    # Validar extensão
-    if not allowed_file(filename):
-        flash(f'Tipo de arquivo não permitido: {filename}. Use apenas: {", ".join(Config.ALLOWED_EXTENSIONS)}', 'error')
+    try:
+        return _gravar_upload(file_storage, max_size_mb)
+    except UploadInvalido as e:
+        flash(str(e), 'error')
         return None
+    except Exception as e:
+        flash(f'Erro ao salvar arquivo: {str(e)}', 'error')
+        return None
+
+# Pool de threads dos uploads (um por processo; gravação, hash e PIL liberam o GIL)
+_pool_uploads = None
+_pool_uploads_pid = None
+_pool_uploads_lock = threading.Lock()
+
+def _obter_pool_uploads():
+    global _pool_uploads, _pool_uploads_pid
+    with _pool_uploads_lock:
+        if _pool_uploads is None or _pool_uploads_pid != os.getpid():
+            _pool_uploads = ThreadPoolExecutor(max_workers=current_app.config['UPLOAD_THREADS'],
+                                               thread_name_prefix='upload')
+            _pool_uploads_pid = os.getpid()
+        return _pool_uploads
+
+def _gravar_no_pool(app, file_storage, max_size_mb):
+    with app.app_context():
+        return _gravar_upload(file_storage, max_size_mb)
+
+class LoteUploads:
+    """
+    Uploads de um formulário processados em paralelo
+    
+    Cada arquivo é validado, gravado e tem seus derivados gerados em uma thread
+    do pool. concluir() aguarda todos (antes do commit) e preenche o atributo de
+    cada objeto na ordem em que os arquivos foram adicionados; falhas viram
+    mensagens flash, como em save_file.
+    
+    Uso:
+        lote = LoteUploads()
+        lote.adicionar(request.files.get('ppt'), relatorio, 'ppt_path')
+        lote.adicionar_sessao(request.form.get('ppt_upload_id'), relatorio, 'ppt_path')
+        lote.adicionar(file, Foto(prova_id=prova.id, contexto='desenho'), 'file_path')
+        lote.concluir()
+        db.session.commit()
+    """
     
-    # Sanitizar nome do arquivo
-    filename = secure_filename(filename)
-    
-    # Verificar tamanho (adicional ao MAX_CONTENT_LENGTH do Flask)
-    file_storage.seek(0, os.SEEK_END)
-    file_size = file_storage.tell()
-    file_storage.seek(0)
+    def __init__(self, max_size_mb=16):
+        self.max_size_mb = max_size_mb
+        self._pendentes = []
     
-    max_size_bytes = max_size_mb * 1024 * 1024
-    if file_size > max_size_bytes:
-        flash(f'Arquivo muito grande: {filename}. Máximo: {max_size_mb}MB', 'error')
-        return None
+    def __len__(self):
+        """Quantidade de arquivos agendados (ainda não concluídos)"""
+        return len(self._pendentes)
     
-    # Gerar nome único se arquivo já existir
-    filepath = os.path.join(current_app.config['UPLOAD_FOLDER'], filename)
-    if os.path.exists(filepath):
-        name, ext = os.path.splitext(filename)
-        counter = 1
-        while os.path.exists(filepath):
-            filename = f"{name}_{counter}{ext}"
-            filepath = os.path.join(current_app.config['UPLOAD_FOLDER'], filename)
-            counter += 1
-    
-    # Salvar arquivo
-    try:
-        file_storage.save(filepath)
+    def adicionar(self, file_storage, obj, atributo):
+        """
+        Agenda o upload; obj.atributo recebe o nome do arquivo em concluir()
+        
+        Objetos ainda fora da sessão (ex.: Foto) só são adicionados se o upload der certo.
+        """
+        if not file_storage or file_storage.filename == '':
+            return
+        futuro = _obter_pool_uploads().submit(
+            _gravar_no_pool, current_app._get_current_object(), file_storage, self.max_size_mb
+        )
+        self._pendentes.append((futuro, obj, atributo))
+    
+    def adicionar_sessao(self, upload_id, obj, atributo):
+        """
+        Usa um arquivo já enviado pela API de upload em partes (/api/uploads)
+        
+        Args:
+            upload_id: ID da sessão concluída (campo <campo>_upload_id do formulário)
+        """
+        if not upload_id:
+            return
+        futuro = Future()
+        try:
+            futuro.set_result(arquivo_da_sessao(upload_id))
+        except UploadInvalido as e:
+            futuro.set_exception(e)
+        self._pendentes.append((futuro, obj, atributo))
+    
+    def concluir(self):
+        """
+        Aguarda os uploads e aplica os resultados na sessão
         
-        # Se for imagem, validar que é realmente uma imagem
-        if filename.lower().endswith(('.png', '.jpg', '.jpeg', '.gif')):
+        Returns:
+            int: Quantidade de arquivos salvos
+        """
+        salvos = 0
+        for futuro, obj, atributo in self._pendentes:
             try:
-                img = Image.open(filepath)
-                img.verify()  # Verifica se é uma imagem válida
+                nome = futuro.result()
+            except UploadInvalido as e:
+                flash(str(e), 'error')
+                continue
             except Exception as e:
-                os.remove(filepath)  # Remove arquivo inválido
-                flash(f'Arquivo de imagem inválido: {filename}', 'error')
-                return None
-        
-        return filename
-    except Exception as e:
-        flash(f'Erro ao salvar arquivo: {str(e)}', 'error')
-        return None
+                flash(f'Erro ao salvar arquivo: {str(e)}', 'error')
+                continue
+            setattr(obj, atributo, nome)
+            db.session.add(obj)
+            salvos += 1
+        self._pendentes = []
+        return salvos
+
+def campos_diferentes(obj, valores):
+    """
+    Atributos cujo valor novo difere do estado atual do objeto
+    
+    None e '' são equivalentes: o formulário não distingue campo vazio de ausente.
+    """
+    return [atributo for atributo, valor in valores.items() if (getattr(obj, atributo) or None) != (valor or None)]
+
+def aplicar_alteracoes(obj, valores):
+    """
+    Atribui ao objeto apenas os valores que diferem do estado atual
+    
+    Campos não alterados não são tocados, então o flush não gera UPDATE (nem
+    muda updated_at/versao) para linhas cujo formulário foi reenviado igual.
+    
+    Args:
+        obj: Instância do modelo já carregada
+        valores: Dicionário atributo -> novo valor
+    
+    Returns:
+        list: Atributos alterados
+    """
+    alterados = campos_diferentes(obj, valores)
+    for atributo in alterados:
+        setattr(obj, atributo, valores[atributo])
+    return alterados
 
 def delete_file(filename):
     """
-    Deleta um arquivo do sistema de forma segura
+    Remove um arquivo do armazenamento se ele não for mais referenciado
+    
+    Chamar após o commit que removeu a referência (foto, PPT ou tabela de
+    medidas); arquivos compartilhados por outros registros são mantidos.
     
     Args:
         filename: Nome do arquivo a deletar
@@ -81,10 +200,7 @@ def delete_file(filename):
         return False
     
     try:
-        filepath = os.path.join(current_app.config['UPLOAD_FOLDER'], filename)
-        if os.path.exists(filepath):
-            os.remove(filepath)
-            return True
+        return remover_blob(filename)
     except Exception as e:
         print(f"Erro ao deletar arquivo {filename}: {e}")
     
@@ -93,44 +209,9 @@ def delete_file(filename):
 def get_file_size_mb(filename):
     """Retorna o tamanho do arquivo em MB"""
     try:
-        filepath = os.path.join(current_app.config['UPLOAD_FOLDER'], filename)
-        if os.path.exists(filepath):
-            size_bytes = os.path.getsize(filepath)
-            return round(size_bytes / (1024 * 1024), 2)
+        info = armazenamento().info(filename)
+        if info:
+            return round(info['tamanho'] / (1024 * 1024), 2)
     except:
         pass
     return 0
-
-def create_thumbnail(filename, size=(150, 150)):
-    """
-    Cria uma thumbnail de uma imagem
-    
-    Args:
-        filename: Nome do arquivo de imagem
-        size: Tupla (largura, altura) da thumbnail
-    
-    Returns:
-        str: Nome do arquivo thumbnail ou None
-    """
-    if not filename or not filename.lower().endswith(('.png', '.jpg', '.jpeg', '.gif')):
-        return None
-    
-    try:
-        filepath = os.path.join(current_app.config['UPLOAD_FOLDER'], filename)
-        if not os.path.exists(filepath):
-            return None
-        
-        # Criar nome do thumbnail
-        name, ext = os.path.splitext(filename)
-        thumb_filename = f"{name}_thumb{ext}"
-        thumb_filepath = os.path.join(current_app.config['UPLOAD_FOLDER'], thumb_filename)
-        
-        # Criar thumbnail
-        img = Image.open(filepath)
-        img.thumbnail(size, Image.Resampling.LANCZOS)
-        img.save(thumb_filepath, optimize=True, quality=85)
-        
-        return thumb_filename
-    except Exception as e:
-        print(f"Erro ao criar thumbnail para {filename}: {e}")
-        return None